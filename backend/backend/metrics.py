@@ -0,0 +1,298 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from backend.timing import RequestTiming
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+INITIAL_SIZE = 1 << 16
+USED = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+registry = {}
+stores = {}
+stores_lock = threading.Lock()
+
+
+class MmapStore:
+    # Every process writes its own file, so writers never wait for each
+    # other and a scrape sums the files of all workers. The used size in
+    # the header is written after the entry, readers never see half of it.
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < INITIAL_SIZE:
+            self.file.truncate(INITIAL_SIZE)
+        self.capacity = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        self.used = USED.unpack_from(self.map, 0)[0] or USED.size
+        self.positions = {
+            key: offset for key, _, offset in entries(self.map, self.used)
+        }
+
+    def inc(self, key, amount=1):
+        with self.lock:
+            offset = self.positions.get(key)
+            if offset is None:
+                offset = self.append(key)
+            VALUE.pack_into(
+                self.map, offset, VALUE.unpack_from(self.map, offset)[0]
+                + amount
+            )
+
+    def append(self, key):
+        encoded = key.encode()
+        padded = padded_length(len(encoded))
+        needed = self.used + padded + VALUE.size
+        if needed > self.capacity:
+            self.grow(needed)
+        LENGTH.pack_into(self.map, self.used, len(encoded))
+        start = self.used + LENGTH.size
+        self.map[start:start + len(encoded)] = encoded
+        offset = self.used + padded
+        VALUE.pack_into(self.map, offset, 0.0)
+        self.used = needed
+        USED.pack_into(self.map, 0, self.used)
+        self.positions[key] = offset
+        return offset
+
+    def grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.map.close()
+        self.file.truncate(capacity)
+        self.map = mmap.mmap(self.file.fileno(), capacity)
+        self.capacity = capacity
+
+
+def padded_length(length):
+    # Values stay aligned to 8 bytes, so a reader gets either the old or
+    # the new double.
+    size = LENGTH.size + length
+    return size + -size % 8
+
+
+def entries(data, used):
+    offset = USED.size
+    while offset < used:
+        length = LENGTH.unpack_from(data, offset)[0]
+        start = offset + LENGTH.size
+        key = bytes(data[start:start + length]).decode()
+        value_offset = offset + padded_length(length)
+        yield key, VALUE.unpack_from(data, value_offset)[0], value_offset
+        offset = value_offset + VALUE.size
+
+
+def get_store():
+    # The process id is part of the key: gunicorn forks workers after the
+    # application may already have been imported.
+    key = (settings.METRICS_DIR, os.getpid())
+    store = stores.get(key)
+    if store is None:
+        with stores_lock:
+            store = stores.get(key)
+            if store is None:
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                store = stores[key] = MmapStore(os.path.join(
+                    settings.METRICS_DIR, f'metrics_{key[1]}.db'
+                ))
+    return store
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.keys = {}
+        registry[name] = self
+
+    def key(self, suffix, labels):
+        values = tuple(str(labels[label]) for label in self.labels)
+        key = self.keys.get((suffix, values))
+        if key is None:
+            key = self.keys[suffix, values] = json.dumps(
+                [self.name, suffix, list(zip(self.labels, values))],
+                ensure_ascii=False
+            )
+        return key
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        get_store().inc(self.key('', labels), amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # Buckets are stored as plain counts and made cumulative on scrape,
+        # one observation writes three values.
+        index = bisect_left(self.buckets, value)
+        store = get_store()
+        store.inc(self.key(f'bucket:{index}', labels))
+        store.inc(self.key('sum', labels), value)
+        store.inc(self.key('count', labels))
+
+
+def collect():
+    totals = {}
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < USED.size:
+            continue
+        for key, value, _ in entries(data, USED.unpack_from(data, 0)[0]):
+            totals[key] = totals.get(key, 0) + value
+    samples = {}
+    for key, value in totals.items():
+        name, suffix, labels = json.loads(key)
+        samples.setdefault(name, {}).setdefault(
+            tuple(map(tuple, labels)), {}
+        )[suffix] = value
+    return samples
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, value.replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def exposition():
+    samples = collect()
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, values in sorted(samples.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(
+                    f'{name}{format_labels(labels)} '
+                    f'{format_value(values.get("", 0))}'
+                )
+                continue
+            cumulative = 0
+            bounds = (*metric.buckets, float('inf'))
+            for index, bound in enumerate(bounds):
+                cumulative += values.get(f'bucket:{index}', 0)
+                lines.append(
+                    f'{name}_bucket'
+                    f'{format_labels((*labels, ("le", format_value(bound))))}'
+                    f' {format_value(cumulative)}'
+                )
+            lines.append(
+                f'{name}_sum{format_labels(labels)} '
+                f'{format_value(values.get("sum", 0))}'
+            )
+            lines.append(
+                f'{name}_count{format_labels(labels)} '
+                f'{format_value(values.get("count", 0))}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # Without a configured token the metrics are not served at all.
+    token = settings.METRICS_TOKEN
+    if not token or request.headers.get('Authorization') != (
+        f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
+
+
+requests_total = Counter(
+    'foodgram_http_requests_total', 'Ответы по маршрутам и статусам.',
+    ('route', 'method', 'status')
+)
+request_duration = Histogram(
+    'foodgram_http_request_duration_seconds', 'Время ответа.',
+    ('route', 'method'), settings.METRICS_LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    'foodgram_db_queries_per_request', 'Число запросов к БД за ответ.',
+    ('route',), settings.SERVER_TIMING_QUERY_BUCKETS
+)
+request_db_duration = Histogram(
+    'foodgram_db_duration_seconds', 'Время в БД за ответ.',
+    ('route',), settings.METRICS_LATENCY_BUCKETS
+)
+cache_requests = Counter(
+    'foodgram_cache_requests_total', 'Обращения к кэшам.',
+    ('cache', 'result')
+)
+cache_invalidations = Counter(
+    'foodgram_cache_invalidations_total', 'Сбросы записей кэшей.',
+    ('cache', 'scope')
+)
+shopping_list_downloads = Counter(
+    'foodgram_shopping_list_downloads_total', 'Скачивания списка покупок.',
+    ('format', 'result')
+)
+image_uploads = Counter(
+    'foodgram_image_uploads_total', 'Загруженные изображения рецептов.'
+)
+image_upload_bytes = Counter(
+    'foodgram_image_upload_bytes_total',
+    'Объём загруженных изображений рецептов.'
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing))
+            response = self.get_response(request)
+        timing.finish()
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        # Label values come from a fixed set, a client can't grow the
+        # number of series.
+        method = request.method if request.method in METHODS else 'other'
+        requests_total.inc(
+            route=route, method=method, status=response.status_code
+        )
+        request_duration.observe(timing.total, route=route, method=method)
+        request_queries.observe(timing.queries, route=route)
+        request_db_duration.observe(timing.db, route=route)
+        return response
@@ -1,6 +1,150 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination:
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, default=str)
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, payload['v'])
+            ]
+            reverse = bool(payload['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def position_filter(self, values, reverse):
+        # Rows strictly after the cursor in (a, b, ...) order:
+        # a > x OR (a = x AND b > y) OR ...
+        conditions = []
+        for index, name in enumerate(self.names):
+            descending = self.ordering[index].startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {
+                previous: values[position]
+                for position, previous in enumerate(self.names[:index])
+            }
+            conditions.append(
+                Q(**equal, **{f'{name}__{lookup}': values[index]})
+            )
+        return reduce(or_, conditions)
+
+    def prepare(self, model, request):
+        self.names = [name.lstrip('-') for name in self.ordering]
+        self.fields = [model._meta.get_field(name) for name in self.names]
+        self.base_url = request.build_absolute_uri()
+
+    def paginate_forward(self, model, request, fetch):
+        # For sources that are not a single queryset: ``fetch`` receives
+        # the cursor position and the number of items to return.
+        self.prepare(model, request)
+        values, reverse = self.decode_cursor(request)
+        if reverse:
+            raise NotFound(self.invalid_cursor_message)
+        page = list(fetch(values, self.page_size + 1))
+        self.has_next = len(page) > self.page_size
+        self.has_previous = False
+        self.page = page[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.prepare(queryset.model, request)
+        values, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.position_filter(values, reverse))
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = has_more if reverse else values is not None
+        self.page = page
+        return page
+
+    def position(self, instance):
+        return [getattr(instance, field.attname) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = KeysetPagination.cursor_query_param
+    cursor_ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Passing ?cursor= (empty for the first page) switches to keyset
+        # pagination, which needs neither OFFSET nor COUNT(*).
+        self.keyset = None
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(
+            getattr(view, 'cursor_ordering', self.cursor_ordering),
+            self.get_page_size(request)
+        )
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
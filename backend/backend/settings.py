@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -15,9 +16,66 @@ RECIPE_MIN_COOKING_TIME = 1
 RECIPE_MAX_COOKING_TIME = 360
 INGREDIENT_MIN_VALUE = 1
 INGREDIENT_MAX_VALUE = 999
+RECIPE_SET_MAX_SIZE = 100
 SHOPPING_CART_FILENAME = 'shopping_list.txt'
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_RENDERERS = (
+    'foodgram.shopping_list.TextRenderer',
+    'foodgram.shopping_list.CSVRenderer',
+    'foodgram.shopping_list.JSONRenderer',
+)
 ADMIN_EXTRA_FIELDS = 0
 ADMIN_MIN_NUM_FIELDS = 1
+INGREDIENT_AUTOCOMPLETE_BACKEND = os.getenv(
+    'INGREDIENT_AUTOCOMPLETE_BACKEND', 'memory'
+)
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+REFERENCE_CACHE_TTL = 3600
+RECIPE_FEED_STRATEGY = os.getenv('RECIPE_FEED_STRATEGY', 'read')
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000)
+)
+FEED_BACKFILL_SIZE = 50
+RECIPE_IMAGE_SIZES = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+RECIPE_IMAGE_QUALITY = 82
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_PROCESSING = os.getenv('RECIPE_IMAGE_PROCESSING', 'queue')
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 3600
+JOB_POLL_INTERVAL = 1.0
+JOB_TIMEOUT = 600
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'off')
+SERVER_TIMING_BUCKETS = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000
+)
+SERVER_TIMING_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+COOK_LIMIT = 20
+COOK_MAX_LIMIT = 100
+COOK_MAX_INGREDIENTS = 30
+COOK_DENSE_SHARE = 32
+COOK_CHANGE_LOG_TTL = 86400
+COOK_MAX_REPLAY = 1000
+COOK_INDEX_MAX_AGE = 3600
+RESPONSE_CACHE_TTL = 300
+RECOMMENDATION_NEIGHBOURS = 20
+RECOMMENDATION_MIN_COMMON_USERS = 2
+RECOMMENDATION_MAX_USER_FAVORITES = 500
+RECOMMENDATION_MAX_PAIRS = 5000000
+RECOMMENDATION_SOURCE_FAVORITES = 50
+RECOMMENDATION_LIMIT = 20
+RECOMMENDATION_MAX_LIMIT = 100
 
 
 INSTALLED_APPS = [
@@ -33,10 +91,13 @@ INSTALLED_APPS = [
     'django_filters',
     'foodgram.apps.FoodgramConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.metrics.MetricsMiddleware',
+    'backend.timing.ServerTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,16 +127,27 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': int(os.getenv('DB_PORT', 5432))
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # A file instead of the shared in-memory database lets tests
+            # write from several threads.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': int(os.getenv('DB_PORT', 5432))
+        }
     }
-}
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -112,6 +184,26 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 
+# The cache holds the versions and change logs every process checks
+# (reference data, response cache, cook index), so it has to be shared by
+# all gunicorn workers and the job worker, not kept in process memory.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
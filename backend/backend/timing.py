@@ -0,0 +1,163 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+MODES = ('off', 'staff', 'all')
+METRICS = ('db', 'serialize', 'render', 'total')
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative, buckets = 0, []
+        for bound, count in zip((*self.bounds, float('inf')), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, route, values):
+        with self.lock:
+            for metric, value in values.items():
+                histogram = self.histograms.get((route, metric))
+                if histogram is None:
+                    histogram = self.histograms[route, metric] = Histogram(
+                        settings.SERVER_TIMING_QUERY_BUCKETS
+                        if metric == 'queries'
+                        else settings.SERVER_TIMING_BUCKETS
+                    )
+                histogram.observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for (route, metric), histogram in self.histograms.items():
+                result.setdefault(route, {})[metric] = histogram.snapshot()
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.handler = None
+        self.serialize = None
+        self.render_started = None
+        self.render_db = 0.0
+        self.render = None
+        self.total = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    def handler_started(self):
+        self.handler = (time.perf_counter(), self.db)
+
+    def handler_finished(self):
+        # Inside a DRF handler everything that is not a query is the
+        # serializer walking the objects and building the payload.
+        now = time.perf_counter()
+        if self.handler is not None:
+            started, db = self.handler
+            self.serialize = (now - started) - (self.db - db)
+        self.render_started, self.render_db = now, self.db
+
+    def finish(self):
+        now = time.perf_counter()
+        self.total = now - self.started
+        if self.render_started is not None:
+            self.render = (now - self.render_started) - (
+                self.db - self.render_db
+            )
+
+    def metrics(self):
+        values = {'queries': self.queries}
+        for metric in METRICS:
+            value = getattr(self, metric)
+            if value is not None:
+                values[metric] = value * 1000
+        return values
+
+    def header(self):
+        values = self.metrics()
+        entries = [
+            f'{metric};dur={values[metric]:.3f}'
+            for metric in METRICS if metric in values
+        ]
+        entries[0] += f';desc="{self.queries} queries"'
+        return ', '.join(entries)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        # Django drops the middleware from the chain, a disabled setting
+        # costs nothing per request.
+        if settings.SERVER_TIMING not in MODES[1:]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing))
+            response = self.get_response(request)
+        timing.finish()
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else 'unmatched', timing.metrics()
+        )
+        user = getattr(request, 'user', None)
+        if settings.SERVER_TIMING == 'all' or user and user.is_staff:
+            response['Server-Timing'] = timing.header()
+        return response
+
+
+class ServerTimingMixin:
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        timing = getattr(request._request, 'timing', None)
+        if timing is not None:
+            timing.handler_started()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        timing = getattr(request._request, 'timing', None)
+        if timing is not None:
+            timing.handler_finished()
+        return response
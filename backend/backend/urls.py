@@ -3,11 +3,14 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from backend import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('foodgram.urls')),
     path('api/users/', include('users.urls')),
     path('api/auth/', include('djoser.urls.authtoken')),
+    path('api/metrics', metrics.metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib import admin
 from django.db.models import Count
+from foodgram import response_cache, shopping_totals
 from foodgram.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                              ShoppingCart, Tag, TagRecipe)
 
@@ -35,23 +36,30 @@ class TagsFilter(admin.SimpleListFilter):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'author', 'get_author_email', 'name',
-        'get_tags_display', 'get_favorite_count',
+        'get_tags_display', 'favorites_count', 'in_carts_count',
     )
+    list_select_related = ('author',)
     list_filter = ('tags',)
     search_fields = ('author__username', 'author__email', 'name',)
     inlines = (TagRecipeInline, IngredientRecipeInline)
 
+    def save_related(self, request, form, formsets, change):
+        tag_ids = set()
+        if change:
+            shopping_totals.recipe_ingredients_removed(form.instance)
+            tag_ids.update(form.instance.tags.values_list('id', flat=True))
+        super().save_related(request, form, formsets, change)
+        shopping_totals.recipe_ingredients_added(form.instance)
+        tag_ids.update(form.instance.tags.values_list('id', flat=True))
+        response_cache.recipe_changed(form.instance, tag_ids)
+
     def get_tags_display(self, obj):
         return ', '.join([tag.name for tag in obj.tags.all()])
 
-    def get_favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
     def get_author_email(self, obj):
         return obj.author.email
 
     get_tags_display.short_description = 'Теги'
-    get_favorite_count.short_description = 'Добавлений в избранное'
     get_author_email.short_description = 'Email'
 
 
@@ -0,0 +1,152 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+from foodgram import reference
+from foodgram.models import Ingredient, IngredientRecipe, normalize_name
+
+PREFIX_RANK = 0
+SUBSTRING_RANK = 1
+SHORT_QUERY_LENGTH = 3
+NGRAM_SIZE = 3
+
+
+class IngredientIndex:
+    def __init__(self, rows, usage, top_size):
+        rows = sorted(rows, key=lambda row: row[1])
+        self.ids = [pk for pk, _ in rows]
+        self.names = [name for _, name in rows]
+        self.top_size = top_size
+        self.haystack = '\n'.join(self.names)
+        self.starts = []
+        position = 0
+        for name in self.names:
+            self.starts.append(position)
+            position += len(name) + 1
+        # Short queries match thousands of names, so their best prefix
+        # matches are precomputed instead of being ranked per keystroke.
+        by_popularity = sorted(
+            range(len(self.names)),
+            key=lambda index: (-usage.get(self.ids[index], 0),
+                               self.names[index])
+        )
+        self.rank = [0] * len(self.names)
+        for rank, index in enumerate(by_popularity):
+            self.rank[index] = rank
+        self.top = defaultdict(list)
+        for index in by_popularity:
+            for length in range(1, SHORT_QUERY_LENGTH + 1):
+                bucket = self.top[self.names[index][:length]]
+                if len(bucket) < top_size:
+                    bucket.append(index)
+        self.ngrams = defaultdict(list)
+        for index, name in enumerate(self.names):
+            for gram in {name[start:start + NGRAM_SIZE]
+                         for start in range(len(name) - NGRAM_SIZE + 1)}:
+                self.ngrams[gram].append(index)
+        self.search = lru_cache(maxsize=4096)(self._search)
+
+    def _search(self, query, limit):
+        if len(query) <= SHORT_QUERY_LENGTH and limit <= self.top_size:
+            found = self.top.get(query, [])[:limit]
+        else:
+            low = bisect_left(self.names, query)
+            high = bisect_left(self.names, query + '\uffff', low)
+            found = heapq.nsmallest(
+                limit, range(low, high), key=self.rank.__getitem__
+            )
+        if len(found) < limit:
+            found += heapq.nsmallest(
+                limit - len(found), self.substring_matches(query),
+                key=self.rank.__getitem__
+            )
+        return tuple(self.ids[index] for index in found)
+
+    def substring_matches(self, query):
+        if len(query) < NGRAM_SIZE:
+            return self.scan(query)
+        postings = sorted(
+            (self.ngrams.get(query[start:start + NGRAM_SIZE], ())
+             for start in range(len(query) - NGRAM_SIZE + 1)),
+            key=len
+        )
+        return [
+            index for index in postings[0]
+            if query in self.names[index][1:]
+            and not self.names[index].startswith(query)
+        ]
+
+    def scan(self, query):
+        matches = set()
+        position = self.haystack.find(query)
+        while position != -1:
+            index = bisect_right(self.starts, position) - 1
+            if position != self.starts[index]:
+                matches.add(index)
+            position = self.haystack.find(
+                query, self.starts[index] + len(self.names[index]) + 1
+            )
+        return matches
+
+
+def ingredient_usage():
+    return dict(
+        IngredientRecipe.objects.values('ingredient').annotate(
+            total=Count('id')
+        ).values_list('ingredient', 'total')
+    )
+
+
+@reference.ingredients.register('autocomplete')
+def build_index():
+    return IngredientIndex(
+        Ingredient.objects.values_list('id', 'search_name'),
+        ingredient_usage(),
+        settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+    )
+
+
+def search_ids(query, limit=None):
+    return reference.ingredients.get('autocomplete').search(
+        normalize_name(query.strip()),
+        limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+    )
+
+
+def preserve_order(queryset, ids):
+    return queryset.filter(id__in=ids).order_by(Case(
+        *(When(id=pk, then=Value(position))
+          for position, pk in enumerate(ids)),
+        output_field=IntegerField()
+    ))
+
+
+def search_in_memory(queryset, query, limit):
+    ids = search_ids(query, limit)
+    if not ids:
+        return queryset.none()
+    return preserve_order(queryset, ids)
+
+
+def search_in_database(queryset, query, limit):
+    return queryset.filter(search_name__contains=query).annotate(
+        rank=Case(
+            When(search_name__startswith=query, then=Value(PREFIX_RANK)),
+            default=Value(SUBSTRING_RANK),
+            output_field=IntegerField()
+        ),
+        usage=Count('ingredient')
+    ).order_by('rank', '-usage', 'search_name')[:limit]
+
+
+def search(queryset, query, limit=None):
+    query = normalize_name(query.strip())
+    limit = limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+    if not query:
+        return queryset[:limit]
+    if settings.INGREDIENT_AUTOCOMPLETE_BACKEND == 'memory':
+        return search_in_memory(queryset, query, limit)
+    return search_in_database(queryset, query, limit)
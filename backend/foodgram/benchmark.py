@@ -0,0 +1,365 @@
+import base64
+import io
+import math
+import random
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client, override_settings
+from foodgram import (cook, counters, feed, reference, response_cache,
+                      shopping_totals)
+from foodgram.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                             Recipe, ShoppingCart, Tag, TagRecipe)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+PERCENTILES = (50, 95, 99)
+SAVEPOINT_PREFIXES = (
+    'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'
+)
+
+
+@dataclass
+class Dataset:
+    users: int = 50
+    recipes: int = 300
+    tags: int = 5
+    ingredients: int = 500
+    ingredients_per_recipe: int = 8
+    favorites_per_user: int = 20
+    cart_per_user: int = 5
+    follows_per_user: int = 5
+    seed: int = 0
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    budget: int
+    data: Optional[Callable] = None
+    setup: Optional[Callable] = None
+    anonymous: bool = False
+    expected_status: tuple = (200,)
+
+
+@dataclass
+class Fixtures:
+    user: object
+    token: str
+    author: object
+    recipe: object
+    own_recipe: object
+    tags: list
+    ingredients: list
+
+
+def seed(dataset):
+    rnd = random.Random(dataset.seed)
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        User(
+            username=f'bench{i}', email=f'bench{i}@example.com',
+            first_name=f'Имя{i}', last_name=f'Фамилия{i}', password=password
+        )
+        for i in range(max(dataset.users, 2))
+    )
+    users = list(User.objects.filter(username__startswith='bench'))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', color='#E26C2D', slug=f'bench-tag-{i}')
+        for i in range(max(dataset.tags, 1))
+    )
+    tags = list(Tag.objects.filter(slug__startswith='bench-tag-'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г',
+                   search_name=f'ингредиент {i}')
+        for i in range(max(dataset.ingredients,
+                           dataset.ingredients_per_recipe))
+    )
+    ingredients = list(Ingredient.objects.all())
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=rnd.choice(users), name=f'Рецепт {i}',
+            text='Описание рецепта ' * 10,
+            cooking_time=rnd.randint(5, 120), image='recipes/bench.png'
+        )
+        for i in range(max(dataset.recipes, 1))
+    )
+    recipes = list(Recipe.objects.all())
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                         amount=rnd.randint(1, 500))
+        for recipe in recipes
+        for ingredient in rnd.sample(
+            ingredients, dataset.ingredients_per_recipe
+        )
+    )
+    TagRecipe.objects.bulk_create(
+        TagRecipe(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+    )
+    for model, per_user in ((Favorite, dataset.favorites_per_user),
+                            (ShoppingCart, dataset.cart_per_user)):
+        model.objects.bulk_create(
+            model(user=user, recipe=recipe)
+            for user in users
+            for recipe in rnd.sample(recipes, min(per_user, len(recipes)))
+        )
+    Follow.objects.bulk_create(
+        Follow(user=user, following=following)
+        for user in users
+        for following in rnd.sample(
+            [other for other in users if other != user],
+            min(dataset.follows_per_user, len(users) - 1)
+        )
+    )
+    shopping_totals.rebuild()
+    counters.reconcile()
+    feed.rebuild()
+    reference.bump_all()
+    cook.invalidate()
+    user = users[0]
+    author = next(
+        other for other in users
+        if other != user and other.recipes.exists()
+    )
+    own_recipe = user.recipes.first() or Recipe.objects.create(
+        author=user, name='Рецепт', text='Описание', cooking_time=10,
+        image='recipes/bench.png'
+    )
+    if not own_recipe.recipe.exists():
+        IngredientRecipe.objects.create(
+            recipe=own_recipe, ingredient=ingredients[0], amount=1
+        )
+        own_recipe.tags.add(tags[0])
+    return Fixtures(
+        user=user,
+        token=Token.objects.create(user=user).key,
+        author=author,
+        recipe=author.recipes.first(),
+        own_recipe=own_recipe,
+        tags=tags,
+        ingredients=ingredients,
+    )
+
+
+def benchmark_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#E26C2D').save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+BENCHMARK_IMAGE = benchmark_image()
+
+
+def recipe_payload(fixtures):
+    return {
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in fixtures.ingredients[:10]
+        ],
+        'tags': [tag.id for tag in fixtures.tags[:2]],
+        'image': BENCHMARK_IMAGE,
+        'name': 'Рецепт для замера',
+        'text': 'Описание',
+        'cooking_time': 15,
+    }
+
+
+def remove(model, **lookups):
+    def setup(fixtures):
+        model.objects.filter(**{
+            key: value(fixtures) for key, value in lookups.items()
+        }).delete()
+    return setup
+
+
+def ensure(model, **lookups):
+    def setup(fixtures):
+        model.objects.get_or_create(**{
+            key: value(fixtures) for key, value in lookups.items()
+        })
+    return setup
+
+
+def bypass_response_cache(fixtures):
+    # Bumped scopes send every request to the view, so the budget covers
+    # the queries of the list, not a cache hit.
+    response_cache.bump([response_cache.ALL])
+
+
+def current_user(fixtures):
+    return fixtures.user
+
+
+def target_recipe(fixtures):
+    return fixtures.recipe
+
+
+def target_author(fixtures):
+    return fixtures.author
+
+
+ENDPOINTS = (
+    Endpoint('recipes-list', 'get', '/api/recipes/', budget=5),
+    Endpoint('recipes-list-anonymous', 'get', '/api/recipes/', budget=4,
+             anonymous=True, setup=bypass_response_cache),
+    Endpoint('recipes-list-cached', 'get', '/api/recipes/',
+             budget=0, anonymous=True),
+    Endpoint('recipes-list-filtered', 'get',
+             '/api/recipes/?tags={tag_slug}&is_favorited=1', budget=5),
+    Endpoint('recipes-detail', 'get', '/api/recipes/{recipe_id}/',
+             budget=4),
+    Endpoint('recipes-feed-read', 'get', '/api/recipes/feed/?strategy=read',
+             budget=5),
+    Endpoint('recipes-feed-write', 'get',
+             '/api/recipes/feed/?strategy=write', budget=6),
+    Endpoint('recipes-cook', 'get',
+             '/api/recipes/cook/?ingredients={ingredient_ids}', budget=4),
+    Endpoint('recipes-create', 'post', '/api/recipes/', budget=14,
+             data=recipe_payload, expected_status=(201,)),
+    Endpoint('recipes-update', 'patch', '/api/recipes/{own_recipe_id}/',
+             budget=14, data=recipe_payload),
+    Endpoint('favorite-add', 'post', '/api/recipes/{recipe_id}/favorite/',
+             budget=5, expected_status=(201,),
+             setup=remove(Favorite, user=current_user, recipe=target_recipe)),
+    Endpoint('favorite-remove', 'delete',
+             '/api/recipes/{recipe_id}/favorite/', budget=4,
+             expected_status=(204,),
+             setup=ensure(Favorite, user=current_user, recipe=target_recipe)),
+    Endpoint('shopping-cart-add', 'post',
+             '/api/recipes/{recipe_id}/shopping_cart/', budget=6,
+             expected_status=(201,),
+             setup=remove(ShoppingCart, user=current_user,
+                          recipe=target_recipe)),
+    Endpoint('shopping-cart-remove', 'delete',
+             '/api/recipes/{recipe_id}/shopping_cart/', budget=6,
+             expected_status=(204,),
+             setup=ensure(ShoppingCart, user=current_user,
+                          recipe=target_recipe)),
+    Endpoint('download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', budget=3),
+    Endpoint('users-list', 'get', '/api/users/', budget=3),
+    Endpoint('users-me', 'get', '/api/users/me/', budget=2),
+    Endpoint('users-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', budget=4),
+    Endpoint('users-subscribe', 'post',
+             '/api/users/{author_id}/subscribe/?recipes_limit=3',
+             budget=10, expected_status=(201,),
+             setup=remove(Follow, user=current_user,
+                          following=target_author)),
+    Endpoint('tags-list', 'get', '/api/tags/', budget=1),
+    Endpoint('ingredients-search', 'get',
+             '/api/ingredients/?name=ингр', budget=1),
+)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Savepoints depend on the caller's transaction state, not on the
+        # endpoint, so they are left out of the budget.
+        if sql.startswith(SAVEPOINT_PREFIXES):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def format_path(path, fixtures):
+    return path.format(
+        recipe_id=fixtures.recipe.id,
+        own_recipe_id=fixtures.own_recipe.id,
+        author_id=fixtures.author.id,
+        tag_slug=fixtures.tags[0].slug,
+        ingredient_ids=','.join(
+            str(ingredient.id) for ingredient in fixtures.ingredients[:5]
+        ),
+    )
+
+
+def measure(endpoint, fixtures, repeat, warmup):
+    client = Client()
+    headers = {}
+    if not endpoint.anonymous:
+        headers['HTTP_AUTHORIZATION'] = f'Token {fixtures.token}'
+    path = format_path(endpoint.path, fixtures)
+    request = getattr(client, endpoint.method)
+    timings, db_timings, queries, statuses = [], [], [], set()
+    for iteration in range(warmup + repeat):
+        if endpoint.setup:
+            endpoint.setup(fixtures)
+        kwargs = dict(headers)
+        if endpoint.data:
+            kwargs.update(
+                data=endpoint.data(fixtures),
+                content_type='application/json'
+            )
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            response = request(path, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if iteration < warmup:
+            continue
+        statuses.add(response.status_code)
+        timings.append(elapsed * 1000)
+        queries.append(timer.count)
+        db_timings.append(timer.duration * 1000)
+    result = {
+        'method': endpoint.method.upper(),
+        'path': endpoint.path,
+        'budget': endpoint.budget,
+        'queries': max(queries),
+        'db_ms': round(statistics.mean(db_timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'statuses': sorted(statuses),
+        'ok': statuses <= set(endpoint.expected_status),
+    }
+    for percent in PERCENTILES:
+        result[f'p{percent}_ms'] = round(percentile(timings, percent), 3)
+    return result
+
+
+def run(fixtures, endpoints=ENDPOINTS, repeat=20, warmup=2):
+    # Uploaded images go to a directory removed afterwards.
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root):
+        return {
+            endpoint.name: measure(endpoint, fixtures, repeat, warmup)
+            for endpoint in endpoints
+        }
+
+
+def over_budget(results):
+    return {
+        name: result for name, result in results.items()
+        if result['queries'] > result['budget'] or not result['ok']
+    }
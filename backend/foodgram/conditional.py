@@ -0,0 +1,102 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from foodgram import reference
+from foodgram.models import USER_FLAGS
+
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+class Validators:
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def of(cls, state, last_modified=None):
+        return cls(
+            quote_etag(hashlib.md5(
+                json.dumps(state, default=str).encode()
+            ).hexdigest()),
+            int(last_modified.timestamp()) if last_modified else None
+        )
+
+    @classmethod
+    def from_response(cls, response):
+        if not response.has_header('ETag'):
+            return None
+        return cls(
+            response['ETag'],
+            parse_http_date_safe(response.get('Last-Modified'))
+        )
+
+    def not_modified(self, request):
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        if response is None:
+            return None
+        return self.apply(response)
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+def requested(request):
+    return (
+        'HTTP_IF_NONE_MATCH' in request.META
+        or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    )
+
+
+def flags(user, fields):
+    if not user.is_authenticated:
+        return ()
+    return tuple(flag for flag, field in USER_FLAGS.items() if field in fields)
+
+
+def recipe_fields(user, fields):
+    # Only what the selected fields show is part of the state.
+    author = AUTHOR_FIELDS if 'author' in fields else ()
+    return (
+        'id', 'updated_at', 'author_id',
+        *(f'author__{field}' for field in author), *flags(user, fields)
+    )
+
+
+def recipe_state(recipe, user, fields):
+    # The same values as recipe_fields() reads, from a loaded recipe.
+    author = AUTHOR_FIELDS if 'author' in fields else ()
+    return (
+        recipe.id, recipe.updated_at, recipe.author_id,
+        *(getattr(recipe.author, field) for field in author),
+        *(getattr(recipe, flag) for flag in flags(user, fields))
+    )
+
+
+def recipe_validators(states, user, fields, extra=()):
+    # Tag and ingredient names come from the reference data, its versions
+    # stand in for them. Last-Modified only depends on the recipes, so it
+    # is left out where the user's own flags are part of the response.
+    states = [list(state) for state in states]
+    last_modified = None
+    if not flags(user, fields) and states:
+        last_modified = max(state[1] for state in states)
+    return Validators.of([
+        *extra, sorted(fields), states, reference.tags.current_version(),
+        reference.ingredients.current_version()
+    ], last_modified)
+
+
+def user_validators(user, is_subscribed):
+    return Validators.of([
+        user.id, *(getattr(user, field) for field in AUTHOR_FIELDS),
+        is_subscribed
+    ])
@@ -0,0 +1,318 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from foodgram.models import IngredientRecipe
+
+VERSION_KEY = 'cook:version'
+CHANGE_KEY = 'cook:change:{}'
+FETCH_SIZE = 100000
+ROW = np.int32
+COUNT = np.uint8
+REBUILD = 0
+
+
+class CookIndex:
+    # Recipes are numbered by rows. An ingredient keeps the sorted rows of
+    # its recipes, or a 0/1 vector over all rows when it is common enough
+    # that adding the vector is cheaper than scattering the rows.
+    def __init__(self, pairs=(), max_ingredients=30, dense_share=32):
+        self.max_ingredients = max_ingredients
+        self.dense_share = dense_share
+        self.length = 0
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.sizes = np.zeros(0, dtype=ROW)
+        self.rows = {}
+        self.postings = {}
+        self.dense = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.members = np.zeros(0, dtype=np.int64)
+        self.changed = {}
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        if len(pairs):
+            self.load(pairs)
+        self.build_cells()
+
+    def load(self, pairs):
+        recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        self.length = len(recipe_ids)
+        self.recipe_ids = recipe_ids
+        self.sizes = np.bincount(rows).astype(ROW)
+        self.rows = dict(zip(recipe_ids.tolist(), range(self.length)))
+        # The ingredients of every recipe, to find what an update removes.
+        self.members = pairs[np.argsort(rows, kind='stable'), 1]
+        self.offsets = np.r_[0, np.cumsum(self.sizes)]
+        order = np.lexsort((rows, pairs[:, 1]))
+        ingredients, rows = pairs[order, 1], rows[order].astype(ROW)
+        boundaries = np.flatnonzero(np.diff(ingredients)) + 1
+        for ingredient_id, postings in zip(
+            ingredients[np.r_[0, boundaries]].tolist(),
+            np.split(rows, boundaries)
+        ):
+            if len(postings) * self.dense_share > self.length:
+                vector = np.zeros(self.length, dtype=COUNT)
+                vector[postings] = 1
+                self.dense[ingredient_id] = vector
+            else:
+                self.postings[ingredient_id] = postings
+
+    def build_cells(self):
+        # Recipes are ranked by coverage, then by missing ingredients, then
+        # by how many of the given ingredients they use. Each (size, count)
+        # cell gets its place in that order once, here.
+        width = self.max_ingredients + 1
+        self.max_size = int(self.sizes.max(initial=0))
+        cells = sorted(
+            ((size, count) for size in range(1, self.max_size + 1)
+             for count in range(1, min(size, self.max_ingredients) + 1)),
+            key=lambda cell: (-cell[1] / cell[0], cell[0] - cell[1], -cell[1])
+        )
+        self.ranks = np.full(
+            (self.max_size + 1) * width, len(cells), dtype=ROW
+        )
+        self.ranks[[size * width + count for size, count in cells]] = (
+            np.arange(len(cells), dtype=ROW)
+        )
+        # Coverage is computed as count * (1 / size) in float32, for rows
+        # and for the possible levels alike, so equal fractions compare
+        # equal.
+        self.inverse = self.inverse_sizes(self.sizes)
+        self.levels = np.unique(np.array(
+            [np.float32(count) * self.inverse_sizes(size)
+             for size, count in cells], dtype=np.float32
+        ))[::-1]
+
+    @staticmethod
+    def inverse_sizes(sizes):
+        sizes = np.asarray(sizes, dtype=np.float32)
+        return np.divide(
+            np.float32(1), sizes, out=np.zeros_like(sizes), where=sizes > 0
+        )
+
+    def ingredients_of(self, row):
+        if row in self.changed:
+            return self.changed[row]
+        if row + 1 < len(self.offsets):
+            return set(
+                self.members[self.offsets[row]:self.offsets[row + 1]].tolist()
+            )
+        return set()
+
+    def grow(self):
+        capacity = max(len(self.sizes) * 2, 16)
+        self.recipe_ids = np.resize(self.recipe_ids, capacity)
+        self.sizes = np.r_[
+            self.sizes, np.zeros(capacity - len(self.sizes), dtype=ROW)
+        ]
+        self.inverse = np.r_[
+            self.inverse,
+            np.zeros(capacity - len(self.inverse), dtype=np.float32)
+        ]
+        for ingredient_id, vector in self.dense.items():
+            self.dense[ingredient_id] = np.r_[
+                vector, np.zeros(capacity - len(vector), dtype=COUNT)
+            ]
+
+    def update(self, recipe_id, ingredient_ids):
+        row = self.rows.get(recipe_id)
+        if row is None:
+            if not ingredient_ids:
+                return
+            # A new recipe takes the next row, so posting lists stay sorted
+            # when it is appended.
+            if self.length == len(self.sizes):
+                self.grow()
+            row = self.rows[recipe_id] = self.length
+            self.recipe_ids[row] = recipe_id
+            self.length += 1
+            current = set()
+        else:
+            current = self.ingredients_of(row)
+        ingredient_ids = set(ingredient_ids)
+        for ingredient_id in current - ingredient_ids:
+            if ingredient_id in self.dense:
+                self.dense[ingredient_id][row] = 0
+            else:
+                postings = self.postings[ingredient_id]
+                self.postings[ingredient_id] = postings[postings != row]
+        for ingredient_id in ingredient_ids - current:
+            if ingredient_id in self.dense:
+                self.dense[ingredient_id][row] = 1
+            else:
+                postings = self.postings.get(
+                    ingredient_id, np.zeros(0, dtype=ROW)
+                )
+                self.postings[ingredient_id] = np.insert(
+                    postings, np.searchsorted(postings, row), row
+                )
+        self.sizes[row] = len(ingredient_ids)
+        self.changed[row] = ingredient_ids
+        if self.sizes[row] > self.max_size:
+            self.build_cells()
+        else:
+            self.inverse[row] = self.inverse_sizes(self.sizes[row])
+
+    def match(self, ingredient_ids, limit):
+        ingredient_ids = [
+            ingredient_id for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.dense or ingredient_id in self.postings
+        ][:self.max_ingredients]
+        if not ingredient_ids or not limit:
+            return []
+        counts = np.zeros(len(self.sizes), dtype=COUNT)
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in self.dense:
+                counts += self.dense[ingredient_id]
+            else:
+                counts[self.postings[ingredient_id]] += 1
+        coverage = counts * self.inverse
+        # Comparisons over the whole index are cheap, sorting is not: the
+        # binary search finds the highest coverage level that still lets
+        # ``limit`` recipes through, only those are ranked.
+        low, high = 0, len(self.levels) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if np.count_nonzero(coverage >= self.levels[middle]) >= limit:
+                high = middle
+            else:
+                low = middle + 1
+        rows = np.flatnonzero(coverage >= self.levels[low])
+        width = self.max_ingredients + 1
+        found = counts[rows].astype(ROW)
+        sizes = self.sizes[rows]
+        order = np.lexsort(
+            (-rows, self.ranks[sizes * width + found])
+        )[:limit]
+        return [
+            (int(self.recipe_ids[row]), int(count), int(size - count))
+            for row, count, size in zip(
+                rows[order].tolist(), found[order].tolist(),
+                sizes[order].tolist()
+            )
+        ]
+
+
+def fetch_pairs(recipe_ids=None):
+    table = IngredientRecipe._meta.db_table
+    sql = f'SELECT recipe_id, ingredient_id FROM {table}'
+    params = ()
+    if recipe_ids is not None:
+        sql += f' WHERE recipe_id IN ({", ".join(["%s"] * len(recipe_ids))})'
+        params = tuple(recipe_ids)
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    if not chunks:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def current_version():
+    # A counter lost by the cache restarts from the clock, far past every
+    # version a process may hold: the gap makes them rebuild.
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def publish(recipe_id):
+    # incr() is a get and a set on some backends, two writers may get the
+    # same number: the change is kept under the first version whose slot
+    # is still free, add() never overwrites another writer's change.
+    while True:
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            current_version()
+            continue
+        if cache.add(
+            CHANGE_KEY.format(version), recipe_id,
+            settings.COOK_CHANGE_LOG_TTL
+        ):
+            break
+    # incr() may also have rewritten the counter with the default timeout.
+    cache.touch(VERSION_KEY, None)
+
+
+def recipe_changed(recipe_id):
+    # Every process replays the change log before its next query, the
+    # writer included, so the index is only read from the database.
+    transaction.on_commit(lambda: publish(recipe_id))
+
+
+def invalidate():
+    # Rows written in bulk send no signals, every index is rebuilt.
+    transaction.on_commit(lambda: publish(REBUILD))
+
+
+def build():
+    return CookIndex(
+        fetch_pairs(), settings.COOK_MAX_INGREDIENTS,
+        settings.COOK_DENSE_SHARE
+    )
+
+
+class SharedIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.built_at = 0.0
+
+    def get(self):
+        version = current_version()
+        with self.lock:
+            # The age bounds how long a change the log lost stays unseen.
+            expired = (
+                time.monotonic() - self.built_at > settings.COOK_INDEX_MAX_AGE
+            )
+            if self.index is None or version < self.version or expired:
+                self.version = version
+                self.rebuild()
+            elif version > self.version:
+                self.catch_up(version)
+            return self.index
+
+    def rebuild(self):
+        self.index = build()
+        self.built_at = time.monotonic()
+
+    def catch_up(self, version):
+        numbers, changes = range(self.version + 1, version + 1), {}
+        # A longer log is slower to replay than the index is to rebuild.
+        if len(numbers) <= settings.COOK_MAX_REPLAY:
+            changes = cache.get_many(
+                [CHANGE_KEY.format(number) for number in numbers]
+            )
+        if len(changes) < len(numbers) or REBUILD in changes.values():
+            # Part of the log has expired, only a rebuild is reliable.
+            self.rebuild()
+        else:
+            recipe_ids = sorted(set(changes.values()))
+            ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+            for recipe_id, ingredient_id in fetch_pairs(recipe_ids).tolist():
+                ingredients[recipe_id].append(ingredient_id)
+            for recipe_id, ingredient_ids in ingredients.items():
+                self.index.update(recipe_id, ingredient_ids)
+        self.version = version
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+
+shared = SharedIndex()
+
+
+def match(ingredient_ids, limit):
+    return shared.get().match(ingredient_ids, limit)
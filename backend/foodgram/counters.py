@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F
+from foodgram.models import Favorite, Follow, Recipe, ShoppingCart, UserStats
+
+User = get_user_model()
+
+RECIPE_COUNTERS = {
+    'favorites_count': (Favorite, 'recipe'),
+    'in_carts_count': (ShoppingCart, 'recipe'),
+}
+USER_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'followers_count': (Follow, 'following'),
+}
+
+
+def change_recipe(recipe_id, **deltas):
+    Recipe.objects.filter(id=recipe_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def change_recipes(recipe_ids, **deltas):
+    Recipe.objects.filter(id__in=recipe_ids).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def change_user(user_id, **deltas):
+    # Users inserted in bulk get their row from reconcile().
+    UserStats.objects.filter(user_id=user_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def live_counts(counters, ids):
+    counts = {}
+    for field, (model, key) in counters.items():
+        counts[field] = dict(
+            model.objects.filter(**{f'{key}__in': ids}).values(key)
+            .annotate(total=Count('id')).order_by().values_list(key, 'total')
+        )
+    return counts
+
+
+def reconcile_recipes(start, stop, dry_run=False):
+    recipes = list(Recipe.objects.filter(id__gte=start, id__lt=stop).only(
+        'id', *RECIPE_COUNTERS
+    ))
+    counts = live_counts(RECIPE_COUNTERS, [recipe.id for recipe in recipes])
+    changed = []
+    for recipe in recipes:
+        stale = False
+        for field in RECIPE_COUNTERS:
+            actual = counts[field].get(recipe.id, 0)
+            if getattr(recipe, field) != actual:
+                setattr(recipe, field, actual)
+                stale = True
+        if stale:
+            changed.append(recipe)
+    if changed and not dry_run:
+        Recipe.objects.bulk_update(changed, list(RECIPE_COUNTERS))
+    return len(changed)
+
+
+def reconcile_users(start, stop, dry_run=False):
+    user_ids = list(User.objects.filter(
+        id__gte=start, id__lt=stop
+    ).values_list('id', flat=True))
+    stats = UserStats.objects.in_bulk(user_ids)
+    counts = live_counts(USER_COUNTERS, user_ids)
+    changed, missing = [], []
+    for user_id in user_ids:
+        actual = {
+            field: counts[field].get(user_id, 0) for field in USER_COUNTERS
+        }
+        if user_id not in stats:
+            missing.append(UserStats(user_id=user_id, **actual))
+        elif any(getattr(stats[user_id], field) != value
+                 for field, value in actual.items()):
+            for field, value in actual.items():
+                setattr(stats[user_id], field, value)
+            changed.append(stats[user_id])
+    if not dry_run:
+        UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+        UserStats.objects.bulk_update(changed, list(USER_COUNTERS))
+    return len(changed) + len(missing)
+
+
+def id_ranges(model, batch_size):
+    last = model.objects.order_by('-id').values_list('id', flat=True).first()
+    for start in range(0, (last or 0) + 1, batch_size):
+        yield start, start + batch_size
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    fixed = {'recipes': 0, 'users': 0}
+    for start, stop in id_ranges(Recipe, batch_size):
+        fixed['recipes'] += reconcile_recipes(start, stop, dry_run)
+    for start, stop in id_ranges(User, batch_size):
+        fixed['users'] += reconcile_users(start, stop, dry_run)
+    return fixed
@@ -0,0 +1,377 @@
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from foodgram import benchmark
+from foodgram.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+COLUMN = r'"?(?P<qualifier>\w+)"?\."?(?P<column>\w+)"?'
+PARAMETER_FILTER = re.compile(
+    COLUMN + r'\s*(?:=|<>|<=|>=|<|>|IN\s*\(|LIKE)\s*%s', re.IGNORECASE
+)
+# Django names the tables of correlated subqueries U0, U1, ...
+CORRELATION = re.compile(
+    r'(?P<qualifier>U\d+)\."(?P<column>\w+)"\s*=\s*"\w+"\."\w+"'
+)
+DECLARATION = re.compile(
+    r'(?:FROM|JOIN)\s+"?(?P<table>\w+)"?(?:\s+(?:AS\s+)?(?P<alias>(?!(?:'
+    r'WHERE|INNER|LEFT|JOIN|ON|GROUP|ORDER|LIMIT|CROSS)\b)\w+))?',
+    re.IGNORECASE
+)
+ORDER_PATTERN = re.compile(
+    r'ORDER BY (?P<clause>.+?)(?:\s+LIMIT|\s+OFFSET|\)|$)'
+)
+ORDER_COLUMN = re.compile(COLUMN + r'(?P<descending>\s+DESC)?')
+SQLITE_SCAN = re.compile(
+    r'^SCAN (?:TABLE )?(?P<name>\w+)(?P<indexed>.*INDEX)?'
+)
+SQLITE_SEARCH = re.compile(
+    r'^SEARCH (?:TABLE )?\w+(?: AS \w+)? USING (?:COVERING )?INDEX '
+    r'(?P<index>\w+) \((?P<condition>[^)]*)\)'
+)
+PLAN_INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+class Rollback(Exception):
+    pass
+
+
+@dataclass
+class Statement:
+    endpoint: str
+    sql: str
+    params: tuple
+    duration: float
+
+
+@dataclass
+class Finding:
+    kind: str
+    table: str
+    detail: str
+
+
+class StatementRecorder:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not many and sql.lstrip().upper().startswith(
+                ('SELECT', 'WITH')
+            ):
+                self.statements.append(Statement(
+                    self.endpoint, sql, tuple(params or ()),
+                    time.perf_counter() - started
+                ))
+
+
+def current_fixtures(username=None):
+    # Endpoints run as an existing user against existing recipes, so the
+    # plans reflect the real data distribution.
+    if not Recipe.objects.exists():
+        return None
+    users = User.objects.annotate(marks=Count('favorite')).order_by('-marks')
+    user = (
+        users.get(username=username) if username else users.first()
+    )
+    author = (
+        User.objects.exclude(id=user.id).filter(recipes__isnull=False)
+        .first()
+    ) or user
+    own_recipe = user.recipes.first() or Recipe.objects.create(
+        author=user, name='Рецепт', text='Описание', cooking_time=10,
+        image='recipes/explain.png'
+    )
+    return benchmark.Fixtures(
+        user=user,
+        token=Token.objects.get_or_create(user=user)[0].key,
+        author=author,
+        recipe=author.recipes.first(),
+        own_recipe=own_recipe,
+        tags=list(Tag.objects.all()[:2]) or [
+            Tag.objects.create(name='explain', color='#000000', slug='e')
+        ],
+        ingredients=list(Ingredient.objects.all()[:10]),
+    )
+
+
+def record(fixtures, endpoints):
+    statements = []
+    for endpoint in endpoints:
+        recorder = StatementRecorder(endpoint.name)
+        try:
+            # Writes are rolled back, the statements stay recorded.
+            with transaction.atomic():
+                if endpoint.setup:
+                    endpoint.setup(fixtures)
+                with connection.execute_wrapper(recorder):
+                    request(endpoint, fixtures)
+                raise Rollback
+        except Rollback:
+            pass
+        statements.extend(recorder.statements)
+    return statements
+
+
+def request(endpoint, fixtures):
+    client = Client()
+    kwargs = {}
+    if not endpoint.anonymous:
+        kwargs['HTTP_AUTHORIZATION'] = f'Token {fixtures.token}'
+    if endpoint.data:
+        kwargs.update(
+            data=endpoint.data(fixtures), content_type='application/json'
+        )
+    response = getattr(client, endpoint.method)(
+        benchmark.format_path(endpoint.path, fixtures), **kwargs
+    )
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def heaviest(statements, top):
+    by_sql = {}
+    for statement in statements:
+        known = by_sql.get(statement.sql)
+        if known is None or statement.duration > known.duration:
+            by_sql[statement.sql] = statement
+    return sorted(
+        by_sql.values(), key=lambda statement: statement.duration,
+        reverse=True
+    )[:top]
+
+
+def explain(statement, catalogue):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement.sql,
+                statement.params
+            )
+            return postgres_findings(cursor.fetchone()[0][0]['Plan'])
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement.sql, statement.params)
+        return sqlite_findings(
+            [row[3] for row in cursor.fetchall()], statement.sql, catalogue
+        )
+
+
+def postgres_findings(plan):
+    findings = []
+    node = plan['Node Type']
+    if node == 'Seq Scan':
+        findings.append(Finding(
+            'seq_scan', plan['Relation Name'],
+            f'{plan.get("Actual Rows", 0)} rows returned, '
+            f'{plan.get("Rows Removed by Filter", 0)} removed by filter'
+        ))
+    if node in PLAN_INDEX_SCANS and plan.get('Rows Removed by Filter'):
+        findings.append(Finding(
+            'partial_index', plan['Relation Name'],
+            f'{plan.get("Index Name", node)} leaves '
+            f'{plan["Rows Removed by Filter"]} rows to {plan["Filter"]}'
+        ))
+    if node == 'Sort' and plan.get('Sort Space Type') == 'Disk':
+        findings.append(Finding(
+            'sort_spill', sort_relation(plan),
+            f'{plan.get("Sort Space Used")} kB on disk for '
+            f'{", ".join(plan.get("Sort Key", ()))}'
+        ))
+    for child in plan.get('Plans', ()):
+        findings.extend(postgres_findings(child))
+    return findings
+
+
+def sort_relation(plan):
+    for child in plan.get('Plans', ()):
+        if 'Relation Name' in child:
+            return child['Relation Name']
+        relation = sort_relation(child)
+        if relation:
+            return relation
+    return ''
+
+
+def sqlite_findings(details, sql, catalogue):
+    findings = []
+    for detail in details:
+        scan = SQLITE_SCAN.match(detail)
+        search = SQLITE_SEARCH.match(detail)
+        if scan and not scan['indexed']:
+            findings.append(Finding(
+                'seq_scan', resolve(sql, scan['name'], len(sql)), detail
+            ))
+        elif search and search['index'] in catalogue:
+            # The index narrows the search on fewer columns than the
+            # statement filters on, the rest is checked row by row.
+            table = catalogue[search['index']]
+            used = set(re.findall(r'(\w+)[=<>]', search['condition']))
+            if set(filter_columns(sql, table)) - used:
+                findings.append(Finding('partial_index', table, detail))
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            # SQLite has no spill statistics, every explicit sort is shown.
+            findings.append(Finding('sort', order_table(sql), detail))
+    return findings
+
+
+def resolve(sql, qualifier, position):
+    # Aliases are reused by sibling subqueries, the nearest declaration
+    # before the reference wins.
+    table = qualifier
+    for declaration in DECLARATION.finditer(sql, 0, position):
+        if qualifier in (declaration['table'], declaration['alias']):
+            table = declaration['table']
+    return table
+
+
+def filter_columns(sql, table):
+    matches = sorted(
+        [*PARAMETER_FILTER.finditer(sql), *CORRELATION.finditer(sql)],
+        key=lambda match: match.start()
+    )
+    columns = []
+    for match in matches:
+        if (resolve(sql, match['qualifier'], match.start()) == table
+                and match['column'] not in columns):
+            columns.append(match['column'])
+    return columns
+
+
+def order_clause(sql):
+    matches = list(ORDER_PATTERN.finditer(sql))
+    return matches[-1] if matches else None
+
+
+def order_table(sql):
+    clause = order_clause(sql)
+    column = clause and ORDER_COLUMN.search(clause['clause'])
+    return resolve(sql, column['qualifier'], clause.start()) if column else ''
+
+
+def order_columns(sql, table):
+    clause = order_clause(sql)
+    if clause is None:
+        return []
+    return [
+        ('-' if column['descending'] else '') + column['column']
+        for column in ORDER_COLUMN.finditer(clause['clause'])
+        if resolve(sql, column['qualifier'], clause.start()) == table
+    ]
+
+
+def index_catalogue():
+    indexes, tables = {}, {}
+    with connection.cursor() as cursor:
+        for table in connection.introspection.table_names(cursor):
+            constraints = connection.introspection.get_constraints(
+                cursor, table
+            )
+            for name, constraint in constraints.items():
+                if constraint['index'] or constraint['unique'] or \
+                        constraint['primary_key']:
+                    indexes[name] = table
+                    tables.setdefault(table, []).append(
+                        constraint['columns']
+                    )
+    return indexes, tables
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+        )
+        return cursor.fetchone()[0]
+
+
+def propose(finding, sql, table_indexes):
+    # The filtered columns come first, then the sort order, so one index
+    # serves both the lookup and the ORDER BY.
+    table = finding.table
+    if not table:
+        return None
+    columns = filter_columns(sql, table)
+    if 'id' in columns:
+        return None
+    if finding.kind in ('sort', 'sort_spill'):
+        for column in order_columns(sql, table):
+            if column.lstrip('-') not in columns:
+                columns.append(column)
+    if not columns:
+        return None
+    names = {column.lstrip('-') for column in columns}
+    for index in table_indexes.get(table, ()):
+        if set(index[:len(names)]) == names:
+            return None
+    return table, tuple(columns)
+
+
+def advise(statements, top=10, min_rows=1000):
+    report = {'statements': [], 'proposals': {}}
+    row_counts = {}
+    indexes, table_indexes = index_catalogue()
+    for statement in heaviest(statements, top):
+        findings = explain(statement, indexes)
+        report['statements'].append({
+            'endpoint': statement.endpoint,
+            'duration_ms': round(statement.duration * 1000, 3),
+            'sql': statement.sql,
+            'findings': [
+                {'kind': finding.kind, 'table': finding.table,
+                 'detail': finding.detail}
+                for finding in findings
+            ],
+        })
+        for finding in findings:
+            proposal = propose(finding, statement.sql, table_indexes)
+            if proposal is None:
+                continue
+            table = proposal[0]
+            if table not in row_counts:
+                row_counts[table] = table_rows(table)
+            if row_counts[table] < min_rows:
+                continue
+            entry = report['proposals'].setdefault(proposal, {
+                'table': table, 'columns': list(proposal[1]),
+                'rows': row_counts[table], 'reasons': set(),
+                'endpoints': set(),
+            })
+            entry['reasons'].add(finding.kind)
+            entry['endpoints'].add(statement.endpoint)
+    report['proposals'] = [
+        dict(entry, reasons=sorted(entry['reasons']),
+             endpoints=sorted(entry['endpoints']))
+        for entry in report['proposals'].values()
+    ]
+    return report
+
+
+def run(username=None, endpoints=benchmark.ENDPOINTS, top=10, min_rows=1000):
+    # Fixtures created for the run are rolled back with everything else,
+    # uploaded images go to a directory removed afterwards.
+    hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+    try:
+        with transaction.atomic(), \
+                tempfile.TemporaryDirectory() as media_root, \
+                override_settings(ALLOWED_HOSTS=hosts, MEDIA_ROOT=media_root):
+            fixtures = current_fixtures(username)
+            if fixtures is None:
+                return None
+            report = advise(record(fixtures, endpoints), top, min_rows)
+            raise Rollback
+    except Rollback:
+        return report
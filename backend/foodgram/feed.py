@@ -0,0 +1,167 @@
+import heapq
+
+from django.conf import settings
+from django.db import connection
+from foodgram.models import FeedEntry, Follow, Recipe, UserStats
+
+READ = 'read'
+WRITE = 'write'
+STRATEGIES = (READ, WRITE)
+
+RECIPES = Recipe._meta.db_table
+FOLLOWS = Follow._meta.db_table
+ENTRIES = FeedEntry._meta.db_table
+STATS = UserStats._meta.db_table
+INSERT_ENTRIES = (
+    f'INSERT INTO {ENTRIES} (user_id, recipe_id, author_id, pub_date) '
+)
+
+
+def fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def before(columns, cursor):
+    # Row values compare lexicographically, matching the
+    # (pub_date DESC, id DESC) order of every feed stream.
+    if cursor is None:
+        return '', []
+    pub_date, recipe_id = cursor
+    return f' AND ({columns}) < (%s, %s)', [
+        connection.ops.adapt_datetimefield_value(pub_date), recipe_id
+    ]
+
+
+def author_streams(user_id, cursor, size, over_cap=None):
+    # Newest recipes of every followed author, optionally only of authors
+    # whose followers are not fanned out on write.
+    authors = ''
+    params = [user_id]
+    if over_cap is not None:
+        authors = (
+            f' AND follow.following_id IN (SELECT user_id FROM {STATS} '
+            'WHERE followers_count > %s)'
+        )
+        params.append(over_cap)
+    if connection.vendor == 'postgresql':
+        # Each followed author is read through its own index range and the
+        # per-author streams are merged by the outer ORDER BY.
+        position, position_params = before('recipe.pub_date, recipe.id',
+                                           cursor)
+        return fetch(
+            'SELECT stream.pub_date, stream.id '
+            f'FROM {FOLLOWS} follow CROSS JOIN LATERAL ('
+            f'SELECT recipe.pub_date, recipe.id FROM {RECIPES} recipe '
+            f'WHERE recipe.author_id = follow.following_id{position} '
+            'ORDER BY recipe.pub_date DESC, recipe.id DESC LIMIT %s'
+            f') stream WHERE follow.user_id = %s{authors} '
+            'ORDER BY stream.pub_date DESC, stream.id DESC LIMIT %s',
+            [*position_params, size, *params, size]
+        )
+    position, position_params = before('recipe.pub_date, recipe.id', cursor)
+    return fetch(
+        f'SELECT recipe.pub_date, recipe.id FROM {RECIPES} recipe '
+        'WHERE recipe.author_id IN ('
+        f'SELECT follow.following_id FROM {FOLLOWS} follow '
+        f'WHERE follow.user_id = %s{authors}){position} '
+        'ORDER BY recipe.pub_date DESC, recipe.id DESC LIMIT %s',
+        [*params, *position_params, size]
+    )
+
+
+def timeline(user_id, cursor, size):
+    position, position_params = before('pub_date, recipe_id', cursor)
+    return fetch(
+        f'SELECT pub_date, recipe_id FROM {ENTRIES} '
+        f'WHERE user_id = %s{position} '
+        'ORDER BY pub_date DESC, recipe_id DESC LIMIT %s',
+        [user_id, *position_params, size]
+    )
+
+
+def merge(size, *streams):
+    ids = []
+    for _, recipe_id in heapq.merge(*streams, reverse=True):
+        # An author crossing the fan-out cap can appear in both streams.
+        if recipe_id not in ids:
+            ids.append(recipe_id)
+        if len(ids) == size:
+            break
+    return ids
+
+
+def recipe_ids(user, strategy, cursor, size):
+    if strategy == READ:
+        streams = author_streams(user.id, cursor, size)
+        return [recipe_id for _, recipe_id in streams]
+    return merge(
+        size,
+        timeline(user.id, cursor, size),
+        author_streams(
+            user.id, cursor, size, settings.FEED_FANOUT_MAX_FOLLOWERS
+        ),
+    )
+
+
+def fan_out_condition(author_param='%s'):
+    return (
+        f'(SELECT COALESCE(MAX(followers_count), 0) FROM {STATS} '
+        f'WHERE user_id = {author_param}) <= %s'
+    )
+
+
+def publish(recipe):
+    if not settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_ENTRIES
+            + f'SELECT follow.user_id, %s, %s, %s FROM {FOLLOWS} follow '
+            f'WHERE follow.following_id = %s AND {fan_out_condition()}',
+            [recipe.id, recipe.author_id,
+             connection.ops.adapt_datetimefield_value(recipe.pub_date),
+             recipe.author_id, recipe.author_id,
+             settings.FEED_FANOUT_MAX_FOLLOWERS]
+        )
+
+
+def follow_added(user_id, author_id):
+    if not settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_ENTRIES
+            + 'SELECT %s, recipe.id, recipe.author_id, recipe.pub_date '
+            f'FROM {RECIPES} recipe '
+            f'WHERE recipe.author_id = %s AND {fan_out_condition()} '
+            'ORDER BY recipe.pub_date DESC, recipe.id DESC LIMIT %s '
+            'ON CONFLICT DO NOTHING',
+            [user_id, author_id, author_id,
+             settings.FEED_FANOUT_MAX_FOLLOWERS, settings.FEED_BACKFILL_SIZE]
+        )
+
+
+def follow_removed(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    FeedEntry.objects.all().delete()
+    if not settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_ENTRIES
+            + 'SELECT follow.user_id, latest.id, latest.author_id, '
+            'latest.pub_date FROM ('
+            'SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {RECIPES}'
+            f') latest JOIN {FOLLOWS} follow '
+            'ON follow.following_id = latest.author_id '
+            'WHERE latest.position <= %s '
+            f'AND {fan_out_condition("latest.author_id")}',
+            [settings.FEED_BACKFILL_SIZE, settings.FEED_FANOUT_MAX_FOLLOWERS]
+        )
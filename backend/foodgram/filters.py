@@ -1,29 +1,53 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from foodgram.models import Ingredient, Recipe, Tag
+from foodgram import autocomplete, reference, search
+from foodgram.models import Ingredient, Recipe, TagRecipe
 
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='startswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        return autocomplete.search(queryset, value)
+
+
+def tag_choices():
+    return [(slug, slug) for slug in reference.tags.get('slug_to_id')]
+
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
     )
     is_favorited = filters.CharFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.CharFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        # The tags may have changed since the choices were validated, a
+        # slug gone in between matches nothing.
+        slug_to_id = reference.tags.get('slug_to_id')
+        return queryset.filter(Exists(TagRecipe.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[
+                slug_to_id[slug] for slug in value if slug in slug_to_id
+            ]
+        )))
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
@@ -0,0 +1,135 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from foodgram import response_cache
+from foodgram.models import Recipe
+from jobs import queue
+from PIL import Image, ImageOps, features
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'recipes/derivatives'
+WEBP_SUFFIX = '_webp'
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def formats():
+    # WebP needs libwebp at Pillow build time, JPEG is always available.
+    if features.check('webp'):
+        return (('', 'JPEG', 'jpg'), (WEBP_SUFFIX, 'WEBP', 'webp'))
+    return (('', 'JPEG', 'jpg'),)
+
+
+def render(image, size, image_format):
+    copy = image.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(
+        buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def generate(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).only(
+        'id', 'author_id', 'image'
+    ).first()
+    if recipe is None or not recipe.image:
+        return {}
+    source = recipe.image.name
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGB')
+    derivatives = {}
+    for name, size in settings.RECIPE_IMAGE_SIZES.items():
+        for suffix, image_format, extension in formats():
+            path = os.path.join(
+                DERIVATIVES_DIR, str(recipe_id), f'{name}.{extension}'
+            )
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            derivatives[name + suffix] = default_storage.save(
+                path, ContentFile(render(image, size, image_format))
+            )
+    # The image may have been replaced while the derivatives were built.
+    if Recipe.objects.filter(id=recipe_id, image=source).update(
+        image_derivatives=derivatives, updated_at=timezone.now()
+    ):
+        response_cache.recipe_changed(recipe)
+    return derivatives
+
+
+def generate_safely(recipe_id):
+    try:
+        return generate(recipe_id)
+    except Exception:
+        logger.exception('Cannot build image derivatives for %s', recipe_id)
+
+
+def generate_in_thread(recipe_id):
+    try:
+        return generate_safely(recipe_id)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return executor
+
+
+def schedule(recipe):
+    # Derivatives are built after commit so the worker sees the new image.
+    recipe_id = recipe.id
+    if settings.RECIPE_IMAGE_PROCESSING == 'queue':
+        queue.enqueue_on_commit('recipe-images', {'recipe_id': recipe_id})
+    elif settings.RECIPE_IMAGE_PROCESSING == 'sync':
+        transaction.on_commit(lambda: generate(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(generate_in_thread, recipe_id)
+        )
+
+
+def uploaded(recipe):
+    metrics.image_uploads.inc()
+    metrics.image_upload_bytes.inc(recipe.image.size)
+    schedule(recipe)
+
+
+def image_urls(recipe, request=None):
+    if not recipe.image:
+        return {}
+    original = recipe.image.url
+    urls = {'original': original}
+    for name in settings.RECIPE_IMAGE_SIZES:
+        for suffix, _, _ in formats():
+            path = recipe.image_derivatives.get(name + suffix)
+            urls[name + suffix] = (
+                default_storage.url(path) if path else original
+            )
+    if request is not None:
+        urls = {
+            name: request.build_absolute_uri(url)
+            for name, url in urls.items()
+        }
+    return urls
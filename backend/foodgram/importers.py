@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import os
+from functools import partial
+from itertools import islice
+
+from django.db import connection, transaction
+from foodgram import reference
+from foodgram.models import Ingredient, normalize_name
+
+BLOCK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n,[]'
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        elif row:
+            yield row[0], ''
+
+
+def read_json(file, block_size=BLOCK_SIZE):
+    # Accepts a top-level array of objects or JSON lines and decodes one
+    # object at a time, so the whole file is never held in memory.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for block in iter(partial(file.read, block_size), ''):
+        buffer += block
+        position = 0
+        while True:
+            while (position < len(buffer)
+                   and buffer[position] in JSON_SEPARATORS):
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if isinstance(item, dict):
+                yield item.get('name', ''), item.get('measurement_unit', '')
+            else:
+                yield tuple(item[:2])
+        buffer = buffer[position:]
+    if buffer.strip(JSON_SEPARATORS):
+        raise ValueError('Malformed JSON near: ' + buffer[:50])
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_json,
+}
+
+
+def detect_format(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.inserted = 0
+
+    @property
+    def existing(self):
+        return self.read - self.duplicates - self.invalid - self.inserted
+
+
+def clean_rows(rows, stats):
+    seen = set()
+    for name, unit in rows:
+        stats.read += 1
+        name, unit = str(name).strip(), str(unit).strip()
+        if (not name or not unit or len(name) > NAME_MAX_LENGTH
+                or len(unit) > UNIT_MAX_LENGTH):
+            stats.invalid += 1
+            continue
+        if (name, unit) in seen:
+            stats.duplicates += 1
+            continue
+        seen.add((name, unit))
+        yield name, unit
+
+
+def write_bulk(chunk):
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit,
+                    search_name=normalize_name(name))
+         for name, unit in chunk),
+        ignore_conflicts=True
+    )
+
+
+def write_copy(chunk):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (name, unit, normalize_name(name)) for name, unit in chunk
+    )
+    buffer.seek(0)
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS ingredient_import '
+            '(name varchar(200), measurement_unit varchar(200), '
+            'search_name varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        cursor.execute('TRUNCATE ingredient_import')
+        cursor.copy_expert(
+            'COPY ingredient_import (name, measurement_unit, search_name) '
+            'FROM STDIN WITH CSV', buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit, search_name) '
+            'SELECT name, measurement_unit, search_name '
+            'FROM ingredient_import '
+            'ON CONFLICT DO NOTHING'
+        )
+
+
+def import_ingredients(file, file_format, batch_size=5000, method='auto'):
+    if method == 'auto':
+        method = 'copy' if connection.vendor == 'postgresql' else 'bulk'
+    write = write_copy if method == 'copy' else write_bulk
+    stats = ImportStats()
+    before = Ingredient.objects.count()
+    rows = clean_rows(READERS[file_format](file), stats)
+    for chunk in chunked(rows, batch_size):
+        with transaction.atomic():
+            write(chunk)
+    stats.inserted = Ingredient.objects.count() - before
+    if stats.inserted:
+        reference.ingredients.bump()
+    return stats
@@ -0,0 +1,107 @@
+import json
+import platform
+from dataclasses import asdict, fields
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from foodgram import benchmark
+
+ROW_FORMAT = '{:<26} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the API benchmark against a throwaway test database and check '
+        'query budgets'
+    )
+
+    def add_arguments(self, parser):
+        for dataset_field in fields(benchmark.Dataset):
+            parser.add_argument(
+                f'--{dataset_field.name.replace("_", "-")}', type=int,
+                default=dataset_field.default,
+                dest=dataset_field.name,
+            )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Run only the named endpoint (may be repeated)'
+        )
+        parser.add_argument('--output', help='Write results to a JSON file')
+        parser.add_argument('--label', default='')
+        parser.add_argument(
+            '--no-budget-check', action='store_true',
+            help='Do not fail when an endpoint exceeds its query budget'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = benchmark.ENDPOINTS
+        if options['endpoints']:
+            endpoints = tuple(
+                endpoint for endpoint in endpoints
+                if endpoint.name in options['endpoints']
+            )
+            if not endpoints:
+                raise CommandError('No endpoints match the given names')
+        dataset = benchmark.Dataset(**{
+            dataset_field.name: options[dataset_field.name]
+            for dataset_field in fields(benchmark.Dataset)
+        })
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            fixtures = benchmark.seed(dataset)
+            results = benchmark.run(
+                fixtures, endpoints,
+                repeat=options['repeat'], warmup=options['warmup']
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.print_results(results)
+        report = {
+            'meta': {
+                'label': options['label'],
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repeat': options['repeat'],
+                'dataset': asdict(dataset),
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        failed = benchmark.over_budget(results)
+        if failed and not options['no_budget_check']:
+            raise CommandError('Query budget exceeded: ' + ', '.join(
+                f'{name} ({result["queries"]}/{result["budget"]} queries, '
+                f'statuses {result["statuses"]})'
+                for name, result in failed.items()
+            ))
+
+    def print_results(self, results):
+        self.stdout.write(ROW_FORMAT.format(
+            'endpoint', 'queries', 'budget', 'db ms', 'p50 ms', 'p95 ms',
+            'p99 ms'
+        ))
+        for name, result in results.items():
+            line = ROW_FORMAT.format(
+                name, result['queries'], result['budget'], result['db_ms'],
+                result['p50_ms'], result['p95_ms'], result['p99_ms']
+            )
+            if result['queries'] > result['budget'] or not result['ok']:
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
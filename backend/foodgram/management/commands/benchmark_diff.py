@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+METRICS = ('queries', 'db_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+ROW_FORMAT = '{:<26} {:<8} {:>10} {:>10} {:>9}'
+
+
+class Command(BaseCommand):
+    help = 'Compare two benchmark result files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('candidate')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Latency regression threshold in percent'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when a regression is found'
+        )
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+    def handle(self, *args, **options):
+        baseline = self.load(options['baseline'])
+        candidate = self.load(options['candidate'])
+        regressions = []
+        self.stdout.write(ROW_FORMAT.format(
+            'endpoint', 'metric', 'baseline', 'candidate', 'change'
+        ))
+        for name in sorted(baseline.keys() | candidate.keys()):
+            if name not in baseline or name not in candidate:
+                side = 'baseline' if name in baseline else 'candidate'
+                self.stdout.write(
+                    self.style.WARNING(f'{name}: only in {side}')
+                )
+                continue
+            for metric in METRICS:
+                before = baseline[name][metric]
+                after = candidate[name][metric]
+                change = (after - before) / before * 100 if before else 0.0
+                regressed = (
+                    after > before if metric == 'queries'
+                    else change > options['threshold']
+                )
+                line = ROW_FORMAT.format(
+                    name, metric, before, after, f'{change:+.1f}%'
+                )
+                if regressed:
+                    regressions.append(f'{name} {metric}')
+                    line = self.style.ERROR(line)
+                elif after < before:
+                    line = self.style.SUCCESS(line)
+                self.stdout.write(line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError('Regressions: ' + ', '.join(regressions))
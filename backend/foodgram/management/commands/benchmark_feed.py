@@ -0,0 +1,148 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from foodgram import benchmark, counters, feed
+from foodgram.models import Follow, Recipe
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+ROW_FORMAT = '{:>9} {:<13} {:>10} {:>8} {:>9} {:>9}'
+# Each strategy is measured with its fan-out cap: "read" never fans out,
+# "write" fans out to every follower and "write-capped" treats the
+# measured author as too popular, so its recipes are merged on read.
+SCENARIOS = (
+    ('read', feed.READ, lambda followers: 0),
+    ('write', feed.WRITE, lambda followers: followers),
+    ('write-capped', feed.WRITE, lambda followers: followers - 1),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare fan-out-on-read and fan-out-on-write feeds for authors '
+        'with different follower counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--followers', type=int, nargs='+', default=[10, 100, 1000],
+            help='Follower counts of the publishing author'
+        )
+        parser.add_argument(
+            '--following', type=int, default=50,
+            help='Authors followed by the reader'
+        )
+        parser.add_argument('--recipes-per-author', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--output', help='Write results to a JSON file')
+
+    def handle(self, *args, **options):
+        if options['following'] < 1 or min(options['followers']) < 1:
+            raise CommandError('--following and --followers must be positive')
+        self.options = options
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            results = self.run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def run(self):
+        options = self.options
+        User.objects.bulk_create(
+            User(username=f'author{index}', email=f'author{index}@f.com')
+            for index in range(options['following'])
+        )
+        authors = list(User.objects.filter(username__startswith='author'))
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'{author} {index}', text='text',
+                   cooking_time=1, image='recipes/feed.png')
+            for index in range(options['recipes_per_author'])
+            for author in authors
+        )
+        reader = User.objects.create(username='reader', email='r@f.com')
+        Follow.objects.bulk_create(
+            Follow(user=reader, following=author) for author in authors
+        )
+        self.client = Client(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=reader)}'
+        )
+        author = authors[0]
+        results = []
+        self.stdout.write(ROW_FORMAT.format(
+            'followers', 'strategy', 'publish ms', 'queries', 'p50 ms',
+            'p95 ms'
+        ))
+        created = 1
+        for followers in sorted(options['followers']):
+            User.objects.bulk_create(
+                User(username=f'follower{index}', email=f'{index}@f.com')
+                for index in range(created, followers)
+            )
+            Follow.objects.bulk_create(
+                Follow(user=user, following=author)
+                for user in User.objects.filter(
+                    username__startswith='follower'
+                ).exclude(subscriptions__following=author)
+            )
+            created = max(created, followers)
+            counters.reconcile()
+            for name, strategy, cap in SCENARIOS:
+                with override_settings(
+                    FEED_FANOUT_MAX_FOLLOWERS=cap(followers)
+                ):
+                    result = self.measure(author, strategy)
+                result.update(followers=followers, strategy=name)
+                results.append(result)
+                self.stdout.write(ROW_FORMAT.format(
+                    followers, name, result['publish_ms'],
+                    result['queries'], result['p50_ms'], result['p95_ms']
+                ))
+        return results
+
+    def measure(self, author, strategy):
+        feed.rebuild()
+        recipe = Recipe.objects.create(
+            author=author, name='new', text='text', cooking_time=1,
+            image='recipes/feed.png'
+        )
+        started = time.perf_counter()
+        feed.publish(recipe)
+        publish_ms = (time.perf_counter() - started) * 1000
+        path = f'/api/recipes/feed/?strategy={strategy}'
+        path += f'&limit={self.options["limit"]}'
+        timings, queries = [], []
+        for _ in range(self.options['repeat']):
+            timer = benchmark.QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = self.client.get(path)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{path} returned {response.status_code}')
+            if response.data['results'][0]['id'] != recipe.id:
+                raise CommandError(f'{path} does not start with new recipe')
+            queries.append(timer.count)
+        return {
+            'publish_ms': round(publish_ms, 3),
+            'queries': max(queries),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p50_ms': round(benchmark.percentile(timings, 50), 3),
+            'p95_ms': round(benchmark.percentile(timings, 95), 3),
+        }
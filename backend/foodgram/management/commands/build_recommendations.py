@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from foodgram import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild co-favorite recipe neighbours from favorites'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int,
+            default=settings.RECOMMENDATION_NEIGHBOURS
+        )
+        parser.add_argument(
+            '--min-common', type=int,
+            default=settings.RECOMMENDATION_MIN_COMMON_USERS
+        )
+        parser.add_argument(
+            '--max-pairs', type=int, default=settings.RECOMMENDATION_MAX_PAIRS
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            recipes, neighbours = recommendations.build(
+                size=options['neighbours'],
+                min_common=options['min_common'],
+                max_pairs=options['max_pairs'],
+                batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {neighbours} neighbours for {recipes} recipes '
+            f'({time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from foodgram import benchmark, explain
+
+
+class Command(BaseCommand):
+    help = (
+        'Run every API endpoint against the current database, EXPLAIN the '
+        'heaviest statements and propose indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Username to run the endpoints as'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Run only the named endpoint (may be repeated)'
+        )
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Number of slowest statements to EXPLAIN'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Do not propose indexes for smaller tables'
+        )
+        parser.add_argument('--output', help='Write the report to JSON')
+
+    def handle(self, *args, **options):
+        endpoints = benchmark.ENDPOINTS
+        if options['endpoints']:
+            endpoints = tuple(
+                endpoint for endpoint in endpoints
+                if endpoint.name in options['endpoints']
+            )
+            if not endpoints:
+                raise CommandError('No endpoints match the given names')
+        report = explain.run(
+            options['user'], endpoints, options['top'], options['min_rows']
+        )
+        if report is None:
+            raise CommandError(
+                'The database has no recipes, load them with generate_data'
+            )
+        for statement in report['statements']:
+            self.stdout.write(
+                f'{statement["duration_ms"]:>9.3f} ms '
+                f'{statement["endpoint"]}: {statement["sql"][:120]}'
+            )
+            for finding in statement['findings']:
+                self.stdout.write(self.style.WARNING(
+                    f'{"":>13}{finding["kind"]} {finding["table"]} '
+                    f'{finding["detail"]}'
+                ))
+        if not report['proposals']:
+            self.stdout.write(self.style.SUCCESS('No indexes to propose'))
+        for proposal in report['proposals']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Index {proposal["table"]}'
+                f'({", ".join(proposal["columns"])}): '
+                f'{proposal["rows"]} rows, {", ".join(proposal["reasons"])} '
+                f'in {", ".join(proposal["endpoints"])}'
+            ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Report written to {options["output"]}')
@@ -0,0 +1,311 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from foodgram import cook, counters, feed, reference, shopping_totals
+from foodgram.importers import detect_format, import_ingredients
+from foodgram.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                             Recipe, ShoppingCart, Tag, TagRecipe)
+
+User = get_user_model()
+
+GENERATED_PASSWORD = 'foodgram-password'
+GENERATED_IMAGE = 'recipes/images/generated.png'
+TAG_NAMES = (
+    ('Завтрак', '#E26C2D'), ('Обед', '#49B64E'), ('Ужин', '#8775D2'),
+    ('Десерт', '#F2C12E'), ('Выпечка', '#C0392B'), ('Суп', '#2E86C1'),
+    ('Салат', '#27AE60'), ('Напиток', '#16A085'),
+)
+DISHES = (
+    'Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Омлет', 'Паста',
+    'Каша', 'Котлеты', 'Смузи', 'Плов', 'Блины',
+)
+EDGE_MODELS = {
+    'favorite': (Favorite, 'user_id', 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'user_id', 'recipe_id'),
+    'follow': (Follow, 'user_id', 'following_id'),
+    'ingredient_recipe': (
+        IngredientRecipe, 'recipe_id', 'ingredient_id', 'amount'
+    ),
+}
+
+
+class Zipf:
+    def __init__(self, size, exponent, rng):
+        weights = 1.0 / np.arange(1, size + 1) ** exponent
+        self.cdf = np.cumsum(weights / weights.sum())
+        self.ranking = rng.permutation(size)
+        self.rng = rng
+
+    def sample(self, count):
+        ranks = np.searchsorted(self.cdf, self.rng.random(count))
+        return self.ranking[np.minimum(ranks, len(self.ranking) - 1)]
+
+
+def insert_rows(label, rows, batch_size):
+    model, *columns = EDGE_MODELS[label]
+    for start in range(0, len(rows[0]), batch_size):
+        chunk = zip(*(
+            column[start:start + batch_size].tolist() for column in rows
+        ))
+        model.objects.bulk_create(
+            (model(**dict(zip(columns, values))) for values in chunk),
+            ignore_conflicts=True
+        )
+    return len(rows[0])
+
+
+def insert_rows_worker(arguments):
+    try:
+        return insert_rows(*arguments)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic production-shaped dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=len(TAG_NAMES))
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--shopping-cart', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Zipf exponent for popularity distributions'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Processes used to insert edges (Postgres only)'
+        )
+        parser.add_argument(
+            '--csv', default=os.path.join('data', 'ingredients.csv'),
+            help='Ingredient catalog used when the database has none'
+        )
+
+    def handle(self, *args, **options):
+        if options['min_ingredients'] > options['max_ingredients']:
+            raise CommandError('--min-ingredients exceeds --max-ingredients')
+        self.options = options
+        self.rng = np.random.default_rng(options['seed'])
+        self.workers = options['workers']
+        if self.workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite does not support concurrent writers, using 1 worker'
+            ))
+            self.workers = 1
+
+        ingredients = self.ensure_ingredients()
+        tags = self.create_tags()
+        users = self.create_users()
+        recipes, recipe_ingredients = self.create_recipes(users, ingredients)
+        self.insert('ingredient_recipe', recipe_ingredients)
+        self.create_tag_links(recipes, tags)
+        self.create_edges('favorite', users, recipes,
+                          options['favorites'])
+        self.create_edges('shopping_cart', users, recipes,
+                          options['shopping_cart'])
+        self.create_edges('follow', users, users, options['follows'])
+        self.rebuild_shopping_lists()
+        self.reconcile_counters()
+        self.rebuild_feeds()
+        reference.bump_all()
+        cook.invalidate()
+        self.stdout.write(self.style.SUCCESS('Synthetic data generated'))
+
+    def step(self, message, started):
+        self.stdout.write(f'{message} ({time.monotonic() - started:.1f}s)')
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            path = self.options['csv']
+            if not os.path.exists(path):
+                raise CommandError(f'{path} does not exist')
+            with open(path, encoding='utf-8') as file:
+                import_ingredients(
+                    file, detect_format(path),
+                    batch_size=self.options['batch_size']
+                )
+        return dict(Ingredient.objects.values_list('id', 'name'))
+
+    def create_tags(self):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            Tag(
+                name=TAG_NAMES[index % len(TAG_NAMES)][0]
+                + ('' if index < len(TAG_NAMES) else f' {index}'),
+                color=TAG_NAMES[index % len(TAG_NAMES)][1],
+                slug=f'tag-{index}',
+            )
+            for index in range(existing, self.options['tags'])
+        )
+        return np.array(Tag.objects.values_list('id', flat=True))
+
+    def new_ids(self, model, last_id):
+        return np.array(
+            model.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def create_users(self):
+        started = time.monotonic()
+        last_id = self.last_id(User)
+        offset = User.objects.count()
+        password = make_password(GENERATED_PASSWORD)
+        batch_size = self.options['batch_size']
+        total = self.options['users']
+        for start in range(0, total, batch_size):
+            User.objects.bulk_create(
+                User(
+                    username=f'user{offset + index}',
+                    email=f'user{offset + index}@example.com',
+                    first_name=f'Имя{offset + index}',
+                    last_name=f'Фамилия{offset + index}',
+                    password=password,
+                )
+                for index in range(start, min(start + batch_size, total))
+            )
+        users = self.new_ids(User, last_id)
+        self.step(f'Users: {len(users)}', started)
+        return users
+
+    def create_recipes(self, users, ingredients):
+        started = time.monotonic()
+        options = self.options
+        ingredient_ids = np.array(list(ingredients))
+        authors = Zipf(len(users), options['exponent'], self.rng)
+        popularity = Zipf(len(ingredient_ids), options['exponent'], self.rng)
+        sizes = self.rng.integers(
+            options['min_ingredients'], options['max_ingredients'] + 1,
+            options['recipes']
+        )
+        last_id = self.last_id(Recipe)
+        draws = ingredient_ids[popularity.sample(sizes.sum() * 2)].tolist()
+        chosen = []
+        recipes = []
+        offset = 0
+        for size in sizes.tolist():
+            picked = dict.fromkeys(draws[offset:offset + size * 2])
+            chosen.append(list(picked)[:size])
+            offset += size * 2
+        author_ids = users[authors.sample(options['recipes'])]
+        dishes = self.rng.integers(0, len(DISHES), options['recipes'])
+        cooking_times = self.rng.integers(5, 180, options['recipes'])
+        for index, recipe_ingredients in enumerate(chosen):
+            names = [ingredients[pk] for pk in recipe_ingredients[:2]]
+            recipes.append(Recipe(
+                author_id=int(author_ids[index]),
+                name=f'{DISHES[dishes[index]]}: {" и ".join(names)}'[:200],
+                text='Смешать: ' + ', '.join(
+                    ingredients[pk] for pk in recipe_ingredients
+                ) + '.',
+                cooking_time=int(cooking_times[index]),
+                image=GENERATED_IMAGE,
+            ))
+        Recipe.objects.bulk_create(
+            recipes, batch_size=options['batch_size']
+        )
+        recipe_ids = self.new_ids(Recipe, last_id)
+        self.step(f'Recipes: {len(recipe_ids)}', started)
+        counts = np.array([len(items) for items in chosen])
+        return recipe_ids, (
+            np.repeat(recipe_ids, counts),
+            np.array([pk for items in chosen for pk in items]),
+            self.rng.integers(1, 500, counts.sum()),
+        )
+
+    def rebuild_shopping_lists(self):
+        started = time.monotonic()
+        with transaction.atomic():
+            shopping_totals.rebuild()
+        self.step('Shopping list totals', started)
+
+    def reconcile_counters(self):
+        started = time.monotonic()
+        counters.reconcile(batch_size=self.options['batch_size'])
+        self.step('Counters', started)
+
+    def rebuild_feeds(self):
+        started = time.monotonic()
+        with transaction.atomic():
+            feed.rebuild()
+        self.step('Feed timelines', started)
+
+    def create_tag_links(self, recipes, tags):
+        if not len(tags) or not len(recipes):
+            return
+        started = time.monotonic()
+        counts = self.rng.integers(1, min(len(tags), 3) + 1, len(recipes))
+        recipe_ids = np.repeat(recipes, counts)
+        tag_ids = tags[self.rng.integers(0, len(tags), len(recipe_ids))]
+        pairs = np.unique(np.stack((recipe_ids, tag_ids)), axis=1)
+        with transaction.atomic():
+            for start in range(0, pairs.shape[1], self.options['batch_size']):
+                chunk = pairs[:, start:start + self.options['batch_size']]
+                TagRecipe.objects.bulk_create(
+                    TagRecipe(recipe_id=int(recipe), tag_id=int(tag))
+                    for recipe, tag in chunk.T
+                )
+        self.step(f'Recipe tags: {pairs.shape[1]}', started)
+
+    def create_edges(self, label, sources, targets, count):
+        if not count or not len(sources) or not len(targets):
+            return
+        started = time.monotonic()
+        exponent = self.options['exponent']
+        activity = Zipf(len(sources), exponent, self.rng)
+        popularity = Zipf(len(targets), exponent, self.rng)
+        capacity = len(sources) * len(targets)
+        count = min(count, capacity)
+        keys = np.empty(0, dtype=np.int64)
+        for attempt in range(20):
+            missing = count - len(keys)
+            if missing <= 0:
+                break
+            # Popular pairs repeat, so each retry draws more to fill the gap.
+            draws = max(missing * 2 ** (attempt + 1), 1000)
+            first = activity.sample(draws).astype(np.int64)
+            second = popularity.sample(draws).astype(np.int64)
+            if sources is targets:
+                keep = first != second
+                first, second = first[keep], second[keep]
+            keys = np.unique(np.concatenate(
+                (keys, first * len(targets) + second)
+            ))
+        keys = self.rng.permutation(keys)[:count]
+        rows = (sources[keys // len(targets)], targets[keys % len(targets)])
+        self.insert(label, rows)
+        self.step(f'{label}: {len(keys)}', started)
+
+    def insert(self, label, rows):
+        batch_size = self.options['batch_size']
+        if self.workers == 1:
+            with transaction.atomic():
+                return insert_rows(label, rows, batch_size)
+        chunks = [
+            tuple(column[index::self.workers] for column in rows)
+            for index in range(self.workers)
+        ]
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.workers) as pool:
+            return sum(pool.map(
+                insert_rows_worker,
+                [(label, chunk, batch_size) for chunk in chunks]
+            ))
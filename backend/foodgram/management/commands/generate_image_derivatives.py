@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from foodgram import images
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnails and WebP copies of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild derivatives that already exist'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.RECIPE_IMAGE_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_derivatives={})
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(images.generate_in_thread, recipe_ids))
+        else:
+            results = [images.generate_safely(pk) for pk in recipe_ids]
+        failed = sum(1 for result in results if result is None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(recipe_ids) - failed} of {len(recipe_ids)} '
+            f'recipes in {time.monotonic() - started:.1f}s'
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} images could not be read, see the log'
+            ))
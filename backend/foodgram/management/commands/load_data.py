@@ -1,33 +1,50 @@
 import os
+import time
 
-import pandas as pd
-from django.core.management.base import BaseCommand
-from foodgram.models import Ingredient
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from foodgram.importers import READERS, detect_format, import_ingredients
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients from CSV file'
+    help = 'Load ingredients from a CSV or JSON file'
 
-    def handle(self, *args, **options):
-        csv_file = os.path.join('data', 'ingredients.csv')
-        if not os.path.exists(csv_file):
-            self.stdout.write(self.style.ERROR('CSV file does not exist'))
-            return
-
-        df = pd.read_csv(
-            csv_file, names=['name', 'measurement_unit'], header=None
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join('data', 'ingredients.csv')
+        )
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='File format, detected from the extension by default'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--method', choices=('auto', 'bulk', 'copy'), default='auto',
+            help='copy uses COPY FROM STDIN and requires PostgreSQL'
         )
 
-        for index, row in df.iterrows():
-            ingredient, created = Ingredient.objects.get_or_create(
-                name=row['name'].strip(),
-                measurement_unit=row['measurement_unit'].strip(),
-            )
-            if created:
-                self.stdout.write(
-                    self.style.SUCCESS(f'Successfully created {ingredient}')
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'{ingredient} already exists')
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        file_format = options['format'] or detect_format(path)
+        if file_format not in READERS:
+            raise CommandError(f'Unsupported format: {file_format}')
+        if options['method'] == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('--method copy requires PostgreSQL')
+
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            try:
+                stats = import_ingredients(
+                    file, file_format, batch_size=options['batch_size'],
+                    method=options['method']
                 )
+            except ValueError as error:
+                raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {stats.read} rows in {time.monotonic() - started:.1f}s: '
+            f'{stats.inserted} created, {stats.existing} already existed, '
+            f'{stats.duplicates} duplicates, {stats.invalid} invalid'
+        ))
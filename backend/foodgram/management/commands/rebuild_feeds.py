@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from foodgram import feed
+
+
+class Command(BaseCommand):
+    help = 'Refill fan-out-on-write feed timelines from follows'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            feed.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Feed timelines rebuilt in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from foodgram import shopping_totals
+
+
+class Command(BaseCommand):
+    help = 'Verify or rebuild materialized shopping list totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare stored totals with the live aggregation'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Limit to the given user id, may be repeated'
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help='Number of mismatches printed with --verify'
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        started = time.monotonic()
+        if not options['verify']:
+            with transaction.atomic():
+                shopping_totals.rebuild(users)
+            self.stdout.write(self.style.SUCCESS(
+                f'Shopping lists rebuilt in {time.monotonic() - started:.1f}s'
+            ))
+            return
+
+        mismatches = 0
+        for user, ingredient, expected, actual in (
+            shopping_totals.find_drift(users)
+        ):
+            mismatches += 1
+            if mismatches <= options['show']:
+                self.stdout.write(
+                    f'user {user} ingredient {ingredient}: '
+                    f'expected {expected}, stored {actual}'
+                )
+        if mismatches:
+            raise CommandError(
+                f'{mismatches} shopping list totals differ from the carts, '
+                'run rebuild_shopping_lists to fix them'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping lists match the carts '
+            f'({time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from foodgram import counters
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized recipe and user counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report how many rows have drifted'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        fixed = counters.reconcile(
+            batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {fixed["recipes"]} recipes and {fixed["users"]} users '
+            f'with stale counters ({time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from foodgram import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for total in search.reindex(batch_size=options['batch_size']):
+            self.stdout.write(f'{total} recipes indexed')
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed {total} recipes ({time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:01
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('foodgram', 'Ingredient')
+    IngredientRecipe = apps.get_model('foodgram', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=models.Min('id'), total=models.Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        extra_ids = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=duplicate['keep_id']).values_list('id', flat=True)
+        IngredientRecipe.objects.filter(ingredient_id__in=extra_ids).update(
+            ingredient_id=duplicate['keep_id']
+        )
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0010_alter_recipe_ingredients'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
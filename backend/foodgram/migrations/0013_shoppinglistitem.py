@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    schema_editor.execute(
+        'INSERT INTO foodgram_shoppinglistitem '
+        '(user_id, ingredient_id, amount) '
+        'SELECT cart.user_id, item.ingredient_id, '
+        'SUM(COALESCE(item.amount, 0)) '
+        'FROM foodgram_shoppingcart cart '
+        'JOIN foodgram_ingredientrecipe item '
+        'ON item.recipe_id = cart.recipe_id '
+        'GROUP BY cart.user_id, item.ingredient_id '
+        'HAVING SUM(COALESCE(item.amount, 0)) > 0'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram', '0012_ingredient_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(help_text='Суммарное количество по всем рецептам в списке покупок', verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(help_text='Ингредиент из рецептов в списке покупок', on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='foodgram.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(help_text='Владелец списка покупок', on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    schema_editor.execute(
+        'UPDATE foodgram_recipe SET '
+        'favorites_count = (SELECT COUNT(*) FROM foodgram_favorite '
+        'WHERE foodgram_favorite.recipe_id = foodgram_recipe.id), '
+        'in_carts_count = (SELECT COUNT(*) FROM foodgram_shoppingcart '
+        'WHERE foodgram_shoppingcart.recipe_id = foodgram_recipe.id)'
+    )
+    users = apps.get_model('auth', 'User')._meta.db_table
+    schema_editor.execute(
+        'INSERT INTO foodgram_userstats '
+        '(user_id, recipes_count, followers_count) '
+        'SELECT users.id, '
+        '(SELECT COUNT(*) FROM foodgram_recipe '
+        'WHERE foodgram_recipe.author_id = users.id), '
+        '(SELECT COUNT(*) FROM foodgram_follow '
+        'WHERE foodgram_follow.following_id = users.id) '
+        f'FROM {users} users'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('foodgram', '0014_recipe_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auth.user', verbose_name='Пользователь')),
+                ('recipes_count', models.PositiveIntegerField(default=0, help_text='Количество рецептов пользователя', verbose_name='Рецептов')),
+                ('followers_count', models.PositiveIntegerField(default=0, help_text='Количество подписчиков пользователя', verbose_name='Подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователя',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в избранное', verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Сколько пользователей добавили рецепт в список покупок', verbose_name='Добавлений в покупки'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0016_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути уменьшенных копий изображения по размерам', verbose_name='Производные изображения'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0017_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tagrecipe',
+            index=models.Index(fields=['recipe', 'tag'], name='tag_recipe_recipe_tag_idx'),
+        ),
+        migrations.AlterField(
+            model_name='tagrecipe',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, help_text='Рецепт', on_delete=django.db.models.deletion.CASCADE, to='foodgram.recipe', verbose_name='Рецепт'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations
+
+# The SQL is frozen here rather than taken from foodgram.search, so later
+# changes to the runtime module can't alter what this migration does. The
+# Postgres search_vector column is deliberately left out of the model
+# state: it is only read through raw SQL and SQLite has no such column.
+NORMALIZED = "replace(replace(coalesce({}, ''), 'ё', 'е'), 'Ё', 'Е')"
+VECTOR = (
+    f"setweight(to_tsvector('russian', {NORMALIZED.format('{row}.name')}), "
+    "'A') || "
+    f"setweight(to_tsvector('russian', {NORMALIZED.format('{row}.text')}), "
+    "'B')"
+)
+POSTGRES_INSTALL = (
+    'ALTER TABLE foodgram_recipe ADD COLUMN IF NOT EXISTS search_vector '
+    'tsvector',
+    'CREATE OR REPLACE FUNCTION foodgram_recipe_search_vector() '
+    'RETURNS trigger AS $$ BEGIN '
+    f'NEW.search_vector := {VECTOR.format(row="NEW")}; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_vector ON foodgram_recipe',
+    'CREATE TRIGGER foodgram_recipe_search_vector BEFORE INSERT OR UPDATE '
+    'OF name, text ON foodgram_recipe FOR EACH ROW '
+    'EXECUTE PROCEDURE foodgram_recipe_search_vector()',
+    'UPDATE foodgram_recipe SET search_vector = '
+    f'{VECTOR.format(row="foodgram_recipe")} WHERE search_vector IS NULL',
+    'CREATE INDEX IF NOT EXISTS foodgram_recipe_search_vector_idx '
+    'ON foodgram_recipe USING GIN (search_vector)',
+)
+POSTGRES_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_vector ON foodgram_recipe',
+    'DROP FUNCTION IF EXISTS foodgram_recipe_search_vector()',
+    'ALTER TABLE foodgram_recipe DROP COLUMN IF EXISTS search_vector',
+)
+SQLITE_ROW = (
+    'INSERT INTO foodgram_recipe_search(rowid, name, text) SELECT '
+    f"{{row}}.id, {NORMALIZED.format('{row}.name')}, "
+    f"{NORMALIZED.format('{row}.text')}"
+)
+SQLITE_INSTALL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS foodgram_recipe_search '
+    "USING fts5(name, text, tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS foodgram_recipe_search_insert '
+    'AFTER INSERT ON foodgram_recipe BEGIN '
+    f'{SQLITE_ROW.format(row="new")}; END',
+    'CREATE TRIGGER IF NOT EXISTS foodgram_recipe_search_delete '
+    'AFTER DELETE ON foodgram_recipe BEGIN '
+    'DELETE FROM foodgram_recipe_search WHERE rowid = old.id; END',
+    'CREATE TRIGGER IF NOT EXISTS foodgram_recipe_search_update '
+    'AFTER UPDATE OF name, text ON foodgram_recipe BEGIN '
+    'DELETE FROM foodgram_recipe_search WHERE rowid = old.id; '
+    f'{SQLITE_ROW.format(row="new")}; END',
+    'DELETE FROM foodgram_recipe_search',
+    f'{SQLITE_ROW.format(row="foodgram_recipe")} FROM foodgram_recipe',
+)
+SQLITE_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_insert',
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_delete',
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_update',
+    'DROP TABLE IF EXISTS foodgram_recipe_search',
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0018_tagrecipe_recipe_tag_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            run({'postgresql': POSTGRES_UNINSTALL,
+                 'sqlite': SQLITE_UNINSTALL}),
+        ),
+    ]
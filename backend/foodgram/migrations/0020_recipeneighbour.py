@@ -0,0 +1,35 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0019_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='Косинусная мера по пользователям, добавившим оба рецепта', verbose_name='Сходство')),
+                ('neighbour', models.ForeignKey(help_text='Рецепт, который часто добавляют в избранное вместе с ним', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='foodgram.recipe', verbose_name='Похожий рецепт')),
+                ('recipe', models.ForeignKey(help_text='Рецепт, для которого подобраны похожие', on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='foodgram.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeneighbour',
+            index=models.Index(fields=['recipe', '-score'], name='recipe_neighbour_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeneighbour',
+            constraint=models.UniqueConstraint(fields=('recipe', 'neighbour'), name='unique_recipe_neighbour'),
+        ),
+    ]
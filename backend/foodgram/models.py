@@ -6,6 +6,10 @@ from django.db import models
 User = get_user_model()
 
 
+def normalize_name(value):
+    return value.lower().replace('ё', 'е')
+
+
 class Ingredient(models.Model):
     name = models.CharField(
         verbose_name='Название ингредиента', max_length=200,
@@ -15,14 +19,33 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения', max_length=200,
         help_text='Единица измерения ингредиента'
     )
+    search_name = models.CharField(
+        verbose_name='Название для поиска', max_length=200, editable=False,
+        help_text='Название в нижнем регистре с заменой ё на е'
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'), name='unique_ingredient'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('search_name',), name='ingredient_search_name_idx',
+                opclasses=('varchar_pattern_ops',)
+            ),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -43,6 +66,82 @@ class Tag(models.Model):
         return self.name
 
 
+# The serialized field each annotation of with_user_flags() is read by.
+USER_FLAGS = {
+    'is_favorited': 'is_favorited',
+    'is_in_shopping_cart': 'is_in_shopping_cart',
+    'is_author_subscribed': 'author',
+}
+
+
+class RecipeQuerySet(models.QuerySet):
+    # ``fields`` is the set of serialized fields, None stands for all of
+    # them. Whatever no field needs is neither joined nor prefetched.
+    def with_related(self, fields=None):
+        queryset = self
+        if fields is None or 'author' in fields:
+            queryset = queryset.select_related('author')
+        if fields is not None and 'text' not in fields:
+            queryset = queryset.defer('text')
+        lookups = []
+        if fields is None or 'tags' in fields:
+            lookups.append('tags')
+        if fields is None or 'ingredients' in fields:
+            lookups.append(models.Prefetch(
+                'recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ))
+        return queryset.prefetch_related(*lookups)
+
+    def with_user_flags(self, user, fields=None):
+        if not user.is_authenticated:
+            return self
+        flags = {
+            'is_favorited': models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            'is_in_shopping_cart': models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            'is_author_subscribed': models.Exists(Follow.objects.filter(
+                user=user, following=models.OuterRef('author')
+            )),
+        }
+        return self.annotate(**{
+            name: flag for name, flag in flags.items()
+            if fields is None or USER_FLAGS[name] in fields
+        })
+
+    def latest_by_author(self, author_ids, limit=None):
+        # One query for every author on a page: ROW_NUMBER() keeps the
+        # newest ``limit`` recipes of each author.
+        previews = {author_id: [] for author_id in author_ids}
+        if not previews:
+            return previews
+        table = self.model._meta.db_table
+        placeholders = ', '.join(['%s'] * len(previews))
+        if limit is None:
+            recipes = self.filter(author_id__in=previews).order_by(
+                'author_id', '-pub_date', '-id'
+            )
+        else:
+            recipes = self.raw(
+                'SELECT id, author_id, name, image, image_derivatives, '
+                'cooking_time FROM ('
+                'SELECT id, author_id, name, image, image_derivatives, '
+                'cooking_time, pub_date, '
+                'ROW_NUMBER() OVER (PARTITION BY author_id '
+                'ORDER BY pub_date DESC, id DESC) AS position '
+                f'FROM {table} WHERE author_id IN ({placeholders})'
+                ') ranked WHERE position <= %s '
+                'ORDER BY author_id, position',
+                [*previews, limit]
+            )
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -82,12 +181,40 @@ class Recipe(models.Model):
         auto_now_add=True, verbose_name='Время публикации',
         help_text='Время публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Время изменения',
+        help_text='Время последнего изменения рецепта'
+    )
     image = models.ImageField(
         verbose_name='Изображение', help_text='Изображение рецепта'
     )
+    image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Производные изображения',
+        help_text='Пути уменьшенных копий изображения по размерам'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлений в избранное',
+        help_text='Сколько пользователей добавили рецепт в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлений в покупки',
+        help_text='Сколько пользователей добавили рецепт в список покупок'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -117,10 +244,74 @@ class Follow(models.Model):
                 name='not_self_follow'
             )
         )
+        indexes = (
+            models.Index(fields=('user', '-id'), name='follow_user_id_idx'),
+        )
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
 
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='stats', verbose_name='Пользователь'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name='Рецептов',
+        help_text='Количество рецептов пользователя'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков',
+        help_text='Количество подписчиков пользователя'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.user}: {self.recipes_count}/{self.followers_count}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed_entries',
+        verbose_name='Подписчик', help_text='Владелец ленты'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='feed_entries',
+        verbose_name='Рецепт', help_text='Рецепт в ленте'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Автор', help_text='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Время публикации', help_text='Время публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_timeline_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'), name='feed_entry_author_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
 class TagRecipe(models.Model):
     tag = models.ForeignKey(
         Tag, on_delete=models.CASCADE, verbose_name='Теги',
@@ -128,12 +319,17 @@ class TagRecipe(models.Model):
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name='Рецепт',
-        help_text='Рецепт'
+        help_text='Рецепт', db_index=False
     )
 
     class Meta:
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
+        indexes = (
+            models.Index(
+                fields=('recipe', 'tag'), name='tag_recipe_recipe_tag_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.tag} {self.recipe}'
@@ -229,3 +425,71 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} added {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_items',
+        help_text='Владелец списка покупок'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        help_text='Ингредиент из рецептов в списке покупок'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+        help_text='Суммарное количество по всем рецептам в списке покупок'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} — {self.amount}'
+
+
+class RecipeNeighbour(models.Model):
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='neighbours',
+        verbose_name='Рецепт',
+        help_text='Рецепт, для которого подобраны похожие'
+    )
+    neighbour = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Похожий рецепт',
+        help_text='Рецепт, который часто добавляют в избранное вместе с ним'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+        help_text='Косинусная мера по пользователям, добавившим оба рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'neighbour'), name='unique_recipe_neighbour'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'), name='recipe_neighbour_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} → {self.neighbour}'
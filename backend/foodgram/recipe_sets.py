@@ -0,0 +1,61 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from foodgram import counters, shopping_totals
+from foodgram.models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def add(model, user, recipe_ids):
+    # Concurrent requests for the same pair are settled by the unique
+    # constraint: only the request that inserted the row gets it back.
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {model._meta.db_table} '
+            '(user_id, recipe_id, created_at) '
+            f'SELECT %s, id, %s FROM {Recipe._meta.db_table} '
+            f'WHERE id IN ({placeholders(recipe_ids)}) '
+            'ON CONFLICT (user_id, recipe_id) DO NOTHING RETURNING recipe_id',
+            [user.id,
+             connection.ops.adapt_datetimefield_value(timezone.now()),
+             *recipe_ids]
+        )
+        added = sorted(row[0] for row in cursor.fetchall())
+        changed(model, user, added, 1)
+    return added
+
+
+def remove(model, user, recipe_ids):
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table} WHERE user_id = %s '
+            f'AND recipe_id IN ({placeholders(recipe_ids)}) '
+            'RETURNING recipe_id',
+            [user.id, *recipe_ids]
+        )
+        removed = sorted(row[0] for row in cursor.fetchall())
+        changed(model, user, removed, -1)
+    return removed
+
+
+def changed(model, user, recipe_ids, delta):
+    # Raw statements bypass the model signals, so the denormalized data
+    # is updated here for exactly the rows that changed.
+    if not recipe_ids:
+        return
+    counters.change_recipes(recipe_ids, **{COUNTERS[model]: delta})
+    if model is ShoppingCart:
+        shopping_totals.recipes_changed(user, recipe_ids, delta)
@@ -0,0 +1,154 @@
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from foodgram.models import Favorite, RecipeNeighbour
+
+FETCH_SIZE = 100000
+FAVORITES = Favorite._meta.db_table
+
+
+def fetch_favorites(max_user_favorites):
+    # Users with more favorites than the limit only bring their newest
+    # ones: the pairs of one user grow with the square of their favorites.
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT user_id, recipe_id FROM {FAVORITES} '
+            'ORDER BY user_id, created_at DESC, id DESC'
+        )
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    if not chunks:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(chunks)
+    starts = np.r_[0, np.flatnonzero(np.diff(pairs[:, 0])) + 1]
+    sizes = np.diff(np.r_[starts, len(pairs)])
+    positions = np.arange(len(pairs)) - np.repeat(starts, sizes)
+    return pairs[positions < max_user_favorites]
+
+
+def ranges(starts, lengths):
+    # Indexes of the concatenated slices [start, start + length).
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+class FavoriteMatrix:
+    # The user × recipe matrix is kept as two compressed sparse layouts:
+    # the recipes of every user and the users of every recipe.
+    def __init__(self, pairs):
+        users = np.unique(pairs[:, 0], return_inverse=True)[1]
+        self.recipe_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+        self.user_sizes = np.bincount(users)
+        self.user_offsets = np.r_[0, np.cumsum(self.user_sizes)]
+        self.user_recipes = columns[np.argsort(users, kind='stable')]
+        self.recipe_sizes = np.bincount(columns)
+        self.recipe_offsets = np.r_[0, np.cumsum(self.recipe_sizes)]
+        self.recipe_users = users[np.argsort(columns, kind='stable')]
+
+    def chunks(self, max_pairs):
+        # A recipe produces one pair per favorite of each of its users,
+        # recipes are grouped so that a chunk stays under ``max_pairs``.
+        costs = np.bincount(
+            np.repeat(np.arange(len(self.recipe_ids)), self.recipe_sizes),
+            weights=self.user_sizes[self.recipe_users],
+            minlength=len(self.recipe_ids)
+        )
+        start, total = 0, 0
+        for column, cost in enumerate(costs.tolist()):
+            if total and total + cost > max_pairs:
+                yield start, column
+                start, total = column, 0
+            total += cost
+        if start < len(self.recipe_ids):
+            yield start, len(self.recipe_ids)
+
+    def neighbours(self, start, stop, size, min_common):
+        first, last = self.recipe_offsets[start], self.recipe_offsets[stop]
+        users = self.recipe_users[first:last]
+        lengths = self.user_sizes[users]
+        left = np.repeat(
+            np.repeat(np.arange(start, stop), self.recipe_sizes[start:stop]),
+            lengths
+        )
+        right = self.user_recipes[ranges(self.user_offsets[users], lengths)]
+        other = left != right
+        keys, common = np.unique(
+            left[other] * len(self.recipe_ids) + right[other],
+            return_counts=True
+        )
+        keep = common >= min_common
+        keys, common = keys[keep], common[keep]
+        left, right = np.divmod(keys, len(self.recipe_ids))
+        scores = common / np.sqrt(
+            self.recipe_sizes[left] * self.recipe_sizes[right]
+        )
+        order = np.lexsort((right, -scores, left))
+        left, right, scores = left[order], right[order], scores[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(left)) + 1]
+        ranks = np.arange(len(left)) - np.repeat(
+            starts, np.diff(np.r_[starts, len(left)])
+        )
+        top = ranks < size
+        return (
+            self.recipe_ids[left[top]], self.recipe_ids[right[top]],
+            scores[top]
+        )
+
+
+def build(size=None, min_common=None, max_pairs=None,
+          max_user_favorites=None, batch_size=1000):
+    size = size or settings.RECOMMENDATION_NEIGHBOURS
+    min_common = min_common or settings.RECOMMENDATION_MIN_COMMON_USERS
+    max_pairs = max_pairs or settings.RECOMMENDATION_MAX_PAIRS
+    matrix = FavoriteMatrix(fetch_favorites(
+        max_user_favorites or settings.RECOMMENDATION_MAX_USER_FAVORITES
+    ))
+    RecipeNeighbour.objects.all().delete()
+    recipes, total = set(), 0
+    for start, stop in matrix.chunks(max_pairs):
+        recipe_ids, neighbour_ids, scores = matrix.neighbours(
+            start, stop, size, min_common
+        )
+        rows = list(zip(
+            recipe_ids.tolist(), neighbour_ids.tolist(), scores.tolist()
+        ))
+        for position in range(0, len(rows), batch_size):
+            RecipeNeighbour.objects.bulk_create(
+                RecipeNeighbour(
+                    recipe_id=recipe_id, neighbour_id=neighbour_id,
+                    score=score
+                )
+                for recipe_id, neighbour_id, score
+                in rows[position:position + batch_size]
+            )
+        recipes.update(recipe_ids.tolist())
+        total += len(rows)
+    return len(recipes), total
+
+
+def similar(recipe_id, limit):
+    return list(
+        RecipeNeighbour.objects.filter(recipe_id=recipe_id)
+        .order_by('-score', 'neighbour_id')
+        .values_list('neighbour_id', flat=True)[:limit]
+    )
+
+
+def recommended(user, limit):
+    # Neighbours of the user's newest favorites, summed over the
+    # favorites they were found through, without what is already there.
+    favorites = Favorite.objects.filter(user=user)
+    return list(
+        RecipeNeighbour.objects.filter(recipe_id__in=favorites.order_by(
+            '-created_at', '-id'
+        ).values('recipe_id')[:settings.RECOMMENDATION_SOURCE_FAVORITES])
+        .exclude(neighbour_id__in=favorites.values('recipe_id'))
+        .values('neighbour_id').annotate(total=Sum('score'))
+        .order_by('-total', 'neighbour_id')
+        .values_list('neighbour_id', flat=True)[:limit]
+    )
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from foodgram.models import Ingredient, Tag
+from foodgram.serializers import IngredientSerializer, TagSerializer
+
+from backend import metrics
+
+
+class ReferenceData:
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'reference:{name}:version'
+        self.builders = {}
+        self.values = {}
+        self.version = None
+        self.loaded_at = 0.0
+        self.lock = threading.RLock()
+
+    def register(self, key):
+        def decorator(builder):
+            self.builders[key] = builder
+            return builder
+        return decorator
+
+    def current_version(self):
+        # A version lost by the cache restarts at a value never used
+        # before, data loaded under an old version can't match it.
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get(self, key):
+        version = self.current_version()
+        with self.lock:
+            # The TTL bounds staleness when the cache backend is not shared
+            # between worker processes.
+            expired = (
+                time.monotonic() - self.loaded_at
+                > settings.REFERENCE_CACHE_TTL
+            )
+            if version != self.version or expired:
+                self.values = {}
+                self.version = version
+                self.loaded_at = time.monotonic()
+            hit = key in self.values
+            if not hit:
+                self.values[key] = self.builders[key]()
+            metrics.cache_requests.inc(
+                cache=f'reference:{self.name}',
+                result='hit' if hit else 'miss'
+            )
+            return self.values[key]
+
+    def bump(self):
+        with self.lock:
+            self.values = {}
+            self.version = None
+        # A new value rather than incr(): some backends rewrite the key
+        # with the default timeout there, and none do it atomically.
+        cache.set(self.version_key, time.time_ns(), None)
+
+
+tags = ReferenceData('tags')
+ingredients = ReferenceData('ingredients')
+
+
+def bump_all():
+    tags.bump()
+    ingredients.bump()
+
+
+@tags.register('list')
+def build_tag_list():
+    return list(TagSerializer(Tag.objects.order_by('id'), many=True).data)
+
+
+@tags.register('by_id')
+def build_tags_by_id():
+    return {tag['id']: tag for tag in tags.get('list')}
+
+
+@tags.register('slug_to_id')
+def build_tag_slugs():
+    return {tag['slug']: tag['id'] for tag in tags.get('list')}
+
+
+@ingredients.register('list')
+def build_ingredient_list():
+    return list(IngredientSerializer(
+        Ingredient.objects.order_by('id'), many=True
+    ).data)
+
+
+@ingredients.register('by_id')
+def build_ingredients_by_id():
+    return {
+        ingredient['id']: ingredient
+        for ingredient in ingredients.get('list')
+    }
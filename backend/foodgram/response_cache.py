@@ -0,0 +1,193 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from foodgram import reference
+from foodgram.conditional import Validators
+from foodgram.models import Recipe, TagRecipe
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend import metrics
+
+LIST_PARAMS = ('page', 'limit', 'tags', 'author', 'fields', 'omit')
+VERSION_KEY = 'responses:version:{}'
+ENTRY_KEY = 'responses:{}:{}'
+AUTHOR_KEY = 'responses:author:{}'
+ALL = 'recipes'
+HEADER = 'X-Cache'
+PROCESS_LOCAL = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes] + [
+        reference.tags.version_key, reference.ingredients.version_key
+    ]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # A counter lost by the cache restarts at a value never used
+            # before, old entries can't match it.
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump(scopes):
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+        metrics.cache_invalidations.inc(
+            cache='responses', scope=scope.split(':')[0]
+        )
+
+
+def changed(scopes):
+    # Bumped at once and again after commit: a reader in between can only
+    # have stored the old data under the intermediate versions.
+    scopes = list(scopes)
+    bump(scopes)
+    transaction.on_commit(lambda: bump(scopes))
+
+
+def recipe_scopes(recipe_id, author_id, tag_ids):
+    return [
+        ALL, f'recipe:{recipe_id}', f'author:{author_id}',
+        *(f'tag:{tag_id}' for tag_id in sorted(set(tag_ids)))
+    ]
+
+
+def recipe_changed(recipe, tag_ids=None):
+    cache.set(
+        AUTHOR_KEY.format(recipe.id), recipe.author_id,
+        settings.RESPONSE_CACHE_TTL
+    )
+    if tag_ids is None:
+        tag_ids = TagRecipe.objects.filter(recipe=recipe).values_list(
+            'tag_id', flat=True
+        )
+    changed(recipe_scopes(recipe.id, recipe.author_id, tag_ids))
+
+
+def author_changed(author_id):
+    # Authors are shown in every list their recipes appear in.
+    changed([ALL, f'author:{author_id}', *(
+        f'tag:{tag_id}' for tag_id in TagRecipe.objects.filter(
+            recipe__author_id=author_id
+        ).values_list('tag_id', flat=True).distinct()
+    )])
+
+
+def tag_changed(tag_id):
+    changed([ALL, f'tag:{tag_id}'])
+
+
+def list_scopes(query_params):
+    # Only the parameters of anonymous browsing are cached, anything else
+    # (search, cursor, user filters) goes to the view.
+    if set(query_params) - set(LIST_PARAMS):
+        return None
+    scopes = []
+    slugs = sorted(set(query_params.getlist('tags')))
+    if slugs:
+        slug_to_id = reference.tags.get('slug_to_id')
+        if not set(slugs) <= slug_to_id.keys():
+            return None
+        scopes.extend(f'tag:{slug_to_id[slug]}' for slug in slugs)
+    author = query_params.get('author')
+    if author:
+        if not author.isdigit():
+            return None
+        scopes.append(f'author:{int(author)}')
+    return scopes or [ALL]
+
+
+def normalized(query_params):
+    return [
+        (name, sorted(set(query_params.getlist(name))))
+        for name in LIST_PARAMS if name in query_params
+    ]
+
+
+def entry_key(kind, request, scopes, params=()):
+    digest = hashlib.sha1(json.dumps([
+        request.build_absolute_uri(request.path), params, versions(scopes)
+    ]).encode()).hexdigest()
+    return ENTRY_KEY.format(kind, digest)
+
+
+def enabled():
+    # Version counters kept in process memory miss the invalidations of
+    # the other workers, so such a backend serves no cached responses.
+    return settings.CACHES['default']['BACKEND'] != PROCESS_LOCAL
+
+
+def respond(kind, request, scopes, view, params=()):
+    if request.user.is_authenticated or scopes is None or not enabled():
+        return view()
+    key = entry_key(kind, request, scopes, params)
+    data = cache.get(key)
+    hit = data is not None
+    metrics.cache_requests.inc(
+        cache=f'responses:{kind}', result='hit' if hit else 'miss'
+    )
+    if hit:
+        data, validators = data
+        if validators is not None:
+            # Revalidation against a cached entry needs no query at all.
+            not_modified = validators.not_modified(request)
+            if not_modified is not None:
+                not_modified[HEADER] = 'HIT'
+                return not_modified
+        response = Response(data)
+        if validators is not None:
+            validators.apply(response)
+    else:
+        response = view()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, (
+                response.data, Validators.from_response(response)
+            ), settings.RESPONSE_CACHE_TTL)
+    response[HEADER] = 'HIT' if hit else 'MISS'
+    return response
+
+
+def recipe_list(request, view):
+    return respond(
+        'list', request, list_scopes(request.query_params), view,
+        normalized(request.query_params)
+    )
+
+
+def recipe_author(recipe_id):
+    # A detail page shows its author, so its entry depends on the author
+    # scope too; the author is remembered to keep hits free of queries.
+    key = AUTHOR_KEY.format(recipe_id)
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = Recipe.objects.filter(pk=recipe_id).values_list(
+            'author_id', flat=True
+        ).first()
+        if author_id is not None:
+            cache.set(key, author_id, settings.RESPONSE_CACHE_TTL)
+    return author_id
+
+
+def recipe_detail(request, recipe_id, view):
+    if (not str(recipe_id).isdigit() or request.user.is_authenticated
+            or not enabled()):
+        return view()
+    author_id = recipe_author(int(recipe_id))
+    if author_id is None:
+        return view()
+    return respond(
+        'detail', request,
+        [f'recipe:{int(recipe_id)}', f'author:{author_id}'], view,
+        normalized(request.query_params)
+    )
@@ -0,0 +1,171 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from foodgram.models import normalize_name
+
+CONFIG = 'russian'
+TABLE = 'foodgram_recipe'
+FTS_TABLE = 'foodgram_recipe_search'
+TERM = re.compile(r'\w+')
+# Like ingredient names, ё is searched as е.
+NORMALIZED = "replace(replace(coalesce({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+VECTOR = (
+    f"setweight(to_tsvector('{CONFIG}', "
+    f"{NORMALIZED.format(column='{row}.name')}), 'A') || "
+    f"setweight(to_tsvector('{CONFIG}', "
+    f"{NORMALIZED.format(column='{row}.text')}), 'B')"
+)
+POSTGRES_QUERY = f"websearch_to_tsquery('{CONFIG}', %s)"
+SQLITE_INSERT = (
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) SELECT {{row}}.id, '
+    f"{NORMALIZED.format(column='{row}.name')}, "
+    f"{NORMALIZED.format(column='{row}.text')}"
+)
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': (
+        f'AFTER INSERT ON {TABLE} BEGIN '
+        f'{SQLITE_INSERT.format(row="new")}; END'
+    ),
+    f'{FTS_TABLE}_delete': (
+        f'AFTER DELETE ON {TABLE} BEGIN '
+        f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END'
+    ),
+    f'{FTS_TABLE}_update': (
+        f'AFTER UPDATE OF name, text ON {TABLE} BEGIN '
+        f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; '
+        f'{SQLITE_INSERT.format(row="new")}; END'
+    ),
+}
+
+
+def install(cursor):
+    # Safe to run again: Django rebuilds SQLite tables on many schema
+    # changes and drops their triggers, post_migrate restores them.
+    if cursor.db.vendor == 'postgresql':
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector '
+            'tsvector'
+        )
+        cursor.execute(
+            f'CREATE OR REPLACE FUNCTION {TABLE}_search_vector() '
+            'RETURNS trigger AS $$ BEGIN '
+            f'NEW.search_vector := {VECTOR.format(row="NEW")}; '
+            'RETURN NEW; END $$ LANGUAGE plpgsql'
+        )
+        cursor.execute(
+            f'DROP TRIGGER IF EXISTS {TABLE}_search_vector ON {TABLE}'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER {TABLE}_search_vector BEFORE INSERT OR UPDATE '
+            f'OF name, text ON {TABLE} FOR EACH ROW '
+            f'EXECUTE PROCEDURE {TABLE}_search_vector()'
+        )
+        cursor.execute(
+            f'UPDATE {TABLE} SET search_vector = {VECTOR.format(row=TABLE)} '
+            'WHERE search_vector IS NULL'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {TABLE}_search_vector_idx '
+            f'ON {TABLE} USING GIN (search_vector)'
+        )
+    elif cursor.db.vendor == 'sqlite':
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            "USING fts5(name, text, tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            f"AND tbl_name = '{TABLE}'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if set(SQLITE_TRIGGERS) <= existing:
+            return
+        for name, body in SQLITE_TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'{SQLITE_INSERT.format(row=TABLE)} FROM {TABLE}'
+        )
+
+
+def uninstall(cursor):
+    if cursor.db.vendor == 'postgresql':
+        cursor.execute(
+            f'DROP TRIGGER IF EXISTS {TABLE}_search_vector ON {TABLE}'
+        )
+        cursor.execute(f'DROP FUNCTION IF EXISTS {TABLE}_search_vector()')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector'
+        )
+    elif cursor.db.vendor == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def match_expression(value):
+    # FTS5 has no Russian stemmer, each word is matched as a prefix.
+    return ' '.join(f'"{term}"*' for term in TERM.findall(value))
+
+
+def search(queryset, value):
+    value = normalize_name(value)
+    if connection.vendor == 'postgresql':
+        queryset = queryset.annotate(search_rank=RawSQL(
+            f'ts_rank({TABLE}.search_vector, {POSTGRES_QUERY})', (value,),
+            output_field=FloatField()
+        )).filter(RawSQL(
+            f'{TABLE}.search_vector @@ {POSTGRES_QUERY}', (value,),
+            output_field=BooleanField()
+        ))
+    else:
+        expression = match_expression(value)
+        if not expression:
+            return queryset.none()
+        # bm25() is lower for better matches, the name weighs more than
+        # the text as in the Postgres vector. Joining the FTS table lets
+        # SQLite run the MATCH once instead of once per recipe.
+        queryset = queryset.extra(
+            select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+            tables=(FTS_TABLE,),
+            where=(
+                f'{FTS_TABLE}.rowid = {TABLE}.id', f'{FTS_TABLE} MATCH %s'
+            ),
+            params=(expression,)
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+def reindex(batch_size=1000):
+    # Rows are rewritten in primary key ranges, each batch in its own
+    # short statement, so writers are never blocked for long.
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            install(cursor)
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        last_id, total = 0, 0
+        while True:
+            cursor.execute(
+                f'SELECT MAX(id), COUNT(*) FROM (SELECT id FROM {TABLE} '
+                'WHERE id > %s ORDER BY id LIMIT %s) batch',
+                (last_id, batch_size)
+            )
+            upper, count = cursor.fetchone()
+            if not count:
+                return
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'UPDATE {TABLE} SET search_vector = '
+                    f'{VECTOR.format(row=TABLE)} WHERE id > %s AND id <= %s',
+                    (last_id, upper)
+                )
+            else:
+                cursor.execute(
+                    f'{SQLITE_INSERT.format(row=TABLE)} FROM {TABLE} '
+                    f'WHERE {TABLE}.id > %s AND {TABLE}.id <= %s',
+                    (last_id, upper)
+                )
+            last_id, total = upper, total + count
+            yield total
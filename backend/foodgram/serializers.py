@@ -5,10 +5,12 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.db import transaction
+from foodgram import feed, images, response_cache, shopping_totals
 from foodgram.models import (Favorite, Follow, Ingredient, IngredientRecipe,
                              Recipe, ShoppingCart, Tag, TagRecipe)
 from rest_framework import serializers
-from users.serializers import BasicUserSerializer, CustomUserSerializer
+from users.serializers import (BasicUserSerializer, CustomUserSerializer,
+                               get_user_stat)
 
 User = get_user_model()
 
@@ -69,6 +71,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 class ShowRecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     image = Base64ImageField()
+    images = serializers.SerializerMethodField()
     author = serializers.SerializerMethodField('get_author')
     ingredients = serializers.SerializerMethodField('get_ingredients')
     is_favorited = serializers.SerializerMethodField('get_is_favorited')
@@ -76,14 +79,26 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         'get_is_in_shopping_cart'
     )
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        hide_fields = self.context.get('hide_fields', [])
-
-        for field in hide_fields:
-            representation.pop(field, None)
-
-        return representation
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Fields left out are dropped before serialization, their method
+        # fields and the queries behind them never run.
+        selected = self.selected_fields(self.context)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, context):
+        fields = context.get('fields') or ()
+        omit = context.get('omit') or ()
+        unknown = (set(fields) | set(omit)) - set(cls.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'
+            })
+        selected = set(fields) | {'id'} if fields else set(cls.Meta.fields)
+        return selected - (set(omit) - {'id'})
 
     class Meta:
         model = Recipe
@@ -96,34 +111,31 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
 
+    def get_images(self, obj):
+        return images.image_urls(obj, self.context.get('request'))
+
     def get_author(self, obj):
+        author = obj.author
+        if hasattr(obj, 'is_author_subscribed'):
+            author.is_subscribed = obj.is_author_subscribed
         if self.context.get('use_custom_user_serializer'):
-            return CustomUserSerializer(obj.author, context=self.context).data
-        return BasicUserSerializer(obj.author, context=self.context).data
+            return CustomUserSerializer(author, context=self.context).data
+        return BasicUserSerializer(author, context=self.context).data
 
     def get_ingredients(self, obj):
-        ingredients_data = IngredientRecipe.objects.filter(recipe=obj)
-        ingredients = []
-        for ingredient_data in ingredients_data:
-            ingredient = {
-                'id': ingredient_data.ingredient.id,
-                'name': ingredient_data.ingredient.name,
-                'measurement_unit': (
-                    ingredient_data.ingredient.measurement_unit
-                ),
-                'amount': ingredient_data.amount
-            }
-            ingredients.append(ingredient)
-        return ingredients
+        return IngredientRecipeSerializer(obj.recipe.all(), many=True).data
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = request.user
         return Favorite.objects.filter(recipe=obj, user=user).exists()
 
@@ -131,16 +143,42 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = request.user
         return ShoppingCart.objects.filter(
             recipe=obj, user=user
         ).exists()
 
 
+class PrimaryKeyListField(serializers.ListField):
+    child = serializers.IntegerField()
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        # One query for the whole list instead of one per item.
+        ids = super().to_internal_value(data)
+        return resolve_ids(self.queryset, ids)
+
+    def to_representation(self, value):
+        return [item.pk for item in value.all()]
+
+
+def resolve_ids(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            f'Объекты с id {", ".join(map(str, missing))} не существуют'
+        )
+    return [objects[pk] for pk in ids]
+
+
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         model = IngredientRecipe
@@ -151,9 +189,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(max_length=None, use_url=True)
     author = CustomUserSerializer(read_only=True)
     cooking_time = serializers.IntegerField()
-    tags = serializers.SlugRelatedField(
-        many=True, queryset=Tag.objects.all(), slug_field='id'
-    )
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     ingredients = AddIngredientToRecipeSerializer(many=True, required=True)
 
     class Meta:
@@ -171,6 +207,10 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     def validate_ingredients(self, value):
         ingredient_ids = [ingredient['id'] for ingredient in value]
+        for ingredient, model in zip(
+            value, resolve_ids(Ingredient.objects.all(), ingredient_ids)
+        ):
+            ingredient['id'] = model
         ingredient_amounts = [ingredient['amount'] for ingredient in value]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError(
@@ -232,44 +272,156 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
         with transaction.atomic():
             recipe = Recipe.objects.create(author=author, **validated_data)
-            for ingredient in ingredients_data:
-                ingredient_model = ingredient['id']
-                amount = ingredient['amount']
-                IngredientRecipe.objects.create(
-                    ingredient=ingredient_model, recipe=recipe, amount=amount
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    ingredient=ingredient['id'], recipe=recipe,
+                    amount=ingredient['amount']
                 )
-            recipe.tags.set(tags_data)
+                for ingredient in ingredients_data
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(tag=tag, recipe=recipe) for tag in tags_data
+            )
+            feed.publish(recipe)
+            images.uploaded(recipe)
+            response_cache.recipe_changed(
+                recipe, [tag.id for tag in tags_data]
+            )
         return recipe
 
+    def update_ingredients(self, recipe, ingredients_data):
+        # Only rows whose ingredient or amount changed are written, and
+        # only their share of the shopping lists is recomputed.
+        existing = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        wanted = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        removed = existing.keys() - wanted.keys()
+        added = wanted.keys() - existing.keys()
+        changed = [
+            existing[ingredient_id] for ingredient_id in existing
+            if ingredient_id in wanted
+            and existing[ingredient_id].amount != wanted[ingredient_id]
+        ]
+        changed_ids = {item.ingredient_id for item in changed}
+        if removed or changed:
+            shopping_totals.recipe_ingredients_removed(
+                recipe, removed | changed_ids
+            )
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        for item in changed:
+            item.amount = wanted[item.ingredient_id]
+        IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                ingredient_id=ingredient_id, recipe=recipe,
+                amount=wanted[ingredient_id]
+            )
+            for ingredient_id in added
+        )
+        if added or changed:
+            shopping_totals.recipe_ingredients_added(
+                recipe, added | changed_ids
+            )
+
+    def update_tags(self, recipe, tags_data):
+        existing = set(
+            TagRecipe.objects.filter(recipe=recipe).values_list(
+                'tag_id', flat=True
+            )
+        )
+        wanted = {tag.id for tag in tags_data}
+        if existing - wanted:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=existing - wanted
+            ).delete()
+        TagRecipe.objects.bulk_create(
+            TagRecipe(tag_id=tag_id, recipe=recipe)
+            for tag_id in wanted - existing
+        )
+        return existing | wanted
+
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
 
         with transaction.atomic():
-            TagRecipe.objects.filter(recipe=instance).delete()
-            IngredientRecipe.objects.filter(recipe=instance).delete()
-            for ingredient in ingredients_data:
-                ingredient_model = ingredient['id']
-                amount = ingredient['amount']
-                IngredientRecipe.objects.create(
-                    ingredient=ingredient_model, recipe=instance, amount=amount
-                )
+            self.update_ingredients(instance, ingredients_data)
+            tag_ids = self.update_tags(instance, tags_data)
 
             instance.name = validated_data.pop('name')
             instance.text = validated_data.pop('text')
-            if validated_data.get('image') is not None:
+            image_changed = validated_data.get('image') is not None
+            if image_changed:
                 instance.image = validated_data.pop('image')
+                instance.image_derivatives = {}
             instance.cooking_time = validated_data.pop('cooking_time')
-            instance.tags.set(tags_data)
-            instance.save()
+            # Counter columns are maintained by concurrent writers.
+            # updated_at also covers the ingredient and tag rows written
+            # above.
+            instance.save(update_fields=(
+                'name', 'text', 'image', 'image_derivatives', 'cooking_time',
+                'updated_at'
+            ))
+            if image_changed:
+                images.uploaded(instance)
+            # Lists of removed tags change as well as those of added ones.
+            response_cache.recipe_changed(instance, tag_ids)
 
         return instance
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.RECIPE_SET_MAX_SIZE
+    )
+
+
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.COOK_MAX_INGREDIENTS
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.COOK_MAX_LIMIT,
+        default=settings.COOK_LIMIT
+    )
+
+
+class RecommendationQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.RECOMMENDATION_MAX_LIMIT,
+        default=settings.RECOMMENDATION_LIMIT
+    )
+
+
+def parse_field_list(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def parse_recipes_limit(value):
+    if value and str(value).isdigit() and int(value) > 0:
+        return int(value)
+    return None
+
+
 class UserRecipeSerializer(serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+    def get_images(self, obj):
+        return images.image_urls(obj, self.context.get('request'))
 
 
 class SubscriptionUserSerializer(serializers.ModelSerializer):
@@ -280,23 +432,23 @@ class SubscriptionUserSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
         if user.is_authenticated:
+            if hasattr(obj, 'is_subscribed'):
+                return obj.is_subscribed
             return Follow.objects.filter(user=user, following=obj).exists()
         return False
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return get_user_stat(obj, 'recipes_count')
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get('recipes_limit')
-        recipes_limit = (
-            int(recipes_limit) if recipes_limit and recipes_limit.isdigit()
-            else None
-        )
-
-        if recipes_limit:
-            recipes_queryset = obj.recipes.all()[:recipes_limit]
+        previews = self.context.get('recipe_previews')
+        if previews is not None:
+            recipes_queryset = previews.get(obj.id, [])
         else:
-            recipes_queryset = obj.recipes.all()
+            recipes_limit = parse_recipes_limit(
+                self.context.get('recipes_limit')
+            )
+            recipes_queryset = obj.recipes.all()[:recipes_limit]
 
         return UserRecipeSerializer(
             recipes_queryset, many=True, context=self.context
@@ -0,0 +1,101 @@
+import csv
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.module_loading import import_string
+from foodgram import reference
+from foodgram.models import ShoppingListItem
+
+
+class ShoppingListRenderer:
+    format = None
+    extension = None
+    content_type = None
+
+    def render(self, rows):
+        raise NotImplementedError
+
+
+class TextRenderer(ShoppingListRenderer):
+    format = 'txt'
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def render(self, rows):
+        for row in rows:
+            yield (
+                f"{row['name']} ({row['measurement_unit']}) — "
+                f"{row['total_amount']}\n"
+            )
+
+
+class CSVRenderer(ShoppingListRenderer):
+    format = 'csv'
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def render(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            writer.writerow(
+                (row['name'], row['measurement_unit'], row['total_amount'])
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+class JSONRenderer(ShoppingListRenderer):
+    format = 'json'
+    extension = 'json'
+    content_type = 'application/json'
+
+    def render(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps({
+                'name': row['name'],
+                'measurement_unit': row['measurement_unit'],
+                'amount': row['total_amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+def get_renderers():
+    renderers = (
+        import_string(path)() for path in settings.SHOPPING_LIST_RENDERERS
+    )
+    return {renderer.format: renderer for renderer in renderers}
+
+
+def shopping_list_rows(user):
+    return ShoppingListItem.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        total_amount=F('amount'),
+    ).order_by('name', 'measurement_unit').iterator(
+        chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE
+    )
+
+
+def shopping_list_etag(user, renderer):
+    # Every row goes into the hash: sums of the rows can stay the same
+    # when amounts move between ingredients.
+    digest = hashlib.md5(
+        f'{renderer.format}:{reference.ingredients.current_version()}'
+        .encode()
+    )
+    rows = ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient_id'
+    ).values_list('ingredient_id', 'amount').iterator(
+        chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE
+    )
+    for ingredient_id, amount in rows:
+        digest.update(f':{ingredient_id}={amount}'.encode())
+    return digest.hexdigest()
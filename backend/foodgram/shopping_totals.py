@@ -0,0 +1,135 @@
+from django.db import connection
+from django.db.models import Sum
+from foodgram.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+ADDED = 1
+REMOVED = -1
+
+
+def adjust(sign, where, params, ingredient_ids=None):
+    # Cart rows matching ``where`` contribute their recipe ingredients to
+    # the owners' totals; removals are applied as negative amounts.
+    table = ShoppingListItem._meta.db_table
+    items, item_params = '', []
+    if ingredient_ids is not None:
+        item_params = list(ingredient_ids)
+        items = ' AND item.ingredient_id IN ({})'.format(
+            ', '.join(['%s'] * len(item_params))
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+            'SELECT cart.user_id, item.ingredient_id, '
+            '%s * SUM(COALESCE(item.amount, 0)) '
+            f'FROM {ShoppingCart._meta.db_table} cart '
+            f'JOIN {IngredientRecipe._meta.db_table} item '
+            'ON item.recipe_id = cart.recipe_id '
+            f'WHERE {where}{items} '
+            'GROUP BY cart.user_id, item.ingredient_id '
+            'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET amount = {table}.amount + EXCLUDED.amount',
+            [sign, *params, *item_params]
+        )
+        if sign == REMOVED:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE amount <= 0 AND user_id IN '
+                f'(SELECT user_id FROM {ShoppingCart._meta.db_table} cart '
+                f'WHERE {where})',
+                params
+            )
+
+
+def recipes_changed(user, recipe_ids, sign):
+    # For cart rows already inserted or deleted by the caller: the amounts
+    # come straight from the recipes, without joining the cart.
+    table = ShoppingListItem._meta.db_table
+    recipes = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+            'SELECT %s, item.ingredient_id, '
+            '%s * SUM(COALESCE(item.amount, 0)) '
+            f'FROM {IngredientRecipe._meta.db_table} item '
+            f'WHERE item.recipe_id IN ({recipes}) '
+            'GROUP BY item.ingredient_id '
+            'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET amount = {table}.amount + EXCLUDED.amount',
+            [user.id, sign, *recipe_ids]
+        )
+        if sign == REMOVED:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE user_id = %s AND amount <= 0',
+                [user.id]
+            )
+
+
+def recipe_ingredients_removed(recipe, ingredient_ids=None):
+    adjust(REMOVED, 'cart.recipe_id = %s', (recipe.id,), ingredient_ids)
+
+
+def recipe_ingredients_added(recipe, ingredient_ids=None):
+    adjust(ADDED, 'cart.recipe_id = %s', (recipe.id,), ingredient_ids)
+
+
+def live_totals(users=None):
+    if users is None:
+        rows = IngredientRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False
+        )
+    else:
+        rows = IngredientRecipe.objects.filter(
+            recipe__shopping_cart__user__in=users
+        )
+    return rows.values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).filter(total__gt=0).order_by(
+        'recipe__shopping_cart__user', 'ingredient'
+    )
+
+
+def stored_totals(users=None):
+    items = ShoppingListItem.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+    return items.values_list('user', 'ingredient', 'amount').order_by(
+        'user', 'ingredient'
+    )
+
+
+def find_drift(users=None, chunk_size=2000):
+    # Both sides are ordered by (user, ingredient), so they are merged
+    # without holding either of them in memory.
+    live = live_totals(users).iterator(chunk_size=chunk_size)
+    stored = stored_totals(users).iterator(chunk_size=chunk_size)
+    expected, actual = next(live, None), next(stored, None)
+    while expected is not None or actual is not None:
+        if actual is None or (
+            expected is not None and expected[:2] < actual[:2]
+        ):
+            yield expected[0], expected[1], expected[2], None
+            expected = next(live, None)
+        elif expected is None or actual[:2] < expected[:2]:
+            yield actual[0], actual[1], None, actual[2]
+            actual = next(stored, None)
+        else:
+            if expected[2] != actual[2]:
+                yield expected[0], expected[1], expected[2], actual[2]
+            expected, actual = next(live, None), next(stored, None)
+
+
+def rebuild(users=None):
+    items = ShoppingListItem.objects.all()
+    if users is None:
+        items.delete()
+        where, params = '1 = 1', ()
+    else:
+        user_ids = [getattr(user, 'id', user) for user in users]
+        items.filter(user__in=user_ids).delete()
+        if not user_ids:
+            return
+        where = 'cart.user_id IN ({})'.format(
+            ', '.join(['%s'] * len(user_ids))
+        )
+        params = user_ids
+    adjust(ADDED, where, params)
+    ShoppingListItem.objects.filter(amount__lte=0).delete()
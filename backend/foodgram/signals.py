@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from foodgram import (conditional, cook, counters, feed, reference,
+                      response_cache, search, shopping_totals)
+from foodgram.models import (Favorite, Follow, Ingredient, Recipe,
+                             ShoppingCart, Tag, UserStats)
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    reference.tags.bump()
+    response_cache.tag_changed(instance.id)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    reference.ingredients.bump()
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # The totals of its cart rows are subtracted by cart_item_deleted as
+    # the rows go by cascade.
+    response_cache.recipe_changed(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif update_fields is None or not update_fields.isdisjoint(
+        conditional.AUTHOR_FIELDS
+    ):
+        # Logins save last_login alone, which no response shows.
+        response_cache.author_changed(instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, recipes_count=1)
+    # Ingredients are written in bulk after the recipe, in the same
+    # transaction, the index reads them once it is committed.
+    cook.recipe_changed(instance.id)
+    response_cache.recipe_changed(instance, ())
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, recipes_count=-1)
+    cook.recipe_changed(instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.following_id, followers_count=1)
+        feed.follow_added(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    counters.change_user(instance.following_id, followers_count=-1)
+    feed.follow_removed(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_recipe(instance.recipe_id, favorites_count=1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    counters.change_recipe(instance.recipe_id, favorites_count=-1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_recipe(instance.recipe_id, in_carts_count=1)
+        shopping_totals.adjust(
+            shopping_totals.ADDED, 'cart.id = %s', (instance.id,)
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_deleted(sender, instance, **kwargs):
+    # Before any row of a cascade is gone: the cart row and its recipe's
+    # ingredients can still be joined.
+    shopping_totals.adjust(
+        shopping_totals.REMOVED, 'cart.id = %s', (instance.id,)
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_removed(sender, instance, **kwargs):
+    counters.change_recipe(instance.recipe_id, in_carts_count=-1)
+
+
+@receiver(post_migrate)
+def migrated(sender, using, **kwargs):
+    # Only SQLite loses the triggers when Django rebuilds the table.
+    if sender.name == 'foodgram' and connections[using].vendor == 'sqlite':
+        with connections[using].cursor() as cursor:
+            search.install(cursor)
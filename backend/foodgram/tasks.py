@@ -0,0 +1,29 @@
+from django.db import transaction
+from foodgram import counters, feed, images, recommendations, shopping_totals
+from jobs.queue import task
+
+
+@task('recipe-images')
+def build_recipe_images(recipe_id):
+    images.generate(recipe_id)
+
+
+@task('reconcile-counters')
+def reconcile_counters(batch_size=1000):
+    counters.reconcile(batch_size=batch_size)
+
+
+@task('rebuild-shopping-lists')
+def rebuild_shopping_lists(user_ids=None):
+    shopping_totals.rebuild(user_ids)
+
+
+@task('rebuild-feeds')
+def rebuild_feeds():
+    feed.rebuild()
+
+
+@task('build-recommendations')
+def build_recommendations():
+    with transaction.atomic():
+        recommendations.build()
@@ -1,7 +1,32 @@
+import io
+import json
+import multiprocessing
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 
-from django.test import Client, TestCase
-from foodgram.models import Ingredient, Recipe, Tag, User
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from foodgram import (benchmark, cook, counters, explain, recommendations,
+                      reference, response_cache, shopping_list,
+                      shopping_totals)
+from foodgram.filters import RecipeFilter
+from foodgram.importers import import_ingredients, read_json
+from foodgram.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                             Recipe, RecipeNeighbour, ShoppingCart,
+                             ShoppingListItem, Tag, User, UserStats)
+from jobs import worker
+from jobs.models import Job
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend import metrics, timing
 
 
 class FoodgramAPITestCase(TestCase):
@@ -29,3 +54,1587 @@ class FoodgramAPITestCase(TestCase):
     def test_recipe_detail(self):
         response = self.client.get(f'/api/recipes/{self.recipe.id}/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class RecipeQueryCountTestCase(TestCase):
+    INGREDIENTS_PER_RECIPE = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', first_name='author', last_name='author',
+            email='author@test.com'
+        )
+        cls.user = User.objects.create(
+            username='reader', first_name='reader', last_name='reader',
+            email='reader@test.com'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(
+                name=f'tag{i}', color='#000000', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ingredient{i}',
+                                      measurement_unit='г')
+            for i in range(cls.INGREDIENTS_PER_RECIPE)
+        ]
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.recipe = cls.create_recipe()
+
+    @classmethod
+    def create_recipe(cls):
+        recipe = Recipe.objects.create(
+            author=cls.author, name='recipe', text='text', cooking_time=5
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in cls.ingredients
+        )
+        recipe.tags.set(cls.tags)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        return recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.auth_client = APIClient()
+        self.auth_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_recipe_list_anonymous_queries(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for _ in range(5):
+            self.create_recipe()
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_recipe_list_authenticated_queries(self):
+        for _ in range(5):
+            self.create_recipe()
+        with self.assertNumQueries(5):
+            response = self.auth_client.get('/api/recipes/')
+        recipe = response.data['results'][0]
+        self.assertEqual(
+            len(recipe['ingredients']), self.INGREDIENTS_PER_RECIPE
+        )
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_recipe_detail_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(response.data['is_favorited'])
+        with self.assertNumQueries(4):
+            response = self.auth_client.get(
+                f'/api/recipes/{self.recipe.id}/'
+            )
+        self.assertTrue(response.data['is_favorited'])
+
+
+class RecipeWriteTestCase(TestCase):
+    INGREDIENTS_PER_RECIPE = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cook', email='c@c.com')
+        cls.tags = [
+            Tag.objects.create(name=f'tag{i}', color='#000000', slug=f'{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ingredient{i}',
+                                      measurement_unit='г')
+            for i in range(cls.INGREDIENTS_PER_RECIPE + 1)
+        ]
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media.name
+        )
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def payload(self, ingredients, tags):
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            'tags': [tag.id for tag in tags],
+            'image': benchmark.BENCHMARK_IMAGE,
+            'name': 'recipe', 'text': 'text', 'cooking_time': 5,
+        }
+
+    def test_create_and_update_write_only_changed_rows(self):
+        ingredients = [
+            (ingredient, 1)
+            for ingredient in self.ingredients[:self.INGREDIENTS_PER_RECIPE]
+        ]
+        with self.assertNumQueries(12):
+            response = self.client.post(
+                '/api/recipes/', self.payload(ingredients, self.tags[:2]),
+                format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        rows = dict(
+            recipe.recipe.values_list('ingredient_id', 'id')
+        )
+        ingredients[0] = (self.ingredients[0], 5)
+        ingredients[1] = (self.ingredients[-1], 2)
+        with self.assertNumQueries(21):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                self.payload(ingredients, self.tags[1:]), format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        updated = dict(recipe.recipe.values_list('ingredient_id', 'id'))
+        self.assertNotIn(self.ingredients[1].id, updated)
+        for ingredient in self.ingredients[2:self.INGREDIENTS_PER_RECIPE]:
+            self.assertEqual(updated[ingredient.id], rows[ingredient.id])
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)),
+            {tag.id for tag in self.tags[1:]}
+        )
+        self.assertEqual(list(shopping_totals.find_drift()), [])
+
+    def test_unknown_ids_are_rejected_at_once(self):
+        response = self.client.post('/api/recipes/', self.payload(
+            [(Ingredient(id=998), 1), (Ingredient(id=999), 1)],
+            [Tag(id=997)]
+        ), format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('998, 999', response.data['ingredients'][0])
+        self.assertIn('997', response.data['tags'][0])
+
+
+class BenchmarkBudgetTestCase(TestCase):
+    def test_endpoints_fit_query_budgets(self):
+        dataset = benchmark.Dataset(
+            users=6, recipes=20, ingredients=30, favorites_per_user=3,
+            cart_per_user=3, follows_per_user=3
+        )
+        fixtures = benchmark.seed(dataset)
+        results = benchmark.run(fixtures, repeat=1, warmup=1)
+        self.assertEqual(benchmark.over_budget(results), {})
+
+
+class ExplainEndpointsTestCase(TestCase):
+    def test_reports_statements_of_every_endpoint(self):
+        with self.assertRaises(CommandError):
+            call_command('explain_endpoints', stdout=io.StringIO())
+        call_command(
+            'generate_data', users=10, recipes=30, favorites=50,
+            shopping_cart=20, follows=20, stdout=io.StringIO()
+        )
+        recipes = Recipe.objects.count()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'explain_endpoints', top=50, min_rows=0,
+                output=output.name, stdout=io.StringIO()
+            )
+            report = json.load(output)
+        self.assertEqual(Recipe.objects.count(), recipes)
+        endpoints = {
+            statement['endpoint'] for statement in report['statements']
+        }
+        self.assertIn('recipes-list-filtered', endpoints)
+        self.assertIn('recipes-create', endpoints)
+        self.assertNotIn(
+            ['recipe_id', 'tag_id'],
+            [proposal['columns'] for proposal in report['proposals']]
+        )
+
+    def test_filter_columns_follow_subquery_aliases(self):
+        sql = (
+            'SELECT "foodgram_recipe"."id" FROM "foodgram_recipe" WHERE '
+            '(EXISTS(SELECT (1) AS "a" FROM "foodgram_tagrecipe" U0 WHERE '
+            '(U0."recipe_id" = "foodgram_recipe"."id" AND U0."tag_id" IN '
+            '(%s)) LIMIT 1) AND "foodgram_recipe"."author_id" = %s) '
+            'ORDER BY "foodgram_recipe"."pub_date" DESC'
+        )
+        self.assertEqual(
+            explain.filter_columns(sql, 'foodgram_tagrecipe'),
+            ['recipe_id', 'tag_id']
+        )
+        self.assertEqual(
+            explain.order_columns(sql, 'foodgram_recipe'), ['-pub_date']
+        )
+        self.assertEqual(
+            explain.propose(
+                explain.Finding('sort', 'foodgram_recipe', ''), sql, {}
+            ),
+            ('foodgram_recipe', ('author_id', '-pub_date'))
+        )
+
+
+class GenerateDataTestCase(TestCase):
+    def test_generates_requested_volumes(self):
+        call_command(
+            'generate_data', users=20, recipes=50, favorites=300,
+            shopping_cart=40, follows=60, stdout=io.StringIO()
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertEqual(Favorite.objects.count(), 300)
+        self.assertEqual(ShoppingCart.objects.count(), 40)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertEqual(
+            Recipe.objects.filter(recipe__isnull=True).count(), 0
+        )
+
+
+class IngredientImportTestCase(TestCase):
+    CATALOG = (
+        '[{"name": "мука", "measurement_unit": "г"},\n'
+        ' {"name": "молоко", "measurement_unit": "мл"},\n'
+        ' {"name": "мука", "measurement_unit": "г"},\n'
+        ' {"name": " ", "measurement_unit": "г"}]'
+    )
+
+    def test_read_json_across_block_boundaries(self):
+        rows = list(read_json(io.StringIO(self.CATALOG), block_size=7))
+        self.assertEqual(rows[:2], [('мука', 'г'), ('молоко', 'мл')])
+        self.assertEqual(len(rows), 4)
+
+    def test_import_is_idempotent(self):
+        stats = import_ingredients(io.StringIO(self.CATALOG), 'json')
+        self.assertEqual(
+            (stats.inserted, stats.duplicates, stats.invalid), (2, 1, 1)
+        )
+        stats = import_ingredients(
+            io.StringIO('мука,г\nсоль,г\n'), 'csv', batch_size=1
+        )
+        self.assertEqual((stats.inserted, stats.existing), (1, 1))
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_copy_requires_postgres(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('COPY is available')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('мука,г\n')
+            file.flush()
+            with self.assertRaisesMessage(CommandError, 'PostgreSQL'):
+                call_command(
+                    'load_data', path=file.name, method='copy',
+                    stdout=io.StringIO()
+                )
+
+
+class IngredientAutocompleteTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='cook', email='cook@test.com')
+        names = (
+            'Молоко', 'молоко сгущённое', 'сгущенное молоко', 'мёд',
+            'кокосовое молоко', 'молотый перец',
+        )
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in names
+        }
+        recipe = Recipe.objects.create(
+            author=author, name='recipe', text='text', cooking_time=1
+        )
+        for name in ('молотый перец', 'кокосовое молоко'):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredients[name], amount=1
+            )
+
+    def setUp(self):
+        reference.ingredients.bump()
+
+    def search(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_ranking(self):
+        for backend in ('memory', 'database'):
+            with self.subTest(backend=backend), override_settings(
+                INGREDIENT_AUTOCOMPLETE_BACKEND=backend
+            ):
+                self.assertEqual(self.search('Мол'), [
+                    'молотый перец', 'Молоко', 'молоко сгущённое',
+                    'кокосовое молоко', 'сгущенное молоко',
+                ])
+                self.assertEqual(self.search('сгущен'), [
+                    'сгущенное молоко', 'молоко сгущённое'
+                ])
+                self.assertEqual(self.search('мед'), ['мёд'])
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_LIMIT=2)
+    def test_result_size_is_capped(self):
+        self.assertEqual(len(self.search('мол')), 2)
+
+
+class ReferenceDataCacheTestCase(TestCase):
+    def setUp(self):
+        reference.bump_all()
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+
+    def test_tags_are_served_from_cache(self):
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+            self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.data[0]['slug'], 'breakfast')
+
+    def test_version_bump_refreshes_cache(self):
+        self.client.get('/api/tags/')
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        response = self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.data['name'], 'Ужин')
+        self.tag.delete()
+        response = self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_lost_version_reloads(self):
+        cache.delete(reference.tags.version_key)
+        reference.tags.get('list')
+        # Another process renames the tag, then the version key is lost.
+        Tag.objects.filter(id=self.tag.id).update(name='Ужин')
+        cache.incr(reference.tags.version_key)
+        cache.delete(reference.tags.version_key)
+        self.assertEqual(reference.tags.get('list')[0]['name'], 'Ужин')
+
+    def test_recipe_filter_validates_slugs_from_cache(self):
+        response = self.client.get('/api/recipes/', {'tags': 'unknown'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/recipes/', {'tags': 'breakfast'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_tag_removed_after_validation_matches_nothing(self):
+        queryset = RecipeFilter().filter_tags(
+            Recipe.objects.all(), 'tags', ['breakfast', 'removed']
+        )
+        self.assertFalse(queryset.exists())
+
+
+class DownloadShoppingCartTestCase(TestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer', email='b@test.com')
+        cls.token = Token.objects.create(user=cls.user)
+        sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        for amount in (100, 50):
+            recipe = Recipe.objects.create(
+                author=cls.user, name='recipe', text='text', cooking_time=1
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=sugar, amount=amount
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=flour, amount=10
+            )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        shopping_totals.rebuild()
+        cls.recipe = recipe
+        cls.sugar = sugar
+        cls.flour = flour
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def download(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats_are_sorted_by_name(self):
+        self.assertEqual(
+            self.download(), 'мука (г) — 20\nсахар (г) — 150\n'
+        )
+        self.assertEqual(
+            self.download(format='csv').splitlines(),
+            ['name,measurement_unit,amount', 'мука,г,20', 'сахар,г,150']
+        )
+        self.assertEqual(json.loads(self.download(format='json')), [
+            {'name': 'мука', 'measurement_unit': 'г', 'amount': 20},
+            {'name': 'сахар', 'measurement_unit': 'г', 'amount': 150},
+        ])
+        response = self.client.get(self.URL, {'format': 'pdf'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_unchanged_cart_returns_not_modified(self):
+        etag = self.client.get(self.URL)['ETag']
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertNotEqual(
+            self.client.get(self.URL, {'format': 'csv'})['ETag'], etag
+        )
+        self.client.delete(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_etag_covers_every_row(self):
+        user = User.objects.create(username='other', email='o@test.com')
+        items = [
+            ShoppingListItem.objects.create(
+                user=user, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=f'ингредиент {number}', measurement_unit='г'
+                )
+            )
+            for number, amount in enumerate((2, 1, 1, 2))
+        ]
+        renderer = shopping_list.TextRenderer()
+        etag = shopping_list.shopping_list_etag(user, renderer)
+        # Same rows and the same sums of amounts and amount * ingredient.
+        for item, amount in zip(items, (1, 2, 2, 1)):
+            item.amount = amount
+            item.save()
+        self.assertNotEqual(
+            shopping_list.shopping_list_etag(user, renderer), etag
+        )
+
+
+class ShoppingListTotalsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='cook', email='c@test.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        self.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        self.tag = Tag.objects.create(name='tag', color='#000000', slug='tag')
+        self.recipes = []
+        for amount in (100, 50):
+            recipe = Recipe.objects.create(
+                author=self.user, name='recipe', text='text', cooking_time=1
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.sugar, amount=amount
+            )
+            self.recipes.append(recipe)
+
+    def totals(self):
+        return dict(self.user.shopping_list_items.values_list(
+            'ingredient__name', 'amount'
+        ))
+
+    def cart(self, method, recipe):
+        return getattr(self.client, method)(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+
+    def test_cart_changes_update_totals(self):
+        for recipe in self.recipes:
+            self.cart('post', recipe)
+        self.assertEqual(self.totals(), {'сахар': 150})
+        self.cart('delete', self.recipes[0])
+        self.assertEqual(self.totals(), {'сахар': 50})
+        self.cart('delete', self.recipes[1])
+        self.assertEqual(self.totals(), {})
+
+    def test_orm_cart_changes_update_totals(self):
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(self.totals(), {'сахар': 150})
+        ShoppingCart.objects.filter(recipe=self.recipes[1]).delete()
+        self.assertEqual(self.totals(), {'сахар': 100})
+        # The cart row goes by cascade, its amount is subtracted once.
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        self.recipes[0].delete()
+        self.assertEqual(self.totals(), {'сахар': 50})
+        self.assertEqual(list(shopping_totals.find_drift()), [])
+
+    def test_recipe_changes_update_totals(self):
+        for recipe in self.recipes:
+            self.cart('post', recipe)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/', {
+                'ingredients': [{'id': self.flour.id, 'amount': 30}],
+                'tags': [self.tag.id],
+                'name': 'recipe',
+                'text': 'text',
+                'cooking_time': 5,
+            }, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.totals(), {'сахар': 50, 'мука': 30})
+        self.recipes[1].delete()
+        self.assertEqual(self.totals(), {'мука': 30})
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self):
+        self.cart('post', self.recipes[0])
+        call_command(
+            'rebuild_shopping_lists', verify=True, stdout=io.StringIO()
+        )
+        # Bulk writes send no signals, the totals drift.
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=self.user, recipe=self.recipes[1])]
+        )
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_shopping_lists', verify=True, stdout=io.StringIO()
+            )
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        self.assertEqual(self.totals(), {'сахар': 150})
+        self.assertEqual(list(shopping_totals.find_drift()), [])
+
+
+class CursorPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@a.com')
+        cls.other = User.objects.create(username='other', email='o@o.com')
+        for index in range(7):
+            Recipe.objects.create(
+                author=cls.author if index % 2 else cls.other,
+                name=f'recipe {index}', text='text', cooking_time=1
+            )
+        # Equal timestamps make the id tiebreaker part of the key.
+        Recipe.objects.filter(name__in=('recipe 2', 'recipe 3')).update(
+            pub_date=Recipe.objects.get(name='recipe 4').pub_date
+        )
+        cls.expected = list(Recipe.objects.values_list('id', flat=True))
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_cursor_pages_follow_pub_date_and_id(self):
+        pages = self.walk('/api/recipes/?cursor=&limit=3')
+        self.assertEqual(
+            [recipe['id'] for page in pages for recipe in page['results']],
+            self.expected
+        )
+        self.assertIsNone(pages[0]['previous'])
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.expected[3:6]
+        )
+
+    def test_cursor_respects_filters(self):
+        pages = self.walk(
+            f'/api/recipes/?cursor=&limit=2&author={self.author.id}'
+        )
+        self.assertEqual(
+            [recipe['id'] for page in pages for recipe in page['results']],
+            list(Recipe.objects.filter(author=self.author).values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_page_number_mode_and_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?page=2&limit=3')
+        self.assertEqual(response.data['count'], 7)
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_subscriptions_cursor(self):
+        follower = User.objects.create(username='follower', email='f@f.com')
+        for user in (self.author, self.other):
+            Follow.objects.create(user=follower, following=user)
+        client = APIClient()
+        client.force_authenticate(follower)
+        response = client.get('/api/users/subscriptions/?cursor=&limit=1')
+        self.assertEqual(response.data['results'][0]['id'], self.other.id)
+        response = client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['id'], self.author.id)
+        self.assertIsNone(response.data['next'])
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author', email='a@a.com')
+        self.reader = User.objects.create(username='reader', email='r@r.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def assertCounters(self, favorites, carts, recipes, followers):
+        self.recipe.refresh_from_db()
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count,
+             stats.recipes_count, stats.followers_count),
+            (favorites, carts, recipes, followers)
+        )
+
+    def test_writes_update_counters(self):
+        recipe_url = f'/api/recipes/{self.recipe.id}'
+        self.client.post(f'{recipe_url}/favorite/')
+        self.client.post(f'{recipe_url}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(1, 1, 1, 1)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['results'][0]['recipes_count'], 1)
+        self.client.delete(f'{recipe_url}/favorite/')
+        self.client.delete(f'{recipe_url}/shopping_cart/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertCounters(0, 0, 1, 0)
+        self.reader.delete()
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0
+        )
+
+    def test_reconcile_fixes_drift(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=5, in_carts_count=2)
+        UserStats.objects.filter(user=self.author).delete()
+        self.assertEqual(
+            counters.reconcile(batch_size=1, dry_run=True),
+            {'recipes': 1, 'users': 1}
+        )
+        call_command('reconcile_counters', batch_size=1, stdout=io.StringIO())
+        self.assertCounters(1, 0, 1, 0)
+        self.assertEqual(counters.reconcile(), {'recipes': 0, 'users': 0})
+
+
+class RecipeSetsTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author', email='a@a.com')
+        self.reader = User.objects.create(username='reader', email='r@r.com')
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'recipe{i}', text='text',
+                cooking_time=1
+            )
+            for i in range(3)
+        ]
+        for recipe in self.recipes:
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=2
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_bulk_add_and_remove_report_changed_ids(self):
+        ids = [recipe.id for recipe in self.recipes]
+        self.client.post(f'/api/recipes/{ids[0]}/shopping_cart/')
+        response = self.client.post(
+            '/api/recipes/shopping_cart/', {'recipes': [*ids, 999]},
+            format='json'
+        )
+        self.assertEqual(response.data, {'added': ids[1:]})
+        self.assertEqual(
+            list(shopping_totals.stored_totals([self.reader])),
+            [(self.reader.id, self.ingredient.id, 6)]
+        )
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/', {'recipes': ids[:2]},
+            format='json'
+        )
+        self.assertEqual(response.data, {'removed': ids[:2]})
+        self.assertEqual(list(shopping_totals.find_drift()), [])
+        self.assertEqual(
+            [recipe.in_carts_count
+             for recipe in Recipe.objects.order_by('id')],
+            [0, 0, 1]
+        )
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': ids}, format='json'
+        )
+        self.assertEqual(response.data, {'added': ids})
+        self.assertEqual(counters.reconcile(), {'recipes': 0, 'users': 0})
+
+    def test_single_endpoints_keep_their_errors(self):
+        recipe_url = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        self.assertEqual(
+            self.client.post(recipe_url).status_code, HTTPStatus.CREATED
+        )
+        self.assertEqual(
+            self.client.post(recipe_url).status_code, HTTPStatus.BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.post('/api/recipes/999/favorite/').status_code,
+            HTTPStatus.NOT_FOUND
+        )
+        self.assertEqual(
+            self.client.delete(recipe_url).status_code, HTTPStatus.NO_CONTENT
+        )
+        self.assertEqual(
+            self.client.delete(recipe_url).status_code, HTTPStatus.NOT_FOUND
+        )
+        self.assertEqual(
+            self.client.post(
+                '/api/recipes/favorite/', {'recipes': []}, format='json'
+            ).status_code,
+            HTTPStatus.BAD_REQUEST
+        )
+
+
+class RecipeSetsConcurrencyTestCase(TransactionTestCase):
+    THREADS = 8
+
+    def test_concurrent_clicks_do_not_fail(self):
+        author = User.objects.create(username='author', email='a@a.com')
+        reader = User.objects.create(username='reader', email='r@r.com')
+        recipe = Recipe.objects.create(
+            author=author, name='recipe', text='text', cooking_time=1
+        )
+        barrier = threading.Barrier(self.THREADS)
+
+        def click(method):
+            client = APIClient()
+            client.force_authenticate(reader)
+            barrier.wait()
+            try:
+                return getattr(client, method)(
+                    f'/api/recipes/{recipe.id}/favorite/'
+                ).status_code
+            finally:
+                connection.close()
+
+        for method, expected in (('post', HTTPStatus.CREATED),
+                                 ('delete', HTTPStatus.NO_CONTENT)):
+            with ThreadPoolExecutor(self.THREADS) as executor:
+                statuses = list(executor.map(
+                    click, [method] * self.THREADS
+                ))
+            self.assertEqual(statuses.count(expected), 1, statuses)
+            self.assertTrue(all(code < 500 for code in statuses), statuses)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+class SubscriptionPreviewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(username='reader', email='r@r.com')
+        cls.authors = []
+        for index in range(3):
+            author = User.objects.create(
+                username=f'author{index}', email=f'a{index}@a.com'
+            )
+            for number in range(index + 2):
+                Recipe.objects.create(
+                    author=author, name=f'{author} {number}', text='text',
+                    cooking_time=1
+                )
+            cls.authors.append(author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_subscriptions_take_constant_queries(self):
+        Follow.objects.create(user=self.reader, following=self.authors[0])
+        with self.assertNumQueries(3):
+            self.client.get('/api/users/subscriptions/?recipes_limit=2')
+        for author in self.authors[1:]:
+            Follow.objects.create(user=self.reader, following=author)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=2'
+            )
+        for author in response.data['results']:
+            recipes = Recipe.objects.filter(author_id=author['id'])
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], recipes.count())
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.values_list('id', flat=True)[:2])
+            )
+
+    def test_subscribe_returns_full_recipes_count(self):
+        author = self.authors[2]
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data['recipes_count'], 4)
+        self.assertEqual(len(response.data['recipes']), 1)
+        self.assertTrue(response.data['is_subscribed'])
+
+
+class RecipeFeedTestCase(TestCase):
+    URL = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(username='reader', email='r@r.com')
+        cls.authors = [
+            User.objects.create(username=f'a{index}', email=f'{index}@a.com')
+            for index in range(3)
+        ]
+        for index in range(9):
+            Recipe.objects.create(
+                author=cls.authors[index % 3], name=f'recipe {index}',
+                text='text', cooking_time=1
+            )
+        cls.tag = Tag.objects.create(name='tag', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        for author in self.authors[:2]:
+            Follow.objects.create(user=self.reader, following=author)
+
+    def expected(self):
+        return list(Recipe.objects.filter(
+            author__in=self.authors[:2]
+        ).values_list('id', flat=True))
+
+    def walk(self, strategy):
+        ids = []
+        url = f'{self.URL}?limit=2&strategy={strategy}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_strategies_return_the_same_feed(self):
+        self.assertEqual(self.walk('read'), self.expected())
+        self.assertEqual(self.walk('write'), self.expected())
+        response = self.client.get(self.URL, {'strategy': 'push'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_new_recipe_is_fanned_out(self):
+        author = APIClient()
+        author.force_authenticate(self.authors[0])
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            response = author.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                'tags': [self.tag.id],
+                'image': benchmark.BENCHMARK_IMAGE,
+                'name': 'new', 'text': 'text', 'cooking_time': 5,
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        recipe = Recipe.objects.get(name='new')
+        self.assertTrue(
+            self.reader.feed_entries.filter(recipe=recipe).exists()
+        )
+        self.assertEqual(self.walk('write')[0], recipe.id)
+
+    def test_unfollow_and_fan_out_cap(self):
+        Follow.objects.filter(following=self.authors[1]).delete()
+        self.assertFalse(
+            self.reader.feed_entries.filter(author=self.authors[1]).exists()
+        )
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=1):
+            other = User.objects.create(username='other', email='o@o.com')
+            Follow.objects.create(user=other, following=self.authors[2])
+            Follow.objects.create(user=self.reader, following=self.authors[2])
+            self.assertFalse(self.reader.feed_entries.filter(
+                author=self.authors[2]
+            ).exists())
+            self.assertEqual(self.walk('write'), list(
+                Recipe.objects.filter(
+                    author__in=(self.authors[0], self.authors[2])
+                ).values_list('id', flat=True)
+            ))
+
+
+class ImageDerivativesTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media.name, RECIPE_IMAGE_PROCESSING='sync'
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create(username='cook', email='c@c.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name='tag', color='#000000', slug='tag')
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                'tags': [self.tag.id],
+                'image': benchmark.BENCHMARK_IMAGE,
+                'name': 'recipe', 'text': 'text', 'cooking_time': 5,
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def test_derivatives_are_built_after_save(self):
+        recipe = self.create_recipe()
+        self.assertTrue(
+            {'thumbnail', 'medium'} <= set(recipe.image_derivatives)
+        )
+        images = self.client.get(f'/api/recipes/{recipe.id}/').data['images']
+        self.assertTrue(images['thumbnail'].endswith('thumbnail.jpg'))
+        self.assertTrue(images['original'].endswith(recipe.image.name))
+
+    def test_original_is_used_until_backfill(self):
+        recipe = self.create_recipe()
+        Recipe.objects.update(image_derivatives={})
+        images = self.client.get(f'/api/recipes/{recipe.id}/').data['images']
+        self.assertEqual(images['thumbnail'], images['original'])
+        call_command(
+            'generate_image_derivatives', workers=1, stdout=io.StringIO()
+        )
+        recipe.refresh_from_db()
+        self.assertIn('thumbnail', recipe.image_derivatives)
+
+    def test_queue_mode_builds_derivatives_in_worker(self):
+        with override_settings(RECIPE_IMAGE_PROCESSING='queue'):
+            recipe = self.create_recipe()
+        self.assertEqual(recipe.image_derivatives, {})
+        job = Job.objects.get(name='recipe-images')
+        self.assertEqual(job.payload, {'recipe_id': recipe.id})
+        self.assertEqual(worker.drain(), 1)
+        recipe.refresh_from_db()
+        self.assertIn('thumbnail', recipe.image_derivatives)
+
+
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        timing.registry.reset()
+        self.staff = User.objects.create(
+            username='staff', email='staff@test.com', is_staff=True
+        )
+        self.user = User.objects.create(
+            username='user', email='user@test.com'
+        )
+        Recipe.objects.create(
+            author=self.user, name='test', text='test', cooking_time=2
+        )
+        self.client = APIClient()
+
+    def get(self, user, path='/api/recipes/'):
+        self.client.force_authenticate(user)
+        return self.client.get(path)
+
+    @override_settings(SERVER_TIMING='staff')
+    def test_header_is_shown_to_staff_only(self):
+        header = self.get(self.staff)['Server-Timing']
+        metrics = dict(
+            entry.split(';')[0:2] for entry in header.split(', ')
+        )
+        self.assertEqual(
+            list(metrics), ['db', 'serialize', 'render', 'total']
+        )
+        self.assertIn('queries"', header)
+        self.assertNotIn('Server-Timing', self.get(self.user))
+        self.assertNotIn('Server-Timing', self.get(None))
+
+    @override_settings(SERVER_TIMING='all')
+    def test_histograms_are_keyed_by_route(self):
+        self.get(self.user)
+        self.get(self.user)
+        self.get(self.user, f'/api/users/{self.user.id}/')
+        snapshot = timing.registry.snapshot()
+        self.assertEqual(snapshot['recipe-list']['total']['count'], 2)
+        self.assertEqual(snapshot['users:user-detail']['queries']['count'], 1)
+        self.assertEqual(
+            snapshot['recipe-list']['queries']['buckets'][-1][1], 2
+        )
+        self.assertIn('serialize', snapshot['users:user-detail'])
+
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.get(self.staff))
+        self.assertEqual(timing.registry.snapshot(), {})
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            METRICS_DIR=directory.name, METRICS_TOKEN='secret'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(
+            username='user', email='user@test.com'
+        )
+        Tag.objects.create(name='test', color='#000000', slug='slug')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        response = self.client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_requests_are_counted_by_route(self):
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/0/')
+        self.client.get('/api/tags/')
+        self.client.get('/api/recipes/download_shopping_cart/')
+        text = self.scrape()
+        self.assertIn(
+            'foodgram_http_requests_total{route="recipe-list",method="GET",'
+            'status="200"} 2', text
+        )
+        self.assertIn('route="recipe-detail",method="GET",status="404"', text)
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_bucket{route='
+            '"recipe-list",method="GET",le="+Inf"} 2', text
+        )
+        self.assertIn(
+            'foodgram_db_queries_per_request_count{route="recipe-list"} 2',
+            text
+        )
+        self.assertIn(
+            'foodgram_cache_requests_total{cache="reference:tags",'
+            'result="miss"} 1', text
+        )
+        self.assertIn(
+            'foodgram_shopping_list_downloads_total{format="txt",'
+            'result="sent"} 1', text
+        )
+
+    def test_processes_are_summed(self):
+        metrics.image_uploads.inc()
+        process = multiprocessing.get_context('fork').Process(
+            target=metrics.image_uploads.inc, args=(2,)
+        )
+        process.start()
+        process.join()
+        self.assertIn('foodgram_image_uploads_total 3\n', self.scrape())
+
+    def test_token_is_required(self):
+        self.assertEqual(
+            self.client.get('/api/metrics').status_code,
+            HTTPStatus.FORBIDDEN
+        )
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(
+                '/api/metrics', HTTP_AUTHORIZATION='Bearer '
+            ).status_code, HTTPStatus.FORBIDDEN)
+
+
+class RecipeSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user', email='u@test.com')
+        self.tag = Tag.objects.create(
+            name='Суп', color='#000000', slug='soup'
+        )
+        self.in_name = self.create('Суп из палтуса', 'Сварить бульон')
+        self.in_text = self.create('Рыбный пирог', 'Запечь кусок палтуса')
+        self.other = self.create('Борщ', 'Свёкла и капуста')
+        self.in_name.tags.add(self.tag)
+        self.client = APIClient()
+
+    def create(self, name, text):
+        return Recipe.objects.create(
+            author=self.user, name=name, text=text, cooking_time=10
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(
+            self.search('Палтус'), [self.in_name.id, self.in_text.id]
+        )
+        self.assertEqual(self.search('свекла'), [self.other.id])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(
+            self.search('палтус', tags='soup'), [self.in_name.id]
+        )
+        self.assertEqual(
+            self.search('палтус', cursor='', limit=1), [self.in_text.id]
+        )
+
+    def test_index_follows_changes(self):
+        self.other.name = 'Уха из палтуса'
+        self.other.save()
+        self.in_text.delete()
+        self.assertEqual(
+            set(self.search('палтус')), {self.in_name.id, self.other.id}
+        )
+
+    def test_reindex(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM foodgram_recipe_search')
+        self.assertEqual(self.search('палтус'), [])
+        out = io.StringIO()
+        call_command('reindex_recipes', batch_size=2, stdout=out)
+        self.assertIn('Reindexed 3 recipes', out.getvalue())
+        self.assertEqual(len(self.search('палтус')), 2)
+
+
+class CookTestCase(TestCase):
+    def setUp(self):
+        cook.shared.reset()
+        self.user = User.objects.create(username='user', email='u@test.com')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)
+        ]
+        self.full = self.create(0, 1)
+        self.most = self.create(0, 1, 2, 3)
+        self.half = self.create(0, 4)
+        self.client = APIClient()
+
+    def create(self, *numbers):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание', cooking_time=10
+        )
+        for number in numbers:
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredients[number], amount=1
+            )
+        return recipe
+
+    def cook(self, *numbers, **params):
+        response = self.client.get('/api/recipes/cook/', {
+            'ingredients': ','.join(
+                str(self.ingredients[number].id) for number in numbers
+            ),
+            **params
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            (recipe['id'], recipe['matched_ingredients'],
+             recipe['missing_ingredients'])
+            for recipe in response.data['results']
+        ]
+
+    def test_ranks_by_coverage_then_missing(self):
+        self.assertEqual(self.cook(0, 1, 2), [
+            (self.full.id, 2, 0), (self.most.id, 3, 1), (self.half.id, 1, 1)
+        ])
+        self.assertEqual(self.cook(0, 1, 2, limit=1), [(self.full.id, 2, 0)])
+        self.assertEqual(self.cook(3), [(self.most.id, 1, 3)])
+
+    def test_index_follows_changes(self):
+        self.cook(0)
+        index = cook.shared.index
+        with self.captureOnCommitCallbacks(execute=True):
+            added = self.create(4)
+            IngredientRecipe.objects.filter(
+                recipe=self.most, ingredient__in=self.ingredients[2:]
+            ).delete()
+            self.most.save()
+            self.full.delete()
+        self.assertEqual(self.cook(0, 1, 4), [
+            (self.half.id, 2, 0), (self.most.id, 2, 0), (added.id, 1, 0)
+        ])
+        self.assertIs(cook.shared.index, index)
+
+    def test_publish_skips_a_claimed_version(self):
+        self.cook(0)
+        version = cook.current_version()
+        # Another writer got the same number from incr() and went first.
+        cache.add(cook.CHANGE_KEY.format(version + 1), self.full.id)
+        cook.publish(self.half.id)
+        self.assertEqual(cook.current_version(), version + 2)
+        self.assertEqual(
+            cache.get(cook.CHANGE_KEY.format(version + 1)), self.full.id
+        )
+        self.assertEqual(
+            cache.get(cook.CHANGE_KEY.format(version + 2)), self.half.id
+        )
+
+    def test_lost_version_rebuilds(self):
+        self.cook(0)
+        index = cook.shared.index
+        cache.delete(cook.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            added = self.create(4)
+        self.assertIn((added.id, 1, 0), self.cook(4))
+        self.assertIsNot(cook.shared.index, index)
+        index = cook.shared.index
+        with override_settings(COOK_INDEX_MAX_AGE=0):
+            self.cook(4)
+        self.assertIsNot(cook.shared.index, index)
+
+    def test_invalid_query(self):
+        for params in ({}, {'ingredients': 'соль'}, {'ingredients': '1',
+                                                     'limit': 0}):
+            response = self.client.get('/api/recipes/cook/', params)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_matches_brute_force(self):
+        rnd = random.Random(1)
+        recipes = {
+            recipe_id: rnd.sample(range(1, 40), rnd.randint(1, 8))
+            for recipe_id in range(1, 300)
+        }
+        index = cook.CookIndex(
+            [(recipe_id, ingredient_id)
+             for recipe_id, ingredient_ids in recipes.items()
+             for ingredient_id in ingredient_ids],
+            dense_share=4
+        )
+        for recipe_id in range(1, 300, 7):
+            recipes[recipe_id] = rnd.sample(range(1, 40), rnd.randint(1, 12))
+            index.update(recipe_id, recipes[recipe_id])
+        query = set(rnd.sample(range(1, 40), 10))
+        expected = sorted(
+            (-len(query & set(items)) / len(items),
+             len(items) - len(query & set(items)),
+             -len(query & set(items)), -recipe_id)
+            for recipe_id, items in recipes.items() if query & set(items)
+        )[:20]
+        self.assertEqual(index.match(query, 20), [
+            (-recipe_id, -matched, missing)
+            for _, missing, matched, recipe_id in expected
+        ])
+
+
+class RecommendationsTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@test.com')
+            for number in range(4)
+        ]
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.users[0], name=f'Рецепт {number}', text='Текст',
+                cooking_time=10
+            )
+            for number in range(5)
+        ]
+        for user, numbers in zip(
+            self.users, ((0, 1, 2), (0, 1), (0, 1, 3), (2, 3))
+        ):
+            for number in numbers:
+                Favorite.objects.create(user=user, recipe=self.recipes[number])
+        self.client = APIClient()
+
+    def ids(self, *numbers):
+        return [self.recipes[number].id for number in numbers]
+
+    def neighbours(self):
+        return list(RecipeNeighbour.objects.order_by(
+            'recipe_id', 'neighbour_id'
+        ).values_list('recipe_id', 'neighbour_id', 'score'))
+
+    def test_similar(self):
+        out = io.StringIO()
+        call_command('build_recommendations', min_common=1, stdout=out)
+        self.assertIn('Stored 12 neighbours for 4 recipes', out.getvalue())
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[0].id}/similar/'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.ids(1, 2, 3)
+        )
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[0].id}/similar/', {'limit': 1}
+        )
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_chunks_give_the_same_result(self):
+        recommendations.build(min_common=1, max_pairs=1)
+        chunked = self.neighbours()
+        recommendations.build(min_common=1)
+        self.assertEqual(chunked, self.neighbours())
+        recommendations.build(size=1)
+        self.assertEqual(
+            [row[:2] for row in self.neighbours()],
+            [tuple(self.ids(0, 1)), tuple(self.ids(1, 0))]
+        )
+
+    def test_recommended_skips_favorites(self):
+        recommendations.build(min_common=1)
+        self.client.force_authenticate(self.users[1])
+        response = self.client.get('/api/recipes/recommended/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            self.ids(2, 3)
+        )
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/recommended/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media.name, RECIPE_IMAGE_PROCESSING='off'
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create(username='cook', email='c@c.com')
+        self.tags = [
+            Tag.objects.create(name=f'tag{number}', color='#000000',
+                               slug=f'tag{number}')
+            for number in range(2)
+        ]
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.author = APIClient()
+        self.author.force_authenticate(self.user)
+        self.recipe = self.write('post', '/api/recipes/', self.tags[0])
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def write(self, method, path, tag):
+        response = getattr(self.author, method)(path, {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            'tags': [tag.id], 'image': benchmark.BENCHMARK_IMAGE,
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+        }, format='json')
+        self.assertIn(response.status_code, (HTTPStatus.OK,
+                                             HTTPStatus.CREATED))
+        return response.data['id']
+
+    def cached(self, path, params=None):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.get('X-Cache')
+
+    def test_repeated_requests_skip_the_view(self):
+        self.assertEqual(self.cached('/api/recipes/'), 'MISS')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cached('/api/recipes/'), 'HIT')
+        self.assertEqual(
+            self.cached('/api/recipes/', {'limit': 6, 'page': 1}), 'MISS'
+        )
+        self.assertEqual(
+            self.cached('/api/recipes/', {'page': 1, 'limit': 6}), 'HIT'
+        )
+        self.assertIsNone(self.cached('/api/recipes/', {'search': 'рецепт'}))
+        self.assertIsNone(self.author.get('/api/recipes/').get('X-Cache'))
+
+    def test_author_rename_refreshes_detail(self):
+        detail = f'/api/recipes/{self.recipe}/'
+        self.cached(detail)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cached(detail), 'HIT')
+        self.user.username = 'chef'
+        self.user.save()
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['author']['username'], 'chef')
+
+    def test_login_keeps_the_cache(self):
+        self.cached('/api/recipes/')
+        self.user.set_password('secret-password')
+        self.user.save(update_fields=['password'])
+        update_last_login(None, self.user)
+        self.assertEqual(self.cached('/api/recipes/'), 'HIT')
+        self.user.first_name = 'Повар'
+        self.user.save(update_fields=['first_name'])
+        self.assertEqual(self.cached('/api/recipes/'), 'MISS')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': response_cache.PROCESS_LOCAL}
+    })
+    def test_process_local_backend_is_bypassed(self):
+        self.assertIsNone(self.cached('/api/recipes/'))
+        self.assertIsNone(self.cached('/api/recipes/'))
+
+    def test_writes_invalidate_their_scopes(self):
+        detail = f'/api/recipes/{self.recipe}/'
+        for path, params in ((detail, None), ('/api/recipes/', None),
+                             ('/api/recipes/', {'tags': 'tag0'}),
+                             ('/api/recipes/', {'tags': 'tag1'})):
+            self.cached(path, params)
+        other = User.objects.create(username='other', email='o@o.com')
+        Recipe.objects.create(
+            author=other, name='Чужой', text='Текст', cooking_time=5
+        )
+        self.assertEqual(self.cached(detail), 'HIT')
+        self.assertEqual(self.cached('/api/recipes/'), 'MISS')
+        self.assertEqual(self.cached('/api/recipes/', {'tags': 'tag1'}), 'HIT')
+        self.write('patch', detail, self.tags[1])
+        self.assertEqual(self.cached(detail), 'MISS')
+        self.assertEqual(self.cached('/api/recipes/', {'tags': 'tag0'}),
+                         'MISS')
+        self.assertEqual(self.cached('/api/recipes/', {'tags': 'tag1'}),
+                         'MISS')
+        self.ingredient.name = 'морская соль'
+        self.ingredient.save()
+        response = self.client.get(detail)
+        self.assertEqual(response.get('X-Cache'), 'MISS')
+        self.assertEqual(
+            response.data['ingredients'][0]['name'], 'морская соль'
+        )
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader', email='r@r.com')
+        self.author = User.objects.create(username='author', email='a@a.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=5
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, path, response):
+        return self.client.get(
+            path, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code
+
+    def assertNotModified(self, path, response, queries):
+        with self.assertNumQueries(queries):
+            self.assertEqual(
+                self.revalidate(path, response), HTTPStatus.NOT_MODIFIED
+            )
+
+    def test_recipe_detail(self):
+        path = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.get(path)
+        self.assertNotIn('Last-Modified', response)
+        self.assertNotModified(path, response, 1)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.revalidate(path, response), HTTPStatus.OK)
+        response = self.client.get(path)
+        self.recipe.name = 'Борщ'
+        self.recipe.save()
+        self.assertEqual(self.revalidate(path, response), HTTPStatus.OK)
+
+    def test_recipe_list(self):
+        response = self.client.get('/api/recipes/', {'limit': 1})
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(
+                '/api/recipes/', {'limit': 1},
+                HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code, HTTPStatus.NOT_MODIFIED)
+        Recipe.objects.create(
+            author=self.author, name='Борщ', text='Текст', cooking_time=5
+        )
+        self.assertEqual(self.client.get(
+            '/api/recipes/', {'limit': 1},
+            HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, HTTPStatus.OK)
+
+    def test_anonymous_last_modified(self):
+        path = f'/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(None)
+        response = self.client.get(path)
+        self.assertEqual(self.client.get(
+            path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        ).status_code, HTTPStatus.NOT_MODIFIED)
+        # The anonymous response cache answers revalidation by itself.
+        self.assertNotModified(path, response, 0)
+
+    def test_users(self):
+        response = self.client.get('/api/users/me/')
+        self.assertNotModified('/api/users/me/', response, 0)
+        path = f'/api/users/{self.author.id}/'
+        response = self.client.get(path)
+        self.assertNotModified(path, response, 2)
+        Follow.objects.create(user=self.user, following=self.author)
+        self.assertEqual(self.revalidate(path, response), HTTPStatus.OK)
+
+
+class SparseFieldsetsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader', email='r@r.com')
+        self.author = User.objects.create(username='author', email='a@a.com')
+        self.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Текст', cooking_time=5
+        )
+        self.recipe.tags.add(self.tag)
+        IngredientRecipe.objects.create(
+            recipe=self.recipe, amount=1, ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'
+            )
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields(self):
+        path = f'/api/recipes/{self.recipe.id}/'
+        with self.assertNumQueries(1):
+            response = self.client.get(path, {'fields': 'name'})
+        self.assertEqual(
+            response.json(), {'id': self.recipe.id, 'name': 'Суп'}
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/recipes/', {'fields': 'name,cooking_time'}
+            )
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'name', 'cooking_time'}
+        )
+
+    def test_omit(self):
+        full = self.client.get('/api/recipes/').json()['results'][0]
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/recipes/', {'omit': 'ingredients,author,text'}
+            )
+        recipe = response.json()['results'][0]
+        self.assertEqual(
+            set(full) - set(recipe), {'ingredients', 'author', 'text'}
+        )
+        self.assertEqual(recipe['tags'], full['tags'])
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/recipes/', {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('secret', response.json()['fields'])
+
+    def test_cached_per_field_set(self):
+        self.client.force_authenticate(None)
+        path = f'/api/recipes/{self.recipe.id}/'
+        full = self.client.get(path).json()
+        self.assertEqual(
+            self.client.get(path, {'fields': 'name'}).json(),
+            {'id': self.recipe.id, 'name': 'Суп'}
+        )
+        self.assertEqual(self.client.get(path).json(), full)
+
+    def test_favorite_response(self):
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(
+            set(response.json()),
+            {'id', 'name', 'image', 'images', 'cooking_time'}
+        )
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from foodgram.views import (DownloadShoppingCartView, FavoriteApiView,
-                            IngredientViewSet, RecipeViewSet,
-                            ShoppingCartAPIView, TagViewSet)
+                            FavoriteBulkAPIView, IngredientViewSet,
+                            RecipeViewSet, ShoppingCartAPIView,
+                            ShoppingCartBulkAPIView, TagViewSet)
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -11,9 +12,14 @@ router.register(r'recipes', RecipeViewSet)
 
 urlpatterns = [
     path('recipes/<int:recipe_id>/shopping_cart/',
-         ShoppingCartAPIView.as_view()),
-    path('recipes/<int:recipe_id>/favorite/', FavoriteApiView.as_view()),
+         ShoppingCartAPIView.as_view(), name='shopping-cart'),
+    path('recipes/<int:recipe_id>/favorite/', FavoriteApiView.as_view(),
+         name='favorite'),
+    path('recipes/shopping_cart/', ShoppingCartBulkAPIView.as_view(),
+         name='shopping-cart-bulk'),
+    path('recipes/favorite/', FavoriteBulkAPIView.as_view(),
+         name='favorite-bulk'),
     path('recipes/download_shopping_cart/',
-         DownloadShoppingCartView.as_view()),
+         DownloadShoppingCartView.as_view(), name='download-shopping-cart'),
     path('', include(router.urls)),
 ]
@@ -1,26 +1,36 @@
+import os
+
 from django.conf import settings
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
+from foodgram import (autocomplete, conditional, cook, feed, recipe_sets,
+                      recommendations, reference, response_cache,
+                      shopping_list)
 from foodgram.filters import IngredientFilter, RecipeFilter
-from foodgram.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                             ShoppingCart, Tag)
-from foodgram.serializers import (CreateRecipeSerializer, IngredientSerializer,
-                                  ShowRecipeSerializer, TagSerializer)
+from foodgram.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from foodgram.serializers import (CookQuerySerializer, CreateRecipeSerializer,
+                                  IngredientSerializer, RecipeIdsSerializer,
+                                  RecommendationQuerySerializer,
+                                  ShowRecipeSerializer, TagSerializer,
+                                  parse_field_list)
 from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from backend.pagination import LimitPageNumberPagination
+from backend import metrics
+from backend.pagination import KeysetPagination, LimitPageNumberPagination
 from backend.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
-
-SHOPPING_CART_CONTENT_TYPE = 'text/plain'
+from backend.timing import ServerTimingMixin
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
@@ -33,126 +43,338 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return CreateRecipeSerializer
         return ShowRecipeSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self.with_selected_fields(queryset)
+        return queryset
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({'request': self.request})
+        context.update({
+            'request': self.request,
+            'fields': parse_field_list(
+                self.request.query_params.get('fields')
+            ),
+            'omit': parse_field_list(self.request.query_params.get('omit')),
+        })
         return context
 
+    def get_recipe_fields(self):
+        return ShowRecipeSerializer.selected_fields(
+            self.get_serializer_context()
+        )
+
+    def with_selected_fields(self, queryset):
+        fields = self.get_recipe_fields()
+        return queryset.with_related(fields).with_user_flags(
+            self.request.user, fields
+        )
+
+    def list(self, request, *args, **kwargs):
+        return response_cache.recipe_list(
+            request, lambda: self.conditional_list(request, *args, **kwargs)
+        )
+
+    def conditional_list(self, request, *args, **kwargs):
+        if self.paginator.cursor_query_param in request.query_params:
+            return super().list(request, *args, **kwargs)
+        user, fields = request.user, self.get_recipe_fields()
+        if conditional.requested(request):
+            # The page is read as bare values: a client holding the current
+            # page gets a 304 without recipes being loaded or serialized.
+            states = self.paginator.paginate_queryset(
+                self.filter_queryset(
+                    Recipe.objects.with_user_flags(user, fields)
+                ).values_list(*conditional.recipe_fields(user, fields)),
+                request, self
+            )
+            response = conditional.recipe_validators(
+                states, user, fields, (self.paginator.page.paginator.count,)
+            ).not_modified(request)
+            if response is not None:
+                return response
+        response = super().list(request, *args, **kwargs)
+        page = self.paginator.page
+        return conditional.recipe_validators(
+            [conditional.recipe_state(recipe, user, fields)
+             for recipe in page.object_list],
+            user, fields, (page.paginator.count,)
+        ).apply(response)
+
+    def retrieve(self, request, *args, **kwargs):
+        return response_cache.recipe_detail(
+            request, kwargs[self.lookup_field],
+            lambda: self.conditional_retrieve(request)
+        )
+
+    def conditional_retrieve(self, request):
+        user, fields = request.user, self.get_recipe_fields()
+        pk = str(self.kwargs[self.lookup_field])
+        if conditional.requested(request) and pk.isdigit():
+            state = self.filter_queryset(
+                Recipe.objects.with_user_flags(user, fields)
+            ).filter(pk=pk).values_list(
+                *conditional.recipe_fields(user, fields)
+            ).first()
+            if state is not None:
+                response = conditional.recipe_validators(
+                    [state], user, fields
+                ).not_modified(request)
+                if response is not None:
+                    return response
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        return conditional.recipe_validators(
+            [conditional.recipe_state(instance, user, fields)], user, fields
+        ).apply(response)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        strategy = request.query_params.get(
+            'strategy', settings.RECIPE_FEED_STRATEGY
+        )
+        if strategy not in feed.STRATEGIES:
+            return Response(
+                {'error': 'Доступные стратегии: '
+                 + ', '.join(feed.STRATEGIES)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipes = self.with_selected_fields(Recipe.objects.all())
+
+        def fetch(cursor, size):
+            ids = feed.recipe_ids(request.user, strategy, cursor, size)
+            by_id = recipes.in_bulk(ids)
+            return [by_id[pk] for pk in ids if pk in by_id]
+
+        paginator = KeysetPagination(
+            ('-pub_date', '-id'),
+            self.paginator.get_page_size(request)
+        )
+        page = paginator.paginate_forward(Recipe, request, fetch)
+        serializer = ShowRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_recipes(self, recipe_ids):
+        by_id = self.with_selected_fields(Recipe.objects.all()).in_bulk(
+            recipe_ids
+        )
+        recipes = [by_id[pk] for pk in recipe_ids if pk in by_id]
+        return ShowRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        ).data
+
+    @action(detail=False)
+    def cook(self, request):
+        query = CookQuerySerializer(data={
+            'ingredients': [
+                value for values in request.query_params.getlist(
+                    'ingredients'
+                ) for value in values.split(',') if value
+            ],
+            'limit': request.query_params.get('limit', settings.COOK_LIMIT),
+        })
+        query.is_valid(raise_exception=True)
+        matches = {
+            recipe_id: (matched, missing)
+            for recipe_id, matched, missing in cook.match(
+                query.validated_data['ingredients'],
+                query.validated_data['limit']
+            )
+        }
+        results = self.get_recipes(list(matches))
+        for data in results:
+            matched, missing = matches[data['id']]
+            data.update(
+                matched_ingredients=matched, missing_ingredients=missing,
+                coverage=round(matched / (matched + missing), 4)
+            )
+        return Response({'results': results})
+
+    def get_recommendation_limit(self, request):
+        query = RecommendationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return query.validated_data['limit']
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        return Response({'results': self.get_recipes(recommendations.similar(
+            recipe.id, self.get_recommendation_limit(request)
+        ))})
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def recommended(self, request):
+        return Response({'results': self.get_recipes(
+            recommendations.recommended(
+                request.user, self.get_recommendation_limit(request)
+            )
+        )})
+
+
+class ReferenceDataMixin:
+    reference = None
 
-class TagViewSet(viewsets.ModelViewSet):
+    def get_cached_list(self, request):
+        return self.reference.get('list')
+
+    def list(self, request, *args, **kwargs):
+        data = self.get_cached_list(request)
+        if data is None:
+            return super().list(request, *args, **kwargs)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        item = self.reference.get('by_id').get(pk)
+        if item is None:
+            raise Http404
+        return Response(item)
+
+
+class TagViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference = reference.tags
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    reference = reference.ingredients
 
+    def get_cached_list(self, request):
+        name = request.query_params.get('name')
+        if not name:
+            return super().get_cached_list(request)
+        if settings.INGREDIENT_AUTOCOMPLETE_BACKEND != 'memory':
+            return None
+        by_id = self.reference.get('by_id')
+        return [
+            by_id[pk] for pk in autocomplete.search_ids(name) if pk in by_id
+        ]
 
-class ShoppingCartAPIView(APIView):
-    permission_classes = (permissions.IsAuthenticated,)
-
-    def post(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {'error': 'Рецепт уже в корзине'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        ShoppingCart.objects.create(user=user, recipe=recipe)
 
-        serializer = ShowRecipeSerializer(recipe, context={
-            'request': request,
-            'hide_fields': [
-                'tags', 'author', 'ingredients',
-                'is_favorited', 'is_in_shopping_cart', 'text'
-            ]
-        })
+class IgnoreFormatNegotiation(BaseContentNegotiation):
+    # The format query parameter selects a shopping list renderer, so DRF
+    # must not treat it as a URL format override.
+    def select_parser(self, request, parsers):
+        return parsers[0]
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        shopping_cart_item = get_object_or_404(
-            ShoppingCart, user=user, recipe=recipe
-        )
-
-        shopping_cart_item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
 
 
 class DownloadShoppingCartView(APIView):
     permission_classes = (IsAuthenticated,)
+    content_negotiation_class = IgnoreFormatNegotiation
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        shopping_cart_items = ShoppingCart.objects.filter(user=user)
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__in=shopping_cart_items.values('recipe')
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
+        renderers = shopping_list.get_renderers()
+        renderer = renderers.get(
+            request.query_params.get('format', 'txt')
         )
-
-        shopping_list = []
-        for ingredient in ingredients:
-            line = (
-                f"{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) — "
-                f"{ingredient['total_amount']}"
+        if renderer is None:
+            return Response(
+                {'error': 'Доступные форматы: ' + ', '.join(renderers)},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            shopping_list.append(line)
 
-        response = HttpResponse(
-            '\n'.join(shopping_list),
-            content_type=SHOPPING_CART_CONTENT_TYPE
+        etag = quote_etag(
+            shopping_list.shopping_list_etag(request.user, renderer)
         )
-        response['Content-Disposition'] = (
-            f'attachment; filename="{settings.SHOPPING_CART_FILENAME}"'
+        response = get_conditional_response(request, etag=etag)
+        metrics.shopping_list_downloads.inc(
+            format=renderer.format,
+            result='sent' if response is None else 'not_modified'
         )
+        if response is None:
+            response = StreamingHttpResponse(
+                renderer.render(
+                    shopping_list.shopping_list_rows(request.user)
+                ),
+                content_type=renderer.content_type
+            )
+            filename = os.path.splitext(settings.SHOPPING_CART_FILENAME)[0]
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}.{renderer.extension}"'
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
         return response
 
 
-class FavoriteApiView(APIView):
+class RecipeSetAPIView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    model = None
+    exists_message = None
 
     def post(self, request, recipe_id):
-        user = request.user
         recipe = get_object_or_404(Recipe, id=recipe_id)
-
-        if Favorite.objects.filter(user=user, recipe=recipe).exists():
+        if not recipe_sets.add(self.model, request.user, [recipe.id]):
             return Response(
-                {'error': 'Рецепт уже в избранном'},
+                {'error': self.exists_message},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        Favorite.objects.create(user=user, recipe=recipe)
-
         serializer = ShowRecipeSerializer(recipe, context={
             'request': request,
-            'hide_fields': [
-                'tags', 'author', 'ingredients',
-                'is_favorited', 'is_in_shopping_cart', 'text'
-            ]
+            'fields': ('name', 'image', 'images', 'cooking_time'),
         })
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        shopping_cart_item = get_object_or_404(
-            Favorite, user=user, recipe=recipe
+        if not recipe_sets.remove(self.model, request.user, [recipe_id]):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RecipeSetBulkAPIView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    model = None
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def post(self, request):
+        added = recipe_sets.add(
+            self.model, request.user, self.get_recipe_ids(request)
         )
+        return Response({'added': added})
 
-        shopping_cart_item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def delete(self, request):
+        removed = recipe_sets.remove(
+            self.model, request.user, self.get_recipe_ids(request)
+        )
+        return Response({'removed': removed})
+
+
+class FavoriteApiView(RecipeSetAPIView):
+    model = Favorite
+    exists_message = 'Рецепт уже в избранном'
+
+
+class FavoriteBulkAPIView(RecipeSetBulkAPIView):
+    model = Favorite
+
+
+class ShoppingCartAPIView(RecipeSetAPIView):
+    model = ShoppingCart
+    exists_message = 'Рецепт уже в корзине'
+
+
+class ShoppingCartBulkAPIView(RecipeSetBulkAPIView):
+    model = ShoppingCart
@@ -0,0 +1,34 @@
+from django.contrib import admin
+from django.utils import timezone
+from jobs import queue
+from jobs.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'priority', 'attempts', 'run_at',
+        'started_at', 'finished_at', 'locked_by',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = (
+        'attempts', 'created_at', 'started_at', 'finished_at', 'locked_by',
+        'last_error',
+    )
+    actions = ('retry',)
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['queue_stats'] = queue.stats()
+        return super().changelist_view(request, extra_context)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+            locked_by='', finished_at=None
+        )
+        self.message_user(request, f'Задач возвращено в очередь: {updated}')
+
+
+admin.site.register(Job, JobAdmin)
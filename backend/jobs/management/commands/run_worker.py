@@ -0,0 +1,50 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from jobs import queue, worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Number of jobs executed in parallel'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--name', action='append', dest='names',
+            help='Only run jobs with this name, may be repeated'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run every due job and exit'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['names'] or ()) - set(queue.handlers)
+        if unknown:
+            raise CommandError(f'Unknown jobs: {", ".join(sorted(unknown))}')
+        if options['once']:
+            executed = worker.drain(options['names'])
+            self.stdout.write(self.style.SUCCESS(f'Executed {executed} jobs'))
+            return
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive')
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        self.stdout.write(
+            f'Running {options["concurrency"]} workers for '
+            f'{", ".join(options["names"] or sorted(queue.handlers))}'
+        )
+        worker.run(
+            options['concurrency'], options['names'],
+            options['poll_interval'], stop
+        )
+        self.stdout.write('Workers stopped')
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Имя зарегистрированного обработчика', max_length=100, verbose_name='Задача')),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Именованные аргументы обработчика', verbose_name='Параметры')),
+                ('priority', models.SmallIntegerField(default=0, help_text='Задачи с большим приоритетом выполняются раньше', verbose_name='Приоритет')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='Максимум попыток')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Время, раньше которого задача не будет взята в работу', verbose_name='Запустить после')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Время запуска')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Время завершения')),
+                ('locked_by', models.CharField(blank=True, help_text='Воркер, который выполняет задачу', max_length=100, verbose_name='Обработчик')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=100, verbose_name='Задача',
+        help_text='Имя зарегистрированного обработчика'
+    )
+    payload = models.JSONField(
+        default=dict, blank=True, verbose_name='Параметры',
+        help_text='Именованные аргументы обработчика'
+    )
+    priority = models.SmallIntegerField(
+        default=0, verbose_name='Приоритет',
+        help_text='Задачи с большим приоритетом выполняются раньше'
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=QUEUED,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=settings.JOB_MAX_ATTEMPTS, verbose_name='Максимум попыток'
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Запустить после',
+        help_text='Время, раньше которого задача не будет взята в работу'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Время создания'
+    )
+    started_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Время запуска'
+    )
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Время завершения'
+    )
+    locked_by = models.CharField(
+        max_length=100, blank=True, verbose_name='Обработчик',
+        help_text='Воркер, который выполняет задачу'
+    )
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+
+    class Meta:
+        ordering = ('-id',)
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = (
+            models.Index(
+                fields=('status', '-priority', 'run_at'),
+                name='job_claim_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
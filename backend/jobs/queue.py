@@ -0,0 +1,156 @@
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+from jobs.models import Job
+
+handlers = {}
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def task(name):
+    def decorator(handler):
+        handlers[name] = handler
+        return handler
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, delay=0, max_attempts=None):
+    if name not in handlers:
+        raise UnknownJob(name)
+    job = Job(
+        name=name, payload=payload or {}, priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay)
+    )
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def enqueue_on_commit(name, payload=None, priority=0, **kwargs):
+    # Handlers must not see a job before the data it refers to is visible,
+    # and a rolled back request must not leave a job behind.
+    if name not in handlers:
+        raise UnknownJob(name)
+    transaction.on_commit(
+        lambda: enqueue(name, payload, priority=priority, **kwargs)
+    )
+
+
+def claim(worker, limit=1, names=None):
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        if names:
+            jobs = jobs.filter(name__in=names)
+        jobs = jobs.order_by('-priority', 'run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        claimed = []
+        for job in jobs[:limit]:
+            # Without row locks (SQLite) the status check keeps two
+            # workers from taking the same job.
+            updated = Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+                status=Job.RUNNING, started_at=now, locked_by=worker,
+                attempts=F('attempts') + 1
+            )
+            if updated:
+                job.status, job.started_at, job.locked_by = (
+                    Job.RUNNING, now, worker
+                )
+                job.attempts += 1
+                claimed.append(job)
+    return claimed
+
+
+def retry_delay(attempts):
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY
+    )
+    return delay * random.uniform(0.8, 1.2)
+
+
+def execute(job):
+    try:
+        handler = handlers.get(job.name)
+        if handler is None:
+            raise UnknownJob(job.name)
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            Job.objects.filter(id=job.id).update(
+                status=Job.QUEUED, last_error=error, locked_by='',
+                run_at=now + timedelta(seconds=retry_delay(job.attempts))
+            )
+        else:
+            Job.objects.filter(id=job.id).update(
+                status=Job.FAILED, last_error=error, finished_at=now
+            )
+        return False
+    Job.objects.filter(id=job.id).update(
+        status=Job.DONE, finished_at=timezone.now()
+    )
+    return True
+
+
+def requeue_stale():
+    # Jobs of a worker that died mid-run go back to the queue; attempts
+    # were already counted when they were claimed.
+    deadline = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=deadline)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=timezone.now(),
+        last_error='Превышено время выполнения'
+    )
+    return failed + stale.update(status=Job.QUEUED, locked_by='')
+
+
+def stats(window=timedelta(hours=1)):
+    now = timezone.now()
+    depth = dict(
+        Job.objects.values('status').annotate(total=Count('id'))
+        .order_by().values_list('status', 'total')
+    )
+    queued = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    oldest = queued.aggregate(oldest=Min('run_at'))['oldest']
+    recent = Job.objects.filter(
+        status=Job.DONE, finished_at__gte=now - window
+    ).aggregate(
+        wait=Avg(F('started_at') - F('run_at')),
+        duration=Avg(F('finished_at') - F('started_at')),
+        total=Count('id'),
+    )
+    by_name = list(
+        Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING, Job.FAILED))
+        .values('name', 'status').annotate(total=Count('id'))
+        .order_by('name', 'status')
+    )
+    return {
+        'depth': {status: depth.get(status, 0) for status, _ in Job.STATUSES},
+        'ready': queued.count(),
+        'oldest_age': (now - oldest).total_seconds() if oldest else 0,
+        'done_recently': recent['total'],
+        'average_wait': seconds(recent['wait']),
+        'average_duration': seconds(recent['duration']),
+        'by_name': by_name,
+    }
+
+
+def seconds(value):
+    if value is None:
+        return 0
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    # SQLite returns the average of intervals in microseconds.
+    return value / 1_000_000
@@ -0,0 +1,102 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from jobs import queue, worker
+from jobs.models import Job
+
+User = get_user_model()
+
+calls = []
+
+
+@queue.task('test-record')
+def record(value):
+    calls.append(value)
+
+
+@queue.task('test-fail')
+def fail():
+    raise ValueError('boom')
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_priority_runs_first(self):
+        queue.enqueue('test-record', {'value': 'low'})
+        queue.enqueue('test-record', {'value': 'high'}, priority=10)
+        queue.enqueue('test-record', {'value': 'later'}, delay=60)
+        self.assertEqual(worker.drain(), 2)
+        self.assertEqual(calls, ['high', 'low'])
+        self.assertEqual(
+            Job.objects.filter(status=Job.QUEUED).get().payload,
+            {'value': 'later'}
+        )
+
+    def test_claimed_job_is_not_claimed_again(self):
+        queue.enqueue('test-record', {'value': 1})
+        self.assertEqual(len(queue.claim('first')), 1)
+        self.assertEqual(queue.claim('second'), [])
+
+    @override_settings(JOB_RETRY_DELAY=10)
+    def test_failed_job_is_retried_with_backoff(self):
+        job = queue.enqueue('test-fail', max_attempts=2)
+        worker.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=7))
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        worker.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_job_is_requeued(self):
+        job = queue.enqueue('test-record', {'value': 1})
+        queue.claim('lost')
+        Job.objects.filter(id=job.id).update(
+            started_at=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(queue.requeue_stale(), 1)
+        self.assertEqual(worker.drain(), 1)
+        self.assertEqual(calls, [1])
+
+    def test_enqueue_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            queue.enqueue_on_commit('test-record', {'value': 1})
+            self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Job.objects.get().name, 'test-record')
+        with self.assertRaises(queue.UnknownJob):
+            queue.enqueue_on_commit('missing')
+
+    def test_run_worker_once(self):
+        queue.enqueue('test-record', {'value': 1})
+        queue.enqueue('test-fail', max_attempts=1)
+        call_command(
+            'run_worker', once=True, names=['test-record'],
+            stdout=io.StringIO()
+        )
+        self.assertEqual(calls, [1])
+        self.assertTrue(Job.objects.filter(status=Job.QUEUED).exists())
+        with self.assertRaises(CommandError):
+            call_command('run_worker', once=True, names=['missing'])
+
+    def test_admin_shows_queue_stats(self):
+        queue.enqueue('test-record', {'value': 1})
+        worker.drain()
+        queue.enqueue('test-record', {'value': 2})
+        admin = User.objects.create_superuser('admin', 'a@a.com', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/jobs/job/')
+        self.assertEqual(response.status_code, 200)
+        stats = response.context['queue_stats']
+        self.assertEqual(stats['depth'][Job.QUEUED], 1)
+        self.assertEqual(stats['done_recently'], 1)
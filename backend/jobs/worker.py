@@ -0,0 +1,73 @@
+import logging
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from jobs import queue
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name(index):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def run_once(name, names=None, limit=1):
+    executed = 0
+    for job in queue.claim(name, limit=limit, names=names):
+        if not queue.execute(job):
+            logger.warning('Job %s failed on attempt %s',
+                           job.id, job.attempts)
+        executed += 1
+    return executed
+
+
+def loop(index, stop, names=None, poll_interval=None):
+    name = worker_name(index)
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    while not stop.is_set():
+        try:
+            executed = run_once(name, names)
+        except Exception:
+            # A lost database connection must not kill the worker thread.
+            logger.exception('Worker %s cannot claim jobs', name)
+            executed = 0
+        finally:
+            close_old_connections()
+        if not executed:
+            stop.wait(poll_interval)
+
+
+def run(concurrency=1, names=None, poll_interval=None, stop=None):
+    stop = stop or threading.Event()
+    threads = [
+        threading.Thread(
+            target=loop, args=(index, stop, names, poll_interval),
+            name=f'job-worker-{index}', daemon=True
+        )
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while not stop.is_set():
+            queue.requeue_stale()
+            close_old_connections()
+            stop.wait(settings.JOB_TIMEOUT / 10)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def drain(names=None):
+    # Runs every job that is due in the current thread, for tests and
+    # one-off maintenance.
+    total = 0
+    while True:
+        executed = run_once(worker_name('drain'), names, limit=100)
+        if not executed:
+            return total
+        total += executed
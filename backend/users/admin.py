@@ -1,15 +1,27 @@
 from django.contrib import admin
 from foodgram.models import Follow, User
+from users.serializers import get_user_stat
 
 
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = (
         'username', 'email', 'first_name', 'last_name',
-        'is_active', 'is_staff', 'is_superuser'
+        'is_active', 'is_staff', 'is_superuser',
+        'get_recipes_count', 'get_followers_count',
     )
+    list_select_related = ('stats',)
     list_filter = ('first_name', 'last_name', 'username', 'email',)
     search_fields = ('username', 'email', 'first_name', 'last_name')
 
+    def get_recipes_count(self, obj):
+        return get_user_stat(obj, 'recipes_count')
+
+    def get_followers_count(self, obj):
+        return get_user_stat(obj, 'followers_count')
+
+    get_recipes_count.short_description = 'Рецептов'
+    get_followers_count.short_description = 'Подписчиков'
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = (
@@ -13,6 +13,10 @@ INCORRECT_USERNAME_ERROR = (
 User = get_user_model()
 
 
+def get_user_stat(user, field):
+    return getattr(getattr(user, 'stats', None), field, 0)
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     email = serializers.EmailField(
         validators=(UniqueValidator(queryset=User.objects.all()),))
@@ -45,12 +49,14 @@ class CustomUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
-        if user.is_authenticated:
-            return Follow.objects.filter(user=user, following=obj).exists()
-        return False
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return Follow.objects.filter(user=user, following=obj).exists()
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return get_user_stat(obj, 'recipes_count')
 
     class Meta:
         model = User
@@ -107,6 +113,8 @@ class BasicUserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
-        if user.is_authenticated:
-            return Follow.objects.filter(user=user, following=obj).exists()
-        return False
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return Follow.objects.filter(user=user, following=obj).exists()
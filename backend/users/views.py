@@ -1,41 +1,61 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.views import UserViewSet
+from foodgram import conditional
 from foodgram.models import Follow, Recipe
 from foodgram.serializers import (SubscriptionUserSerializer,
-                                  UserRecipeSerializer)
+                                  parse_recipes_limit)
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from users.serializers import (BasicUserSerializer, CustomUserSerializer,
-                               FollowSerializer, UserListSerializer)
+from users.serializers import (BasicUserSerializer, FollowSerializer,
+                               UserListSerializer)
 
 from backend.pagination import LimitPageNumberPagination
+from backend.timing import ServerTimingMixin
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(ServerTimingMixin, UserViewSet):
     pagination_class = LimitPageNumberPagination
     permission_classes = (AllowAny,)
+    cursor_ordering = ('-id',)
 
     @action(detail=False, methods=('get',))
     def me(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         user = request.user
-        serializer = BasicUserSerializer(
-            user, context={'request': request}
-        )
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # The profile is already loaded with the token, nobody follows
+        # themselves.
+        validators = conditional.user_validators(user, False)
+        response = validators.not_modified(request)
+        if response is None:
+            serializer = BasicUserSerializer(
+                user, context={'request': request}
+            )
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+        return validators.apply(response)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = BasicUserSerializer(
-            instance, context={'request': request}
+        is_subscribed = request.user.is_authenticated and (
+            Follow.objects.filter(
+                user=request.user, following=instance
+            ).exists()
         )
-        return Response(serializer.data)
+        instance.is_subscribed = is_subscribed
+        validators = conditional.user_validators(instance, is_subscribed)
+        response = validators.not_modified(request)
+        if response is None:
+            serializer = BasicUserSerializer(
+                instance, context={'request': request}
+            )
+            response = Response(serializer.data)
+        return validators.apply(response)
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
@@ -53,24 +73,14 @@ class CustomUserViewSet(UserViewSet):
 
         serializer = FollowSerializer(data={'user': user, 'following': author})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
 
-        recipes_limit = int(request.query_params.get('recipes_limit', 0))
-        recipes_queryset = Recipe.objects.filter(
-            author=author
-        )[:recipes_limit] if recipes_limit > 0 else Recipe.objects.filter(
-            author=author
+        author = User.objects.select_related('stats').get(id=author.id)
+        return Response(
+            self.serialize_subscriptions([author], request, many=False),
+            status=status.HTTP_201_CREATED
         )
-        recipes_data = UserRecipeSerializer(recipes_queryset, many=True).data
-
-        user_data = CustomUserSerializer(
-            author, context={'request': request}
-        ).data
-        user_data['recipes'] = recipes_data
-        user_data['recipes_count'] = len(recipes_data)
-        user_data['is_subscribed'] = True
-
-        return Response(user_data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def del_subscribe(self, request, id=None):
@@ -85,26 +95,30 @@ class CustomUserViewSet(UserViewSet):
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         user = request.user
-        queryset = Follow.objects.filter(user=user).select_related('following')
+        queryset = Follow.objects.filter(user=user).select_related(
+            'following__stats'
+        ).order_by('-id')
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(queryset, request)
-        recipes_limit = request.query_params.get('recipes_limit')
-        context = {
-            'request': request,
-            'use_custom_user_serializer': True,
-            'hide_fields': [
-                'author', 'is_favorited',
-                'is_in_shopping_cart', 'tags',
-                'ingredients', 'text'
-            ],
-            'recipes_limit': recipes_limit
-        }
+        page = paginator.paginate_queryset(queryset, request, self)
+        return paginator.get_paginated_response(self.serialize_subscriptions(
+            [follow.following for follow in page], request
+        ))
+
+    def serialize_subscriptions(self, authors, request, many=True):
+        # Every author here is followed by the current user, and their
+        # recipe previews are fetched for the whole page at once.
+        for author in authors:
+            author.is_subscribed = True
+        recipe_previews = Recipe.objects.latest_by_author(
+            [author.id for author in authors],
+            parse_recipes_limit(request.query_params.get('recipes_limit'))
+        )
         serializer = SubscriptionUserSerializer(
-            [follow.following for follow in page],
-            many=True,
-            context=context
+            authors if many else authors[0],
+            many=many,
+            context={'request': request, 'recipe_previews': recipe_previews}
         )
-        return paginator.get_paginated_response(serializer.data)
+        return serializer.data
 
 
 class UserListView(ListAPIView):